@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the FastGridInterpolator on a synthetic AHN tile. The
+arithmetic numba lookup (nearest and bilinear) is compared to the previous
+implementation, which used two binary searches (np.digitize) per point.
+
+Example
+-------
+python bench_grid_interpolation.py --sizes 10000000 50000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import numba
+
+import set_path  # noqa: F401
+import synthetic_tiles
+from src.utils.ahn_utils import load_ahn_tile
+from src.utils.interpolation import FastGridInterpolator
+
+DEFAULT_SIZES = [1000000, 10000000, 50000000]
+TILECODE = '2386_9702'
+
+
+def digitize_lookup(grid_x, grid_y, values, positions):
+    """The previous FastGridInterpolator, for reference."""
+    bin_x = grid_x - (grid_x[1] - grid_x[0]) / 2
+    bin_y = grid_y + (grid_y[0] - grid_y[1]) / 2
+    x_idx = np.digitize(positions[:, 0], bin_x) - 1
+    y_idx = np.digitize(positions[:, 1], bin_y, right=True) - 1
+    return values[y_idx, x_idx]
+
+
+def time_fn(fn, repeat):
+    """Return the median duration (in s) of fn() over a number of runs."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                description='Benchmark the FastGridInterpolator.')
+    parser.add_argument('--sizes', metavar='N', type=int, nargs='+',
+                        default=DEFAULT_SIZES,
+                        help='number of query points')
+    parser.add_argument('--repeat', metavar='N', type=int, default=3,
+                        help='number of runs per size')
+    parser.add_argument('--seed', metavar='N', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        paths = synthetic_tiles.generate_dataset(tmp_folder, [TILECODE],
+                                                 n_points=1000, seed=args.seed)
+        ahn_tile = load_ahn_tile(
+                    os.path.join(paths['ahn'], f'ahn_{TILECODE}.npz'))
+    grid_x, grid_y = ahn_tile['x'], ahn_tile['y']
+    values = ahn_tile['ground_surface']
+    nearest = FastGridInterpolator(grid_x, grid_y, values)
+    bilinear = FastGridInterpolator(grid_x, grid_y, values, method='bilinear')
+    # Compile the numba kernels.
+    nearest(np.zeros((1, 2)))
+    bilinear(np.zeros((1, 2)))
+
+    rng = np.random.default_rng(args.seed)
+    print(f'Numba threads: {numba.get_num_threads()}')
+    print(f"{'points':>10} {'digitize (s)':>13} {'nearest (s)':>12} "
+          + f"{'bilinear (s)':>13} {'speedup':>8}")
+    for n_points in args.sizes:
+        positions = np.column_stack(
+                        (rng.uniform(grid_x[0], grid_x[-1], n_points),
+                         rng.uniform(grid_y[-1], grid_y[0], n_points)))
+        assert np.array_equal(
+                    nearest(positions),
+                    digitize_lookup(grid_x, grid_y, values, positions),
+                    equal_nan=True)
+        t_digitize = time_fn(
+                    lambda: digitize_lookup(grid_x, grid_y, values, positions),
+                    args.repeat)
+        t_nearest = time_fn(lambda: nearest(positions), args.repeat)
+        t_bilinear = time_fn(lambda: bilinear(positions), args.repeat)
+        print(f'{n_points:>10} {t_digitize:>13.3f} {t_nearest:>12.3f} '
+              + f'{t_bilinear:>13.3f} {t_digitize / t_nearest:>8.1f}')
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of the neighbour search backends of the SpatialInterpolator
+on synthetic AHN tiles. For each point density, the construction and the
+k-nearest neighbour query of scipy's cKDTree are compared with the
+GridNeighbourIndex, using the grid and parameters of the AHN ground surface
+(0.1m grid over a 50m tile, 8 neighbours within 1m).
+
+Example
+-------
+python bench_neighbour_search.py --densities 8 12 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+import numba
+from scipy.spatial import cKDTree
+
+import set_path  # noqa: F401
+from src.utils.interpolation import GridNeighbourIndex
+
+DEFAULT_DENSITIES = [8, 12, 16, 20]
+TILE_SIZE = 50
+BUFFER = 1
+RESOLUTION = 0.1
+
+
+def time_fn(fn, repeat):
+    """Return the median duration (in s) of fn() over a number of runs."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                description='Benchmark the neighbour search backends.')
+    parser.add_argument('--densities', metavar='N', type=float, nargs='+',
+                        default=DEFAULT_DENSITIES,
+                        help='AHN point densities (in pts/m2)')
+    parser.add_argument('--n_neighbors', metavar='N', type=int, default=8)
+    parser.add_argument('--max_dist', metavar='float', type=float,
+                        default=1.)
+    parser.add_argument('--repeat', metavar='N', type=int, default=3,
+                        help='number of runs per density')
+    parser.add_argument('--seed', metavar='N', type=int, default=0)
+    args = parser.parse_args()
+
+    # The grid of a (buffered) AHN tile.
+    grid_y, grid_x = np.mgrid[TILE_SIZE - RESOLUTION/2:0:-RESOLUTION,
+                              RESOLUTION/2:TILE_SIZE:RESOLUTION]
+    positions = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+    # Compile the numba kernels.
+    GridNeighbourIndex(np.zeros((2, 2))).query(np.zeros((1, 2)), k=2)
+
+    rng = np.random.default_rng(args.seed)
+    query_args = {'k': args.n_neighbors, 'distance_upper_bound': args.max_dist}
+    print(f'Numba threads: {numba.get_num_threads()}, '
+          + f'queries: {len(positions)}')
+    print(f"{'pts/m2':>7} {'points':>8} {'kdtree build':>13} "
+          + f"{'kdtree query':>13} {'grid build':>11} {'grid query':>11} "
+          + f"{'speedup':>8}")
+    for density in args.densities:
+        extent = TILE_SIZE + 2 * BUFFER
+        n_points = int(density * extent**2)
+        points = rng.uniform(-BUFFER, TILE_SIZE + BUFFER, (n_points, 2))
+
+        kdtree = cKDTree(points)
+        grid = GridNeighbourIndex(points)
+        d_kdtree, _ = kdtree.query(positions, **query_args)
+        d_grid, _ = grid.query(positions, **query_args)
+        assert np.allclose(d_kdtree, d_grid, rtol=0, atol=1e-9)
+
+        t_kd_build = time_fn(lambda: cKDTree(points), args.repeat)
+        t_kd_query = time_fn(lambda: kdtree.query(positions, **query_args),
+                             args.repeat)
+        t_grid_build = time_fn(lambda: GridNeighbourIndex(points),
+                               args.repeat)
+        t_grid_query = time_fn(lambda: grid.query(positions, **query_args),
+                               args.repeat)
+        speedup = (t_kd_build + t_kd_query) / (t_grid_build + t_grid_query)
+        print(f'{density:>7g} {n_points:>8} {t_kd_build:>13.3f} '
+              + f'{t_kd_query:>13.3f} {t_grid_build:>11.3f} '
+              + f'{t_grid_query:>11.3f} {speedup:>8.1f}')
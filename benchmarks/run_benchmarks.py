@@ -0,0 +1,194 @@
+"""
+End-to-end benchmark of the Pipeline on synthetic tiles. For each tile size a
+synthetic dataset is generated (if not already present), after which the full
+pipeline is run and the duration of each processor, the reading and writing
+of the tile, and the full Pipeline.process_file call are recorded. Results are
+stored as JSON, and can be compared to the results of another commit.
+
+Example
+-------
+python run_benchmarks.py --work_folder ../benchmark_data --out results.json
+python run_benchmarks.py --sizes 1000000 --compare results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import set_path  # noqa: F401
+import synthetic_tiles
+import src.fusion as fusion
+import src.region_growing as growing
+import src.utils.ahn_utils as ahn_utils
+import src.utils.log_utils as log_utils
+import src.utils.trace_utils as trace_utils
+from src.pipeline import Pipeline
+from src.utils.labels import Labels
+
+DEFAULT_SIZES = [1000000, 10000000, 50000000]
+TILECODE = '2386_9702'
+
+
+def get_git_commit():
+    """Return the current git commit, or None if not available."""
+    try:
+        return subprocess.check_output(
+                    ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                    cwd=os.path.dirname(os.path.abspath(__file__))
+                    ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_pipeline(paths, threads=1):
+    """Build the full processing pipeline for a synthetic dataset."""
+    ahn_reader = ahn_utils.NPZReader(paths['ahn'])
+    bgt_points = paths['bgt_points']
+    processors = [
+        fusion.AHNFuser(Labels.GROUND, paths['ahn'], ahn_reader,
+                        target='ground', epsilon=0.2),
+        fusion.NoiseFilter(Labels.NOISE, ahn_reader, min_component_size=5),
+        fusion.BGTBuildingFuser(Labels.BUILDING,
+                                bgt_file=paths['bgt_buildings'],
+                                building_offset=0.25, ahn_reader=ahn_reader),
+        fusion.CarFuser(Labels.CAR, ahn_reader,
+                        bgt_file=paths['bgt_roads']),
+        fusion.BGTPointFuser(Labels.TREE, bgt_type='boom',
+                             bgt_file=bgt_points, ahn_reader=ahn_reader),
+        fusion.BGTPointFuser(Labels.STREET_LIGHT, bgt_type='lichtmast',
+                             bgt_file=bgt_points, ahn_reader=ahn_reader),
+        fusion.BGTPointFuser(Labels.TRAFFIC_SIGN, bgt_type='verkeersbord',
+                             bgt_file=bgt_points, ahn_reader=ahn_reader),
+        growing.LayerLCC(Labels.BUILDING, ahn_reader,
+                         params=[{'bottom': 0.5}])]
+    return Pipeline(processors=processors, ahn_reader=ahn_reader,
+                    threads=threads)
+
+
+def run_size(n_points, work_folder, repeat=1, seed=0, threads=1):
+    """Run the benchmark for a single tile size."""
+    data_folder = pathlib.Path(work_folder) / f'n_{n_points}'
+    in_file = data_folder / 'pointcloud' / f'filtered_{TILECODE}.laz'
+    out_file = data_folder / 'output' / f'processed_{TILECODE}.laz'
+    if not in_file.is_file():
+        print(f'Generating synthetic tile with {n_points} points...')
+        start = time.perf_counter()
+        synthetic_tiles.generate_dataset(data_folder, [TILECODE], n_points,
+                                         seed=seed)
+        print(f'  done in {time.perf_counter() - start:.1f}s')
+    paths = {'ahn': data_folder / 'ahn',
+             'bgt_buildings': data_folder / 'bgt' / 'bgt_buildings.csv',
+             'bgt_roads': data_folder / 'bgt' / 'bgt_roads.csv',
+             'bgt_points': data_folder / 'bgt' / 'bgt_points.csv'}
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+
+    runs = []
+    for _ in range(repeat):
+        # A new pipeline for each run, such that AHN caches start empty.
+        pipeline = build_pipeline(paths, threads)
+        trace_utils.start_tracing()
+        start = time.perf_counter()
+        result = pipeline.process_file(str(in_file), str(out_file))
+        total = time.perf_counter() - start
+        trace_utils.stop_tracing()
+        runs.append((total, result, trace_utils.pop_events()))
+
+    # Report the median over all repeats.
+    stages = {}
+    for _, _, events in runs:
+        # Processors of the same class are numbered in order of execution.
+        seen = {}
+        for event in (ev for ev in events if ev['cat'] == 'tile'):
+            name = event['name']
+            if 'label' in event['args']:
+                seen[name] = seen.get(name, 0) + 1
+                name = f"{name}[{seen[name]}]"
+            stage = stages.setdefault(name, {'durations': []})
+            stage['durations'].append(event['dur'] / 1e6)
+            stage['n_points'] = int(event['args'].get('n_points', 0))
+            if 'n_labelled' in event['args']:
+                stage['n_labelled'] = int(event['args']['n_labelled'])
+    for stage in stages.values():
+        stage['duration_s'] = float(np.median(stage.pop('durations')))
+    return {'n_points': runs[0][1]['n_points'],
+            'pipeline_s': float(np.median([run[0] for run in runs])),
+            'repeat': repeat,
+            'stats': runs[0][1]['stats'],
+            'stages': stages}
+
+
+def compare(results, baseline):
+    """Print a comparison of two benchmark results."""
+    print(f"\nComparison with {baseline.get('commit')}:")
+    print(f"{'size':>10} {'stage':<28} {'base (s)':>10} {'new (s)':>10} "
+          + f"{'ratio':>7}")
+    for size, result in results['sizes'].items():
+        if size not in baseline['sizes']:
+            continue
+        base = baseline['sizes'][size]
+        rows = [('Pipeline', base['pipeline_s'], result['pipeline_s'])]
+        rows += [(name, base['stages'][name]['duration_s'],
+                  stage['duration_s'])
+                 for name, stage in result['stages'].items()
+                 if name in base['stages']]
+        for name, old, new in rows:
+            ratio = new / old if old > 0 else float('nan')
+            print(f'{size:>10} {name:<28} {old:>10.3f} {new:>10.3f} '
+                  + f'{ratio:>7.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                description='Benchmark the pipeline on synthetic tiles.')
+    parser.add_argument('--work_folder', metavar='path', type=str,
+                        default='../benchmark_data',
+                        help='folder for the synthetic datasets')
+    parser.add_argument('--sizes', metavar='N', type=int, nargs='+',
+                        default=DEFAULT_SIZES,
+                        help='tile sizes (number of points)')
+    parser.add_argument('--repeat', metavar='N', type=int, default=1,
+                        help='number of runs per size')
+    parser.add_argument('--seed', metavar='N', type=int, default=0)
+    parser.add_argument('--threads', metavar='N', type=int, default=1,
+                        help='number of threads for the pipeline')
+    parser.add_argument('--out', metavar='path', type=str,
+                        default='benchmark_results.json',
+                        help='output JSON file')
+    parser.add_argument('--compare', metavar='path', type=str,
+                        help='JSON file of a previous run to compare with')
+    args = parser.parse_args()
+
+    log_utils.reset_logger()
+    log_utils.add_console_logger(level=logging.WARNING)
+
+    results = {'commit': get_git_commit(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'platform': platform.platform(),
+               'python': sys.version.split()[0],
+               'numpy': np.__version__,
+               'threads': args.threads,
+               'sizes': {}}
+    for n_points in args.sizes:
+        print(f'Running benchmark for {n_points} points...')
+        result = run_size(n_points, args.work_folder, repeat=args.repeat,
+                          seed=args.seed, threads=args.threads)
+        results['sizes'][str(n_points)] = result
+        print(f"  Pipeline: {result['pipeline_s']:.2f}s")
+        for name, stage in result['stages'].items():
+            print(f"  {name:<28} {stage['duration_s']:.3f}s")
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.out}')
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
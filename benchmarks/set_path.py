@@ -0,0 +1,7 @@
+# Helper script to allow importing from parent folder.
+import sys
+import os
+
+module_path = os.path.abspath(os.path.join('..'))
+if module_path not in sys.path:
+    sys.path.append(module_path)
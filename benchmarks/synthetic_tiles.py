@@ -0,0 +1,331 @@
+"""
+Deterministic generator for synthetic urban point cloud tiles, together with
+matching AHN surfaces and BGT data. The generated data follows the same
+conventions as the demo dataset:
+
+ * `pointcloud/filtered_<tilecode>.laz`  CycloMedia-style point cloud tiles;
+ * `ahn/ahn_<tilecode>.npz`  pre-processed AHN ground and building surfaces;
+ * `bgt/bgt_buildings.csv`, `bgt/bgt_roads.csv`, `bgt/bgt_points.csv`  BGT
+   building footprints, road polygons and point objects.
+
+Each tile contains a street with building facades on both sides, parked
+cars, street lights, traffic signs and trees. The number of points is
+configurable, and the same seed always produces the same data.
+"""
+
+import numpy as np
+import os
+import pathlib
+import laspy
+
+import set_path  # noqa: F401
+from src.utils.ahn_utils import save_ahn_tile
+from src.utils.las_utils import get_bbox_from_tile_code
+
+# Fraction of points per object type.
+DEFAULT_FRACTIONS = {'ground': 0.45,
+                     'facade': 0.25,
+                     'tree': 0.12,
+                     'car': 0.09,
+                     'pole': 0.03,
+                     'sign': 0.02,
+                     'noise': 0.04}
+
+TILE_SIZE = 50
+AHN_RESOLUTION = 0.1
+
+
+def _ground_z(x, y, x_min, y_min):
+    """Height of the (slightly sloped) ground surface."""
+    return 1. + 0.01 * (x - x_min) + 0.005 * (y - y_min)
+
+
+def _get_layout(tilecode, rng):
+    """Generate the positions and dimensions of all objects in a tile."""
+    ((x_min, y_max), (x_max, y_min)) = get_bbox_from_tile_code(tilecode)
+    layout = {'x_min': x_min, 'y_min': y_min, 'x_max': x_max, 'y_max': y_max}
+    # Building blocks on both sides of the street: (x_min, x_max, height).
+    layout['buildings'] = [(x_min, x_min + 10, rng.uniform(12, 20)),
+                           (x_max - 10, x_max, rng.uniform(12, 20))]
+    # The road between the sidewalks.
+    layout['road'] = (x_min + 13, x_max - 13)
+    # Parked cars: (x_center, y_center), dimensions 4.5 x 1.8 x 1.5m.
+    car_y = np.arange(y_min + 4, y_max - 4, 6.5)
+    layout['cars'] = ([(x_min + 14.5, y) for y in car_y]
+                      + [(x_max - 14.5, y) for y in car_y[1::2]])
+    # Street lights and traffic signs on the west sidewalk, trees on the east
+    # sidewalk.
+    layout['lights'] = [(x_min + 12 + rng.uniform(-0.2, 0.2), y)
+                        for y in np.arange(y_min + 5, y_max, 15.)]
+    layout['signs'] = [(x_min + 11.5 + rng.uniform(-0.2, 0.2), y)
+                       for y in np.arange(y_min + 12, y_max, 20.)]
+    layout['trees'] = [(x_max - 12 + rng.uniform(-0.3, 0.3), y)
+                       for y in np.arange(y_min + 6, y_max, 12.)]
+    return layout
+
+
+def _sample_ground(n, layout, rng):
+    x = rng.uniform(layout['buildings'][0][1], layout['buildings'][1][0], n)
+    y = rng.uniform(layout['y_min'], layout['y_max'], n)
+    z = (_ground_z(x, y, layout['x_min'], layout['y_min'])
+         + rng.normal(0, 0.02, n))
+    return x, y, z
+
+
+def _sample_facades(n, layout, rng):
+    (_, west_x, west_h), (east_x, _, east_h) = layout['buildings']
+    n_west = n // 2
+    side = np.arange(n) < n_west
+    x = np.where(side, west_x, east_x) + rng.normal(0, 0.02, n)
+    y = rng.uniform(layout['y_min'], layout['y_max'], n)
+    ground = _ground_z(x, y, layout['x_min'], layout['y_min'])
+    z = ground + rng.uniform(0, 1, n) * np.where(side, west_h, east_h)
+    return x, y, z
+
+
+def _sample_cylinders(n, centers, radius, height, layout, rng):
+    """Sample points on vertical cylinders (poles, trunks)."""
+    idx = rng.integers(0, len(centers), n)
+    centers = np.asarray(centers)
+    phi = rng.uniform(0, 2 * np.pi, n)
+    x = centers[idx, 0] + radius * np.cos(phi)
+    y = centers[idx, 1] + radius * np.sin(phi)
+    z = (_ground_z(centers[idx, 0], centers[idx, 1],
+                   layout['x_min'], layout['y_min'])
+         + rng.uniform(0, height, n))
+    return x, y, z
+
+
+def _sample_trees(n, layout, rng):
+    n_trunk = n // 5
+    x_t, y_t, z_t = _sample_cylinders(n_trunk, layout['trees'], 0.15, 3.,
+                                      layout, rng)
+    # Crowns: points on a sphere of radius 2.5 around 5.5m height.
+    n_crown = n - n_trunk
+    centers = np.asarray(layout['trees'])
+    idx = rng.integers(0, len(centers), n_crown)
+    vec = rng.normal(size=(n_crown, 3))
+    vec *= (2.5 * rng.uniform(0.8, 1., n_crown)
+            / np.linalg.norm(vec, axis=1))[:, None]
+    x_c = centers[idx, 0] + vec[:, 0]
+    y_c = centers[idx, 1] + vec[:, 1]
+    z_c = (_ground_z(centers[idx, 0], centers[idx, 1],
+                     layout['x_min'], layout['y_min']) + 5.5 + vec[:, 2])
+    return (np.concatenate((x_t, x_c)), np.concatenate((y_t, y_c)),
+            np.concatenate((z_t, z_c)))
+
+
+def _sample_cars(n, layout, rng):
+    centers = np.asarray(layout['cars'])
+    idx = rng.integers(0, len(centers), n)
+    # Points on the surface of a 1.8 x 4.5 x 1.5m box: the side walls and the
+    # roof.
+    u = rng.uniform(-1, 1, n)
+    v = rng.uniform(-1, 1, n)
+    face = rng.integers(0, 3, n)
+    dx = np.where(face == 0, np.sign(u) * 0.9, u * 0.9)
+    dy = np.where(face == 1, np.sign(u) * 2.25, v * 2.25)
+    dz = np.where(face == 2, 1.5, rng.uniform(0.2, 1.5, n))
+    x = centers[idx, 0] + dx
+    y = centers[idx, 1] + dy
+    z = (_ground_z(centers[idx, 0], centers[idx, 1],
+                   layout['x_min'], layout['y_min']) + dz)
+    return x, y, z
+
+
+def _sample_poles(n, layout, rng):
+    return _sample_cylinders(n, layout['lights'], 0.1, 6., layout, rng)
+
+
+def _sample_signs(n, layout, rng):
+    n_pole = n // 2
+    x_p, y_p, z_p = _sample_cylinders(n_pole, layout['signs'], 0.04, 2.5,
+                                      layout, rng)
+    # The sign itself: a 0.6 x 0.6m plate on top of the pole.
+    n_plate = n - n_pole
+    centers = np.asarray(layout['signs'])
+    idx = rng.integers(0, len(centers), n_plate)
+    x_s = centers[idx, 0] + rng.normal(0, 0.005, n_plate)
+    y_s = centers[idx, 1] + rng.uniform(-0.3, 0.3, n_plate)
+    z_s = (_ground_z(centers[idx, 0], centers[idx, 1],
+                     layout['x_min'], layout['y_min'])
+           + rng.uniform(2.0, 2.6, n_plate))
+    return (np.concatenate((x_p, x_s)), np.concatenate((y_p, y_s)),
+            np.concatenate((z_p, z_s)))
+
+
+def _sample_noise(n, layout, rng):
+    x = rng.uniform(layout['x_min'], layout['x_max'], n)
+    y = rng.uniform(layout['y_min'], layout['y_max'], n)
+    z = (_ground_z(x, y, layout['x_min'], layout['y_min'])
+         + rng.uniform(-2, 25, n))
+    return x, y, z
+
+
+_SAMPLERS = {'ground': _sample_ground,
+             'facade': _sample_facades,
+             'tree': _sample_trees,
+             'car': _sample_cars,
+             'pole': _sample_poles,
+             'sign': _sample_signs,
+             'noise': _sample_noise}
+
+
+def generate_point_cloud(tilecode, n_points, out_file, seed=0,
+                         fractions=DEFAULT_FRACTIONS):
+    """
+    Generate a synthetic CycloMedia-style point cloud tile and write it to a
+    LAS/LAZ file. Points are generated and written per object type to limit
+    memory use.
+
+    Parameters
+    ----------
+    tilecode : str
+        The CycloMedia tile-code.
+    n_points : int
+        The (approximate) total number of points.
+    out_file : str or Path
+        The output file.
+    seed : int (default: 0)
+        Seed for the random number generator.
+    fractions : dict
+        The fraction of points for each object type, see DEFAULT_FRACTIONS.
+
+    Returns
+    -------
+    The layout of the tile, i.e. a dict with the positions of all objects.
+    """
+    rng = np.random.default_rng(seed)
+    layout = _get_layout(tilecode, rng)
+
+    header = laspy.LasHeader(point_format=1, version='1.2')
+    header.scales = np.array([0.001, 0.001, 0.001])
+    header.offsets = np.array([layout['x_min'], layout['y_min'], 0.])
+
+    total = sum(fractions.values())
+    with laspy.open(out_file, mode='w', header=header) as writer:
+        for obj_type, fraction in fractions.items():
+            n = int(n_points * fraction / total)
+            if n == 0:
+                continue
+            x, y, z = _SAMPLERS[obj_type](n, layout, rng)
+            points = laspy.ScaleAwarePointRecord.zeros(n, header=header)
+            points.x = x
+            points.y = y
+            points.z = z
+            points.intensity = rng.integers(0, 2**16, n, dtype=np.uint16)
+            points.gps_time = np.linspace(0, 1, n)
+            writer.write_points(points)
+    return layout
+
+
+def generate_ahn_tile(tilecode, layout, out_file):
+    """
+    Generate the AHN ground and building surfaces for a tile layout, in the
+    format of preprocessing.ahn_preprocessing.process_ahn_las_tile.
+    """
+    x_min, y_max = layout['x_min'], layout['y_max']
+    x_max, y_min = layout['x_max'], layout['y_min']
+    grid_y, grid_x = np.mgrid[y_max-AHN_RESOLUTION/2:y_min:-AHN_RESOLUTION,
+                              x_min+AHN_RESOLUTION/2:x_max:AHN_RESOLUTION]
+    ground = _ground_z(grid_x, grid_y, x_min, y_min)
+    building = np.full(grid_x.shape, np.nan)
+    for (bx_min, bx_max, height) in layout['buildings']:
+        in_building = (grid_x >= bx_min) & (grid_x <= bx_max)
+        building[in_building] = ground[in_building] + height
+        ground[in_building] = np.nan
+    save_ahn_tile(out_file, {'x': grid_x[0, :],
+                             'y': grid_y[:, 0],
+                             'ground_surface': ground,
+                             'building_surface': building})
+
+
+def _polygon_row(polygon):
+    """Convert a polygon to [polygon, x_min, y_max, x_max, y_min]."""
+    polygon = np.asarray(polygon)
+    return [str(polygon.tolist()), polygon[:, 0].min(), polygon[:, 1].max(),
+            polygon[:, 0].max(), polygon[:, 1].min()]
+
+
+def _box(x_min, y_min, x_max, y_max):
+    return [[x_min, y_min], [x_min, y_max], [x_max, y_max], [x_max, y_min],
+            [x_min, y_min]]
+
+
+def get_bgt_rows(tilecode, layout):
+    """
+    Return the BGT building, road and point rows for a tile layout, in the
+    format used by the BGT fusers.
+    """
+    buildings = [[f'{tilecode}_{i}'] + _polygon_row(
+                    _box(bx_min, layout['y_min'], bx_max, layout['y_max']))
+                 for i, (bx_min, bx_max, _) in enumerate(layout['buildings'])]
+    roads = [['rijbaan lokale weg'] + _polygon_row(
+                _box(layout['road'][0], layout['y_min'], layout['road'][1],
+                     layout['y_max']))]
+    points = ([['lichtmast', x, y] for (x, y) in layout['lights']]
+              + [['verkeersbord', x, y] for (x, y) in layout['signs']]
+              + [['boom', x, y] for (x, y) in layout['trees']])
+    return buildings, roads, points
+
+
+def generate_dataset(out_folder, tilecodes, n_points, seed=0,
+                     fractions=DEFAULT_FRACTIONS, prefix='filtered_'):
+    """
+    Generate a synthetic dataset consisting of point cloud tiles, AHN surfaces
+    and BGT data for the given tilecodes.
+
+    Parameters
+    ----------
+    out_folder : str or Path
+        The output folder. Subfolders 'pointcloud', 'ahn' and 'bgt' will be
+        created.
+    tilecodes : list of str
+        The CycloMedia tile-codes.
+    n_points : int
+        The number of points per tile.
+    seed : int (default: 0)
+        Seed for the random number generator. Each tile uses seed + its index.
+    fractions : dict
+        The fraction of points for each object type, see DEFAULT_FRACTIONS.
+    prefix : str (default: 'filtered_')
+        Prefix for the point cloud files.
+
+    Returns
+    -------
+    A dict with the paths of the generated folders and BGT files.
+    """
+    out_folder = pathlib.Path(out_folder)
+    paths = {'pointcloud': out_folder / 'pointcloud',
+             'ahn': out_folder / 'ahn',
+             'bgt': out_folder / 'bgt'}
+    for path in paths.values():
+        path.mkdir(parents=True, exist_ok=True)
+
+    building_rows, road_rows, point_rows = [], [], []
+    for i, tilecode in enumerate(tilecodes):
+        layout = generate_point_cloud(
+                    tilecode, n_points,
+                    paths['pointcloud'] / f'{prefix}{tilecode}.laz',
+                    seed=seed + i, fractions=fractions)
+        generate_ahn_tile(tilecode, layout,
+                          paths['ahn'] / f'ahn_{tilecode}.npz')
+        buildings, roads, points = get_bgt_rows(tilecode, layout)
+        building_rows += buildings
+        road_rows += roads
+        point_rows += points
+
+    paths['bgt_buildings'] = paths['bgt'] / 'bgt_buildings.csv'
+    paths['bgt_roads'] = paths['bgt'] / 'bgt_roads.csv'
+    paths['bgt_points'] = paths['bgt'] / 'bgt_points.csv'
+    _write_csv(paths['bgt_buildings'], building_rows,
+               ['building_id', 'polygon', 'x_min', 'y_max', 'x_max', 'y_min'])
+    _write_csv(paths['bgt_roads'], road_rows,
+               ['bgt_name', 'polygon', 'x_min', 'y_max', 'x_max', 'y_min'])
+    _write_csv(paths['bgt_points'], point_rows, ['Type', 'X', 'Y'])
+    return paths
+
+
+def _write_csv(csv_file, rows, headers):
+    from src.utils.csv_utils import write_csv
+    write_csv(os.fspath(csv_file), rows, headers)
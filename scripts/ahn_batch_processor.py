@@ -4,17 +4,37 @@ import argparse
 import os
 import sys
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm.contrib.concurrent import process_map  # or thread_map
 
 # Helper script to allow importing from parent folder.
 import set_path  # noqa: F401
 from src.preprocessing.ahn_preprocessing import process_ahn_las_tile
+from src.utils.las_utils import get_tilecode_from_filename
+from src.utils.queue_utils import TileJobQueue, run_worker
 
 
 def _process_file(file):
     process_ahn_las_tile(file, out_folder=args.out_folder,
-                         resolution=args.resolution)
+                         resolution=args.resolution, engine=args.engine,
+                         backend=args.backend)
+
+
+def _process_job(in_file, out_file):
+    process_ahn_las_tile(in_file, out_folder=os.path.dirname(out_file),
+                         resolution=args.resolution, engine=args.engine,
+                         backend=args.backend)
+    return {}
+
+
+def _run_queue_worker(queue_file, worker_args):
+    global args
+    args = worker_args
+    job_queue = TileJobQueue(queue_file)
+    results = run_worker(job_queue, _process_job)
+    job_queue.close()
+    return len(results)
 
 
 if __name__ == '__main__':
@@ -30,9 +50,22 @@ if __name__ == '__main__':
                         type=str, required=False)
     parser.add_argument('--resolution', metavar='float', action='store',
                         type=float, required=False, default=0.1)
+    parser.add_argument('--engine', action='store', type=str,
+                        required=False, default='interpolate',
+                        choices=['interpolate', 'raster'],
+                        help="'raster' rasterizes the AHN points in a single "
+                             + 'pass, without a neighbour search')
+    parser.add_argument('--backend', action='store', type=str,
+                        required=False, default='kdtree',
+                        choices=['kdtree', 'grid'],
+                        help="neighbour search for the 'interpolate' engine")
     parser.add_argument('--resume', action='store_true')
     parser.add_argument('--workers', metavar='int', action='store',
                         type=int, required=False, default=1)
+    parser.add_argument('--queue', metavar='path', action='store',
+                        type=str, required=False,
+                        help='shared job queue file, to distribute the '
+                             + 'files over multiple hosts')
     args = parser.parse_args()
 
     if args.out_folder is None:
@@ -55,6 +88,23 @@ if __name__ == '__main__':
                     in Path(args.out_folder).glob('*.npz')])
         files = [f for f in files if f[-13:-4] not in done]
 
+    if args.queue:
+        # Add the files to the shared queue (files already in the queue are
+        # ignored) and process jobs until all jobs are finished. The same
+        # command can be started on multiple hosts.
+        job_queue = TileJobQueue(args.queue)
+        job_queue.add_jobs(
+            [(f, os.path.join(args.out_folder,
+                              'ahn_' + get_tilecode_from_filename(f) + '.npz'))
+             for f in sorted(files)])
+        job_queue.close()
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            n_done = sum(executor.map(_run_queue_worker,
+                                      [args.queue] * args.workers,
+                                      [args] * args.workers))
+        print(f'{n_done} files processed.')
+        sys.exit()
+
     # Chunk size can be used to reduce overhead for a large number of files.
     chunk = 1
     if len(files) > 100:
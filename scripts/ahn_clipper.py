@@ -0,0 +1,47 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import sys
+
+# Helper script to allow importing from parent folder.
+import set_path  # noqa: F401
+from src.preprocessing.ahn_preprocessing import clip_ahn_las_stream
+
+
+if __name__ == '__main__':
+    desc_str = '''This script clips a large AHN point cloud into tiles that
+                  match a folder of CycloMedia point clouds. The AHN file is
+                  read once, in chunks, so it need not fit in memory.'''
+    parser = argparse.ArgumentParser(description=desc_str)
+    parser.add_argument('--ahn_file', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--in_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--out_folder', metavar='path', action='store',
+                        type=str, required=False)
+    parser.add_argument('--buffer', metavar='int', action='store',
+                        type=int, required=False, default=1)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--workers', metavar='int', action='store',
+                        type=int, required=False, default=1)
+    parser.add_argument('--tmp_folder', metavar='path', action='store',
+                        type=str, required=False,
+                        help='folder for temporary files, defaults to the '
+                             + 'output folder')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.ahn_file):
+        print('The AHN file does not exist')
+        sys.exit()
+
+    if not os.path.isdir(args.in_folder):
+        print('The input path does not exist')
+        sys.exit()
+
+    files = clip_ahn_las_stream(args.ahn_file, args.in_folder,
+                                out_folder=args.out_folder,
+                                buffer=args.buffer, resume=args.resume,
+                                workers=args.workers,
+                                tmp_folder=args.tmp_folder)
+    print(f'{len(files)} files written.')
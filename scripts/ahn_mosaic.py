@@ -0,0 +1,31 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import sys
+
+# Helper script to allow importing from parent folder.
+import set_path  # noqa: F401
+from src.utils.ahn_utils import create_ahn_mosaic
+
+
+if __name__ == '__main__':
+    desc_str = '''This script converts a folder of pre-processed AHN .npz files
+                  (see ahn_batch_processor.py) into a single memory-mapped
+                  mosaic, which can be read using MosaicReader.'''
+    parser = argparse.ArgumentParser(description=desc_str)
+    parser.add_argument('--in_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--out_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--dtype', metavar='str', action='store',
+                        type=str, required=False, default='float32')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.in_folder):
+        print('The input path does not exist')
+        sys.exit()
+
+    n_tiles = create_ahn_mosaic(args.in_folder, args.out_folder,
+                                dtype=args.dtype)
+    print(f'Mosaic of {n_tiles} tiles written to {args.out_folder}.')
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import argparse
+import glob
+import os
+import sys
+
+# Helper script to allow importing from parent folder.
+import set_path  # noqa: F401
+from src.preprocessing.las_preprocessing import tile_las_files
+
+
+if __name__ == '__main__':
+    desc_str = '''This script cuts a folder of arbitrary LAS/LAZ point clouds
+                  (e.g. strips) into 50x50m tiles that follow the tile code
+                  convention, named <prefix>XXXX_YYYY.laz, such that they can
+                  be processed by the pipeline. The input files are streamed,
+                  so they need not fit in memory.'''
+    parser = argparse.ArgumentParser(description=desc_str)
+    parser.add_argument('--in_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--out_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--buffer', metavar='float', action='store',
+                        type=float, required=False, default=0,
+                        help='overlap (in m) around each tile')
+    parser.add_argument('--prefix', metavar='str', action='store',
+                        type=str, required=False, default='filtered_')
+    parser.add_argument('--workers', metavar='int', action='store',
+                        type=int, required=False, default=1)
+    parser.add_argument('--tmp_folder', metavar='path', action='store',
+                        type=str, required=False,
+                        help='folder for temporary files, defaults to the '
+                             + 'output folder')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.in_folder):
+        print('The input path does not exist')
+        sys.exit()
+
+    file_types = ('.LAS', '.las', '.LAZ', '.laz')
+    files = sorted(f for f in glob.glob(os.path.join(args.in_folder, '*'))
+                   if f.endswith(file_types))
+    if len(files) == 0:
+        print('No point cloud files found in the input path')
+        sys.exit()
+
+    tiles = tile_las_files(files, args.out_folder, buffer=args.buffer,
+                           prefix=args.prefix, workers=args.workers,
+                           tmp_folder=args.tmp_folder)
+    print(f'{len(files)} files cut into {len(tiles)} tiles.')
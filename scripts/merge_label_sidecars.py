@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import sys
+import glob
+from pathlib import Path
+from tqdm import tqdm
+
+# Helper script to allow importing from parent folder.
+import set_path  # noqa: F401
+from src.utils.las_utils import (get_tilecode_from_filename,
+                                 merge_label_sidecar, LABEL_SIDECAR_EXT)
+
+
+if __name__ == '__main__':
+    desc_str = '''This script merges label sidecar files (written by the
+                  Pipeline with output='labels') with the source point clouds
+                  to produce labelled .laz files.'''
+    parser = argparse.ArgumentParser(description=desc_str)
+    parser.add_argument('--las_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--label_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--out_folder', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--las_prefix', metavar='str', action='store',
+                        type=str, required=False, default='')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.las_folder):
+        print('The input path does not exist')
+        sys.exit()
+
+    Path(args.out_folder).mkdir(parents=True, exist_ok=True)
+
+    file_types = ('.LAS', '.las', '.LAZ', '.laz')
+    las_files = {get_tilecode_from_filename(os.path.basename(f)): f
+                 for f in glob.glob(os.path.join(args.las_folder,
+                                                 args.las_prefix + '*'))
+                 if f.endswith(file_types)}
+    label_files = glob.glob(os.path.join(args.label_folder,
+                                         '*' + LABEL_SIDECAR_EXT))
+
+    for label_file in tqdm(label_files, unit='file'):
+        name = os.path.basename(label_file)[:-len(LABEL_SIDECAR_EXT)]
+        tilecode = get_tilecode_from_filename(name)
+        if tilecode not in las_files:
+            print(f'No point cloud found for {label_file}')
+            continue
+        merge_label_sidecar(las_files[tilecode], label_file,
+                            os.path.join(args.out_folder, name + '.laz'))
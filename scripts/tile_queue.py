@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import sys
+
+# Helper script to allow importing from parent folder.
+import set_path  # noqa: F401
+from src.utils.queue_utils import TileJobQueue
+
+
+if __name__ == '__main__':
+    desc_str = '''This script shows the status and aggregate throughput of a
+                  tile job queue (see Pipeline.process_queue and
+                  ahn_batch_processor.py --queue), and can return failed jobs
+                  to the queue.'''
+    parser = argparse.ArgumentParser(description=desc_str)
+    parser.add_argument('--queue', metavar='path', action='store',
+                        type=str, required=True)
+    parser.add_argument('--reset_failed', action='store_true')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.queue):
+        print('The queue file does not exist')
+        sys.exit()
+
+    job_queue = TileJobQueue(args.queue)
+    if args.reset_failed:
+        print(f'{job_queue.reset_failed()} failed jobs returned to queue.')
+
+    stats = job_queue.get_stats()
+    print('Jobs: ' + ', '.join(f'{status} {cnt}'
+                               for status, cnt in stats['status'].items()))
+    if stats['n_done'] > 0:
+        print(f"Done: {stats['n_done']} tiles, {stats['n_points']} points "
+              + f"in {stats['wall_time']:.0f}s "
+              + f"(mean {stats['mean_duration']:.1f}s per tile)")
+        if stats['tiles_per_hour'] is not None:
+            print(f"Throughput: {stats['tiles_per_hour']:.1f} tiles/hour, "
+                  + f"{stats['points_per_second']:.0f} points/s")
+        for worker, worker_stats in sorted(stats['workers'].items()):
+            print(f"  {worker:<30} {worker_stats['n_done']:6} tiles "
+                  + f"{worker_stats['duration']:10.1f}s")
+    job_queue.close()
@@ -1,7 +1,29 @@
 """Abstract base class for PipeLine processor objects."""
 
+import numpy as np
+import functools
 from abc import ABC, abstractmethod
 
+from .utils.manifest_utils import get_simple_attributes
+from .utils.shm_utils import SharedTile
+
+
+def _accept_shared_tile(get_label_mask):
+    """
+    Wrap a get_label_mask implementation such that it accepts a SharedTile
+    in place of the points. Labels and mask default to those of the tile.
+    """
+    @functools.wraps(get_label_mask)
+    def wrapper(self, points, labels=None, mask=None, tilecode=None):
+        if isinstance(points, SharedTile):
+            if labels is None:
+                labels = points.labels
+            if mask is None:
+                mask = points.mask
+            points = points.points
+        return get_label_mask(self, points, labels, mask, tilecode)
+    return wrapper
+
 
 class AbstractProcessor(ABC):
     """
@@ -18,6 +40,13 @@ class AbstractProcessor(ABC):
         self.label = label
         super().__init__()
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # All implementations accept a SharedTile, see get_label_mask.
+        if 'get_label_mask' in cls.__dict__:
+            cls.get_label_mask = _accept_shared_tile(
+                                        cls.__dict__['get_label_mask'])
+
     @abstractmethod
     def get_label_mask(self, points, labels, mask, tilecode):
         """
@@ -25,8 +54,10 @@ class AbstractProcessor(ABC):
 
         Parameters
         ----------
-        points : array of shape (n_points, 3)
-            The point cloud <x, y, z>.
+        points : array of shape (n_points, 3) or SharedTile
+            The point cloud <x, y, z>. When a SharedTile is given, its points
+            are used without copying, and labels and mask default to those of
+            the tile.
         labels : array of shape (n_points,)
             The labels corresponding to each point.
         mask : array of shape (n_points,) with dtype=bool
@@ -44,3 +75,50 @@ class AbstractProcessor(ABC):
     def get_label(self):
         """Returns the label of this AbstractProcessor."""
         return self.label
+
+    def is_point_local(self):
+        """
+        Returns whether the label of each point is determined by that point
+        alone (e.g. its position with respect to a reference surface or
+        polygon). Point-local processors give the same result when a point
+        cloud is processed in chunks, which allows streaming of large files.
+        """
+        return False
+
+    def get_dependency_region(self, points, tilecode):
+        """
+        Returns the region of the point cloud on which the result of this
+        processor depends, which is used by the Pipeline to run independent
+        processors concurrently.
+
+        The label mask returned by a processor that declares a region should
+        only include points in the given mask, and may only depend on the
+        mask and labels of points inside the region. Changes made by other
+        processors outside the region then do not affect the result. By
+        default, point-local processors (see is_point_local) depend on no
+        other points, and all other processors depend on the full point cloud.
+
+        Parameters
+        ----------
+        points : array of shape (n_points, 3)
+            The point cloud <x, y, z>.
+        tilecode : str
+            The CycloMedia tile-code for the given pointcloud.
+
+        Returns
+        -------
+        An array of shape (n_points,) with dtype=bool, or None if the result
+        may depend on the full point cloud.
+        """
+        if self.is_point_local():
+            return np.zeros((len(points),), dtype=bool)
+        return None
+
+    def get_config(self):
+        """
+        Returns a dict describing the configuration of this processor. This is
+        used to check whether earlier results are still up to date. By default
+        all attributes with simple values (numbers, strings, and lists or
+        dicts thereof) are included.
+        """
+        return get_simple_attributes(self)
@@ -54,6 +54,10 @@ class AHNFuser(AbstractProcessor):
         self.target = target
         self.epsilon = epsilon
 
+    def is_point_local(self):
+        """Returns True, this fuser labels each point independently."""
+        return True
+
     def get_label_mask(self, points, labels, mask, tilecode):
         """
         Returns the label mask for the given pointcloud.
@@ -14,9 +14,11 @@ from abc import ABC, abstractmethod
 
 from ..abstract_processor import AbstractProcessor
 from ..utils import clip_utils
+from ..utils import trace_utils
 from ..utils.interpolation import FastGridInterpolator
 from ..utils.las_utils import get_bbox_from_tile_code
 from ..utils.labels import Labels
+from ..utils.manifest_utils import get_file_signature
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +64,12 @@ class BGTFuser(AbstractProcessor, ABC):
         super().__init__(label)
         self.file_prefix = file_prefix
         self.bgt_df = pd.DataFrame(columns=type(self).COLUMNS)
+        # The data source is part of the configuration (see get_config), such
+        # that changed BGT data invalidates earlier results.
+        self.bgt_file = None if bgt_file is None else Path(bgt_file).as_posix()
+        self.bgt_folder = (None if bgt_folder is None
+                           else Path(bgt_folder).as_posix())
+        self.bgt_sources = []
 
         if bgt_file is not None:
             self._read_file(Path(bgt_file))
@@ -78,12 +86,14 @@ class BGTFuser(AbstractProcessor, ABC):
         CSV files in that folder.
         """
         file_match = self.file_prefix + '*.csv'
+        files = sorted(path.glob(file_match))
         frames = [pd.read_csv(file, header=0, names=type(self).COLUMNS)
-                  for file in path.glob(file_match)]
+                  for file in files]
         if len(frames) == 0:
             logger.error(f'No data files found in {path.as_posix()}.')
             return
         self.bgt_df = pd.concat(frames)
+        self.bgt_sources = [get_file_signature(file) for file in files]
 
     def _read_file(self, path):
         """
@@ -92,6 +102,7 @@ class BGTFuser(AbstractProcessor, ABC):
         CSV files in that folder.
         """
         self.bgt_df = pd.read_csv(path, header=0, names=type(self).COLUMNS)
+        self.bgt_sources = [get_file_signature(path)]
 
     @abstractmethod
     def _filter_tile(self, tilecode):
@@ -167,6 +178,10 @@ class BGTBuildingFuser(BGTFuser):
                       if len(poly.exterior.coords) > 1]
         return poly_valid
 
+    def is_point_local(self):
+        """Returns True, this fuser labels each point independently."""
+        return True
+
     def get_label_mask(self, points, labels, mask, tilecode):
         """
         Returns the label mask for the given pointcloud.
@@ -197,11 +212,13 @@ class BGTBuildingFuser(BGTFuser):
         mask_ids = np.where(mask)[0]
 
         building_mask = np.zeros((len(mask_ids),), dtype=bool)
-        for polygon in building_polygons:
-            # TODO if there are multiple buildings we could mask the points
-            # iteratively to ignore points already labelled.
-            clip_mask = clip_utils.poly_clip(points[mask, :], polygon)
-            building_mask = building_mask | clip_mask
+        with trace_utils.span('polygon clip', n_points=len(mask_ids),
+                              n_polygons=len(building_polygons)):
+            for polygon in building_polygons:
+                # TODO if there are multiple buildings we could mask the
+                # points iteratively to ignore points already labelled.
+                clip_mask = clip_utils.poly_clip(points[mask, :], polygon)
+                building_mask = building_mask | clip_mask
 
         if self.ahn_reader is not None:
             bld_z = self.ahn_reader.interpolate(
@@ -332,8 +349,9 @@ class BGTPointFuser(BGTFuser):
         if len(search_ids) < min_points:
             return np.empty((0, 3))
         # Cluster the potential seed points.
-        clustering = (DBSCAN(eps=0.05, min_samples=5, p=2)
-                      .fit(points[search_ids]))
+        with trace_utils.span('DBSCAN', n_points=len(search_ids)):
+            clustering = (DBSCAN(eps=0.05, min_samples=5, p=2)
+                          .fit(points[search_ids]))
         # Remove noise points.
         noise_mask = clustering.labels_ != -1
         # Get cluster labels and sizes.
@@ -450,6 +468,27 @@ class BGTPointFuser(BGTFuser):
                 matches[obj] = None
         return seeds, matches
 
+    def get_dependency_region(self, points, tilecode):
+        """
+        Returns the region of the point cloud on which the result of this
+        fuser depends: a box around each BGT point object that includes the
+        search box, the seed cluster search, and the labelled cylinder.
+        """
+        params = {'search_pad': 1.5, 'max_dist': 1.2, 'max_r': 0.5}
+        params.update(self.params)
+        # The seed cluster is found within 1m of a candidate that is at most
+        # max_dist from the object, and the labelled cylinder has a radius of
+        # at most r_mult * max_r.
+        pad = max(params['search_pad'],
+                  params['max_dist'] + 1 + (1 + params['r_mult'])
+                  * params['max_r'])
+        region = np.zeros((len(points),), dtype=bool)
+        for obj in self._filter_tile(tilecode):
+            region = region | clip_utils.rectangle_clip(
+                        points, (obj[0]-pad, obj[1]-pad,
+                                 obj[0]+pad, obj[1]+pad))
+        return region
+
     def get_label_mask(self, points, labels, mask, tilecode):
         """
         Returns the label mask for the given pointcloud.
@@ -482,17 +521,19 @@ class BGTPointFuser(BGTFuser):
                                       ahn_tile['ground_surface'])
 
         # Find seed point clusters.
-        seeds, matches = self._find_seeds_for_point_objects(
+        with trace_utils.span('seed search', n_objects=len(bgt_points)):
+            seeds, matches = self._find_seeds_for_point_objects(
                             points[mask], bgt_points, fast_z, **self.params)
-        for seed in seeds:
-            # Label a cylinder based on the seed cluster.
-            top_height = (fast_z(np.array([seed[0:2]]))
-                          + self.params['label_height'])
-            clip_mask = clip_utils.cylinder_clip(
+        with trace_utils.span('cylinder clip', n_seeds=len(seeds)):
+            for seed in seeds:
+                # Label a cylinder based on the seed cluster.
+                top_height = (fast_z(np.array([seed[0:2]]))
+                              + self.params['label_height'])
+                clip_mask = clip_utils.cylinder_clip(
                                         points[mask], np.array(seed[0:2]),
                                         self.params['r_mult']*seed[2],
                                         top=top_height)
-            label_mask[mask] = label_mask[mask] | clip_mask
+                label_mask[mask] = label_mask[mask] | clip_mask
 
         match_str = ', '.join([f'{obj}->{cand}'
                                for (obj, cand) in matches.items()])
@@ -9,6 +9,7 @@ from ..utils.math_utils import minimum_bounding_rectangle
 from ..utils.las_utils import get_bbox_from_tile_code
 from ..utils.clip_utils import poly_box_clip
 from ..utils.labels import Labels
+from ..utils import trace_utils
 
 logger = logging.getLogger(__name__)
 
@@ -145,9 +146,11 @@ class CarFuser(BGTFuser):
         point_components = lcc.get_components(points[mask])
 
         # Label car like clusters
-        car_mask = self._fill_car_like_components(points[mask], ground_z,
-                                                  point_components,
-                                                  road_polygons)
+        with trace_utils.span('car components',
+                              n_points=len(point_components)):
+            car_mask = self._fill_car_like_components(
+                                points[mask], ground_z, point_components,
+                                road_polygons)
         label_mask[mask] = car_mask
 
         return label_mask
@@ -26,8 +26,11 @@ class NoiseFilter(AbstractProcessor):
         Precision of the fuser.
     octree_level : int (default: 9)
         Octree level for clustering connected components.
-    min_component_size : int (default: 100)
-        Minimum size of a cluster below which it is regarded as noise.
+    min_component_size : int or None (default: 100)
+        Minimum size of a cluster below which it is regarded as noise. If set
+        to None, clustering is disabled and only points below ground level are
+        labelled as noise. The filter is then point-local, which means it can
+        be applied to a large point cloud in chunks.
     """
     def __init__(self, label, ahn_reader, epsilon=0.2,
                  octree_level=9, min_component_size=100):
@@ -38,6 +41,10 @@ class NoiseFilter(AbstractProcessor):
         self.octree_level = octree_level
         self.min_component_size = min_component_size
 
+    def is_point_local(self):
+        """Returns True if clustering is disabled."""
+        return self.min_component_size is None
+
     def get_label_mask(self, points, labels, mask, tilecode):
         """
         Returns the label mask for the given pointcloud.
@@ -60,13 +67,17 @@ class NoiseFilter(AbstractProcessor):
         """
         logger.info('Noise filter ' +
                     f'(label={self.label}, {Labels.get_str(self.label)}).')
-        # Create lcc object and perform lcc
-        lcc = LabelConnectedComp(self.label, octree_level=self.octree_level,
-                                 min_component_size=self.min_component_size)
-        point_components = lcc.get_components(points[mask])
-        cc_mask = point_components == -1
-        logger.debug(f'Found {np.count_nonzero(cc_mask)} noise points in '
-                     + f'clusters <{self.min_component_size} points.')
+        if self.min_component_size is None:
+            cc_mask = np.zeros((np.count_nonzero(mask),), dtype=bool)
+        else:
+            # Create lcc object and perform lcc
+            lcc = LabelConnectedComp(
+                            self.label, octree_level=self.octree_level,
+                            min_component_size=self.min_component_size)
+            point_components = lcc.get_components(points[mask])
+            cc_mask = point_components == -1
+            logger.debug(f'Found {np.count_nonzero(cc_mask)} noise points in '
+                         + f'clusters <{self.min_component_size} points.')
 
         # Get the interpolated ground points of the tile
         target_z = self.ahn_reader.interpolate(
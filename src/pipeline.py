@@ -5,12 +5,79 @@ import os
 import pathlib
 import time
 import logging
+import laspy
+import multiprocessing as mp
+import queue
+import threading
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
 from tqdm import tqdm
 
 from .utils import las_utils
+from .utils import trace_utils
+from .utils.manifest_utils import RunManifest, get_config_hash
+from .utils.queue_utils import TileJobQueue, run_worker
+from .utils.shm_utils import SharedTile
 
 logger = logging.getLogger(__name__)
 
+# Pipeline copy owned by a worker process, see Pipeline.process_folder.
+_worker_pipeline = None
+_worker_records = []
+
+
+class _RecordCollector(logging.Handler):
+    """Logging handler that stores records so they can be sent back to the
+    parent process."""
+
+    def emit(self, record):
+        # Make the record picklable by resolving the message up front.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                                                        record.exc_info)
+            record.exc_info = None
+        _worker_records.append(record)
+
+
+def _init_worker(pipeline, tracing=False):
+    """Initialise a worker process with its own copy of the pipeline."""
+    global _worker_pipeline
+    _worker_pipeline = pipeline
+    if tracing:
+        trace_utils.start_tracing()
+    else:
+        trace_utils.stop_tracing()
+    # Log records are collected and handled by the parent process.
+    src_logger = logging.getLogger('src')
+    src_logger.setLevel(logging.DEBUG)
+    src_logger.handlers = [_RecordCollector()]
+    src_logger.propagate = False
+
+
+def _process_file_worker(in_file, out_file, chunk_size=None, in_labels=None):
+    """Process a single file in a worker process and return the result
+    together with the collected log records and trace events."""
+    _worker_records.clear()
+    trace_utils.pop_events()
+    try:
+        result = _worker_pipeline.process_file(in_file, out_file,
+                                               chunk_size=chunk_size,
+                                               in_labels=in_labels)
+    finally:
+        records = list(_worker_records)
+        _worker_records.clear()
+    return result, records, trace_utils.pop_events()
+
+
+def _handle_records(records):
+    """Pass log records collected in a worker to the parent's loggers."""
+    for record in records:
+        record_logger = logging.getLogger(record.name)
+        if record_logger.isEnabledFor(record.levelno):
+            record_logger.handle(record)
+
 
 class Pipeline:
     """
@@ -31,20 +98,39 @@ class Pipeline:
         caching is used.
     caching : bool (default: True)
         Enable caching of AHN interpolation data.
+    output : str (default: 'las')
+        Output mode. With 'las' the labelled point cloud is written as LAS /
+        LAZ file. With 'labels' only the labels are written as a compact
+        sidecar file next to the output file name (see
+        las_utils.save_label_sidecar), which avoids rewriting and
+        recompressing the point cloud. A labelled point cloud can be produced
+        later using las_utils.merge_label_sidecar.
+    threads : int (default: 1)
+        Number of threads used to run independent processors concurrently,
+        see process_cloud.
     """
 
     FILE_TYPES = ('.LAS', '.las', '.LAZ', '.laz')
+    MANIFEST_FILE = 'pipeline_manifest.sqlite'
+    IO_QUEUE_SIZE = 1
+    OUTPUT_MODES = ('las', 'labels')
 
     def __init__(self, processors=[], exclude_labels=[],
-                 ahn_reader=None, caching=True):
+                 ahn_reader=None, caching=True, output='las', threads=1):
         if ahn_reader is None and caching:
             logger.error(
                 'An ahn_reader must be specified when caching is enabled.')
             raise ValueError
+        if output not in self.OUTPUT_MODES:
+            logger.error(f'Output mode should be one of {self.OUTPUT_MODES}.')
+            raise ValueError
+        self.output = output
+        self.threads = threads
         self.processors = processors
         self.exclude_labels = exclude_labels
         self.ahn_reader = ahn_reader
         self.caching = caching
+        self.stage_timings = None
         if self.caching:
             self.ahn_reader.set_caching(self.caching)
 
@@ -57,18 +143,52 @@ class Pipeline:
                 mask = mask & (labels != exclude_label)
         return mask
 
-    def process_cloud(self, tilecode, points, labels, mask=None):
+    def get_config(self):
+        """
+        Returns a dict describing the configuration of this pipeline, i.e. of
+        all processors in order and of the AHNReader.
+        """
+        config = {'exclude_labels': list(self.exclude_labels),
+                  'processors': [obj.get_config() for obj in self.processors]}
+        if self.ahn_reader is not None:
+            config['ahn_reader'] = self.ahn_reader.get_config()
+        return config
+
+    def get_config_hash(self, tilecode=None):
+        """
+        Returns a hash of the pipeline configuration. If a tile-code is given,
+        the signatures of the AHN data files of this tile are included, such
+        that the hash changes when the AHN data of the tile is regenerated.
+        """
+        config = self.get_config()
+        if tilecode is not None and self.ahn_reader is not None:
+            config['ahn_sources'] = self.ahn_reader.get_tile_sources(tilecode)
+        return get_config_hash(config)
+
+    def process_cloud(self, tilecode, points, labels=None, mask=None):
         """
         Process a single point cloud.
 
+        With threads > 1, processors that declare the region of the point
+        cloud they depend on (see AbstractProcessor.get_dependency_region)
+        are run concurrently. Consecutive processors with a region form a
+        stage group, which is computed on the state at the start of the group;
+        processors that depend on the full point cloud act as barriers. The
+        results of a group are then resolved in the original order: a
+        processor whose region contains points labelled by an earlier
+        processor in the group is re-run on the updated labels. The result is
+        identical to sequential processing.
+
         Parameters
         ----------
         tilecode : str
             The CycloMedia tile-code for the given pointcloud.
-        points : array of shape (n_points, 3)
-            The point cloud <x, y, z>.
+        points : array of shape (n_points, 3) or SharedTile
+            The point cloud <x, y, z>. When a SharedTile is given, the tile is
+            processed without copying: its labels are updated in place, and
+            its mask is used as pre-mask unless a mask is given.
         labels : array of shape (n_points, 1)
-            All labels as int values
+            All labels as int values. Not needed for a SharedTile.
         mask : array of shape (n_points,) with dtype=bool
             Pre-mask used to label only a subset of the points.
 
@@ -77,25 +197,106 @@ class Pipeline:
         An array of shape (n_points,) with dtype=uint16 indicating the label
         for each point.
         """
+        if isinstance(points, SharedTile):
+            labels = points.labels
+            if mask is None:
+                mask = points.mask.copy()
+            points = points.points
         mask = self._create_mask(mask, labels)
         if self.caching:
             self.ahn_reader.cache_interpolator(
                                 tilecode, points, surface='ground_surface')
 
-        for obj in self.processors:
-            start = time.time()
-            label_mask = obj.get_label_mask(points, labels, mask, tilecode)
-            labels[label_mask] = obj.get_label()
-            mask[label_mask] = False
-            duration = time.time() - start
-            logger.info(f'Processor finished in {duration:.2f}s, ' +
-                        f'{np.count_nonzero(label_mask)} points labelled.')
+        if self.threads > 1:
+            self._process_cloud_concurrent(tilecode, points, labels, mask)
+        else:
+            for obj in self.processors:
+                label_mask = self._run_processor(obj, tilecode, points,
+                                                 labels, mask)
+                labels[label_mask] = obj.get_label()
+                mask[label_mask] = False
 
         return labels
 
-    def process_file(self, in_file, out_file=None, mask=None):
+    def _run_processor(self, obj, tilecode, points, labels, mask):
+        """Run a single processor, returns its label mask."""
+        start = time.time()
+        with trace_utils.span(type(obj).__name__, label=obj.get_label(),
+                              n_points=np.count_nonzero(mask)) as span:
+            label_mask = obj.get_label_mask(points, labels, mask, tilecode)
+            span['n_labelled'] = np.count_nonzero(label_mask)
+        duration = time.time() - start
+        logger.info(f'Processor finished in {duration:.2f}s, ' +
+                    f'{np.count_nonzero(label_mask)} points labelled.')
+        return label_mask
+
+    def _run_processor_nested(self, stack, obj, tilecode, points, labels,
+                              mask):
+        """Run a processor in a worker thread, see _run_processor."""
+        with trace_utils.nested_in(stack):
+            return self._run_processor(obj, tilecode, points, labels, mask)
+
+    def _process_cloud_concurrent(self, tilecode, points, labels, mask):
         """
-        Process a single LAS file and save the result as .laz file.
+        Apply the processors to a point cloud using a pool of threads, see
+        process_cloud. The labels and mask are updated in place.
+        """
+        regions = [obj.get_dependency_region(points, tilecode)
+                   for obj in self.processors]
+        stack = trace_utils.get_stack()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            i = 0
+            while i < len(self.processors):
+                # Find the group of consecutive processors with a region.
+                j = i + 1
+                if regions[i] is not None:
+                    while j < len(self.processors) and regions[j] is not None:
+                        j += 1
+                if j - i == 1:
+                    obj = self.processors[i]
+                    label_mask = self._run_processor(obj, tilecode, points,
+                                                     labels, mask)
+                    labels[label_mask] = obj.get_label()
+                    mask[label_mask] = False
+                    i = j
+                    continue
+
+                logger.debug(f'Running processors {i} to {j-1} '
+                             + 'concurrently.')
+                futures = [executor.submit(self._run_processor_nested, stack,
+                                           self.processors[k], tilecode,
+                                           points, labels.copy(), mask.copy())
+                           for k in range(i, j)]
+                changed = np.zeros((len(points),), dtype=bool)
+                for k, future in zip(range(i, j), futures):
+                    obj = self.processors[k]
+                    label_mask = future.result()
+                    if np.any(changed & regions[k]):
+                        # Points this processor depends on were labelled by
+                        # an earlier processor in the group.
+                        logger.debug(f'Processor {k} depends on points '
+                                     + 'labelled by an earlier processor, '
+                                     + 're-running.')
+                        label_mask = self._run_processor(obj, tilecode,
+                                                         points, labels, mask)
+                    else:
+                        label_mask = label_mask & mask
+                    labels[label_mask] = obj.get_label()
+                    mask[label_mask] = False
+                    changed = changed | label_mask
+                i = j
+
+    def process_file(self, in_file, out_file=None, mask=None,
+                     chunk_size=None, in_labels=None):
+        """
+        Process a single LAS file and save the result as .laz file, or as
+        label sidecar file when output='labels'.
+
+        If a chunk_size is given, and all processors are point-local (see
+        AbstractProcessor.is_point_local), the file is streamed: it is read,
+        processed and written in chunks of at most chunk_size points, so that
+        memory use is bounded regardless of the size of the file. Otherwise,
+        the full point cloud is loaded in memory.
 
         Parameters
         ----------
@@ -103,9 +304,21 @@ class Pipeline:
             The file to process.
         out_file : str (default: None)
             The name of the output file. If None, the input will be
-            overwritten.
+            overwritten. When output='labels', the labels are written to the
+            corresponding sidecar file (see las_utils.get_label_sidecar_file).
         mask : array of shape (n_points,) with dtype=bool
             Pre-mask used to label only a subset of the points.
+        chunk_size : int (default: None)
+            Optional, the number of points per chunk when streaming.
+        in_labels : str (default: None)
+            Optional, a label sidecar file with existing labels for in_file,
+            e.g. written by an earlier run. These replace the labels stored in
+            the point cloud itself.
+
+        Returns
+        -------
+        A dict with statistics for the processed tile, or None if the input
+        file does not exist.
         """
         logger.info(f'Processing file {in_file}.')
         start = time.time()
@@ -115,27 +328,159 @@ class Pipeline:
 
         if out_file is None:
             out_file = in_file
+        out_file = self._get_output_file(out_file)
 
         tilecode = las_utils.get_tilecode_from_filename(in_file)
+
+        with trace_utils.span('tile', tilecode=tilecode) as span:
+            if chunk_size is not None and self._can_stream():
+                label_counts = self._process_file_chunked(
+                                tilecode, in_file, out_file, mask, chunk_size,
+                                in_labels)
+                n_points = sum(label_counts.values())
+                stats = las_utils.get_stats_from_counts(label_counts)
+            else:
+                with trace_utils.span('read'):
+                    pointcloud, points, labels = self._read_file(in_file,
+                                                                 in_labels)
+                labels = self.process_cloud(tilecode, points, labels, mask)
+                with trace_utils.span('write', n_points=len(labels)):
+                    self._write_output(pointcloud, labels, in_file, out_file)
+                n_points = len(labels)
+                stats = las_utils.get_stats(labels)
+            span['n_points'] = n_points
+
+        duration = time.time() - start
+        logger.info('STATISTICS\n' + stats)
+        logger.info(f'File processed in {duration:.2f}s, ' +
+                    f'output written to {out_file}.\n' + '='*20)
+
+        return {'tilecode': tilecode,
+                'in_file': in_file,
+                'out_file': out_file,
+                'n_points': n_points,
+                'duration': duration,
+                'stats': stats}
+
+    def _read_file(self, in_file, in_labels=None):
+        """
+        Read a LAS file, returns the las object, points, and labels. Labels
+        are read from the in_labels sidecar file, if given.
+        """
         pointcloud = las_utils.read_las(in_file)
         points = np.vstack((pointcloud.x, pointcloud.y, pointcloud.z)).T
 
-        if 'label' not in pointcloud.point_format.extra_dimension_names:
+        if in_labels is not None:
+            labels = las_utils.load_label_sidecar(in_labels, in_file)
+        elif 'label' not in pointcloud.point_format.extra_dimension_names:
             labels = np.zeros((len(points),), dtype='uint16')
         else:
             labels = pointcloud.label
+        return pointcloud, points, labels
 
-        labels = self.process_cloud(tilecode, points, labels, mask)
-        las_utils.label_and_save_las(pointcloud, labels, out_file)
+    def _get_output_file(self, out_file):
+        """Returns the file to which output is written for out_file."""
+        if self.output == 'labels':
+            return las_utils.get_label_sidecar_file(out_file)
+        return out_file
 
-        duration = time.time() - start
-        stats = las_utils.get_stats(labels)
-        logger.info('STATISTICS\n' + stats)
-        logger.info(f'File processed in {duration:.2f}s, ' +
-                    f'output written to {out_file}.\n' + '='*20)
+    def _write_output(self, pointcloud, labels, in_file, out_file):
+        """Write the labels, either as LAS file or as sidecar file."""
+        if self.output == 'labels':
+            las_utils.save_label_sidecar(out_file, labels, in_file)
+        else:
+            las_utils.label_and_save_las(pointcloud, labels, out_file)
+
+    def _can_stream(self):
+        """
+        Check whether all processors are point-local, such that files can be
+        processed in chunks.
+        """
+        non_local = [type(obj).__name__ for obj in self.processors
+                     if not obj.is_point_local()]
+        if len(non_local) > 0:
+            logger.warning('Processors ' + ', '.join(non_local) +
+                           ' require the full point cloud, falling back ' +
+                           'to in-memory processing.')
+            return False
+        return True
+
+    def _process_file_chunked(self, tilecode, in_file, out_file, mask,
+                              chunk_size, in_labels=None):
+        """
+        Process a single LAS file in chunks. Returns a dict with the number of
+        points for each label.
+        """
+        # Streaming requires a separate output file.
+        write_file = out_file
+        if os.path.abspath(in_file) == os.path.abspath(out_file):
+            write_file = out_file + '.tmp'
+        do_compress = out_file.lower().endswith('.laz')
+        all_labels = None
+        if in_labels is not None:
+            all_labels = las_utils.load_label_sidecar(in_labels, in_file)
+
+        label_counts = {}
+        out_labels = []
+        offset = 0
+        with laspy.open(in_file) as reader:
+            writer = None
+            if self.output == 'las':
+                header = las_utils.get_label_header(reader.header)
+                writer = laspy.open(write_file, mode='w', header=header,
+                                    do_compress=do_compress)
+            try:
+                for chunk in reader.chunk_iterator(chunk_size):
+                    n_chunk = len(chunk)
+                    logger.debug(f'Processing points {offset} to '
+                                 + f'{offset + n_chunk}.')
+                    points = np.vstack((chunk.x, chunk.y, chunk.z)).T
+                    if all_labels is not None:
+                        labels = all_labels[offset:offset + n_chunk].copy()
+                    elif 'label' in chunk.point_format.extra_dimension_names:
+                        labels = np.array(chunk.label, dtype='uint16')
+                    else:
+                        labels = np.zeros((n_chunk,), dtype='uint16')
+                    chunk_mask = None
+                    if mask is not None:
+                        chunk_mask = mask[offset:offset + n_chunk].copy()
+                    labels = self.process_cloud(tilecode, points, labels,
+                                                chunk_mask)
+                    if writer is None:
+                        out_labels.append(labels)
+                    else:
+                        writer.write_points(
+                            las_utils.label_points(chunk, labels, header))
+                    for label, cnt in zip(*np.unique(labels,
+                                                     return_counts=True)):
+                        label_counts[label] = label_counts.get(label, 0) + cnt
+                    offset += n_chunk
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        if writer is None:
+            las_utils.save_label_sidecar(
+                out_file, np.concatenate(out_labels or [np.zeros(0)]),
+                in_file)
+        elif write_file != out_file:
+            os.replace(write_file, out_file)
+        return label_counts
+
+    def _get_out_file(self, file, out_folder, in_prefix, out_prefix, suffix):
+        """Determine the output file name for a given input file."""
+        filename, extension = os.path.splitext(file.name)
+        if in_prefix and out_prefix:
+            filename = filename.replace(in_prefix, out_prefix)
+        elif out_prefix:
+            filename = out_prefix + filename
+        return os.path.join(out_folder, filename + suffix + extension)
 
     def process_folder(self, in_folder, out_folder=None, in_prefix='',
-                       out_prefix='', suffix='', hide_progress=False):
+                       out_prefix='', suffix='', hide_progress=False,
+                       workers=1, resume=False, manifest=True,
+                       use_checksum=False, chunk_size=None, overlap_io=False,
+                       in_labels_folder=None):
         """
         Process a folder of LAS files and save each processed file.
 
@@ -156,6 +501,49 @@ class Pipeline:
             Suffix to add to the filename of processed files. A value of None
             indicates that the same filename is kept; when out_folder=None this
             means each file will be overwritten.
+        hide_progress : bool (default: False)
+            Hide the progress bar.
+        workers : int (default: 1)
+            Number of worker processes. With workers > 1 the files are
+            distributed over a process pool. Each worker receives its own copy
+            of the pipeline (including AHNReader and BGT data) once, which is
+            re-used for all files it processes. Log records are passed back to
+            the loggers of the parent process. Workers are started with the
+            'spawn' method, so scripts should guard their entry point with
+            `if __name__ == '__main__'`.
+        resume : bool (default: False)
+            Whether to resume an earlier run, i.e. skip files that are
+            recorded in the manifest as processed with the same configuration,
+            have not changed since, and for which the output still exists.
+        manifest : bool (default: True)
+            Whether to record processed files in a manifest (SQLite database)
+            in the output folder. Required for `resume`.
+        use_checksum : bool (default: False)
+            Whether the manifest compares input files by content (sha1
+            checksum) in addition to size and modification time, see
+            RunManifest.
+        chunk_size : int (default: None)
+            Optional, process files in chunks of this number of points (see
+            `process_file`).
+        overlap_io : bool (default: False)
+            Whether to overlap reading and writing with processing. A reader
+            thread decodes the next file and a writer thread encodes the
+            previous file while the current file is being processed. The
+            queues between the stages are bounded (see IO_QUEUE_SIZE), which
+            caps the number of point clouds in memory. The time each stage
+            spent working and blocked is logged and stored in
+            `self.stage_timings`. Cannot be combined with workers > 1 or
+            chunk_size.
+        in_labels_folder : str or Path (default: None)
+            Optional, a folder with label sidecar files of an earlier run
+            with the same prefixes and suffix (i.e. with output='labels').
+            Existing labels are read from these files instead of from the
+            point clouds.
+
+        Returns
+        -------
+        A list with the statistics dict for each processed file (see
+        `process_file`), in order of completion.
         """
         if not os.path.isdir(in_folder):
             logger.error('The input path specified does not exist')
@@ -168,6 +556,10 @@ class Pipeline:
             pathlib.Path(out_folder).mkdir(parents=True, exist_ok=True)
         if suffix is None:
             suffix = ''
+        if overlap_io and (workers > 1 or chunk_size is not None):
+            logger.error('overlap_io cannot be combined with workers > 1 ' +
+                         'or chunk_size.')
+            raise ValueError
 
         logger.info('===== PIPELINE =====' +
                     f'Processing folder {in_folder}, ' +
@@ -176,17 +568,381 @@ class Pipeline:
         files = [f for f in in_folder.glob('*')
                  if f.name.endswith(self.FILE_TYPES)
                  and f.name.startswith(in_prefix)]
-        files_tqdm = tqdm(files, unit="file", disable=hide_progress)
         logger.debug(f'{len(files)} files found.')
+        jobs = [(file.as_posix(),
+                 self._get_output_file(
+                        self._get_out_file(file, out_folder, in_prefix,
+                                           out_prefix, suffix)))
+                for file in files]
+        in_labels = {}
+        if in_labels_folder is not None:
+            for file in files:
+                label_file = os.path.join(
+                    in_labels_folder,
+                    las_utils.get_label_sidecar_file(self._get_out_file(
+                        file, '', in_prefix, out_prefix, suffix)))
+                if os.path.isfile(label_file):
+                    in_labels[file.as_posix()] = label_file
+                else:
+                    logger.warning(f'No label sidecar found for {file}.')
+
+        run_manifest = None
+        config_hashes = {}
+        if manifest or resume:
+            run_manifest = RunManifest(
+                            os.path.join(out_folder, self.MANIFEST_FILE),
+                            use_checksum=use_checksum)
+            # The hash of each file includes its AHN data files.
+            config_hashes = {
+                in_file: self.get_config_hash(
+                            las_utils.get_tilecode_from_filename(in_file))
+                for (in_file, _) in jobs}
+        if resume:
+            jobs = [(in_file, out_file) for (in_file, out_file) in jobs
+                    if not run_manifest.is_done(in_file,
+                                                config_hashes[in_file],
+                                                out_file)]
+            logger.info(f'Resuming, {len(files) - len(jobs)} files are ' +
+                        'up to date.')
+
+        try:
+            if workers > 1:
+                results = self._process_files_parallel(
+                                jobs, workers, hide_progress,
+                                run_manifest, config_hashes, chunk_size,
+                                in_labels)
+            elif overlap_io:
+                results = self._process_files_overlapped(
+                                jobs, hide_progress, run_manifest,
+                                config_hashes, in_labels)
+            else:
+                results = []
+                files_tqdm = tqdm(jobs, unit="file", disable=hide_progress)
+                for in_file, out_file in files_tqdm:
+                    files_tqdm.set_postfix_str(os.path.basename(in_file))
+                    results.append(self._process_file_recorded(
+                                        in_file, out_file, run_manifest,
+                                        config_hashes.get(in_file),
+                                        chunk_size, in_labels.get(in_file)))
+        finally:
+            if run_manifest is not None:
+                run_manifest.close()
+
+        logger.info(f'Pipeline finished, {len(jobs)} processed.\n' + '='*20)
+        return results
+
+    def process_queue(self, queue_file, in_folder=None, out_folder=None,
+                      in_prefix='', out_prefix='', suffix='',
+                      chunk_size=None, heartbeat_interval=30,
+                      stale_timeout=600):
+        """
+        Process tiles from a shared job queue (see utils.queue_utils). Any
+        number of workers, on any host with access to the queue file, can run
+        this method concurrently; each tile is claimed by a single worker.
+        The queue records the timing of each tile, see
+        TileJobQueue.get_stats().
+
+        If an in_folder is given, its files are added to the queue first
+        (files already in the queue are ignored), so all workers can be
+        started with the same arguments.
+
+        Parameters
+        ----------
+        queue_file : str or Path
+            The SQLite queue file, e.g. on a shared mount.
+        in_folder : str or Path (default: None)
+           Optional, the input folder of which to add the files to the queue.
+        out_folder : str or Path (default: None)
+           The name of the output folder. If None, the output will be written
+           to the input folder.
+        in_prefix : str
+            Optional prefix to filter files in the input folder.
+        out_prefix : str
+            Optional prefix to prepend to output files, see process_folder.
+        suffix : str or None
+            Suffix to add to the filename of processed files.
+        chunk_size : int (default: None)
+            Optional, process files in chunks of this number of points (see
+            `process_file`).
+        heartbeat_interval : float (default: 30)
+            Time (in s) between heartbeats of this worker.
+        stale_timeout : float (default: 600)
+            Time (in s) without heartbeat after which a job of another worker
+            is reclaimed.
+
+        Returns
+        -------
+        A list with the statistics dict for each file processed by this
+        worker (see `process_file`).
+        """
+        job_queue = TileJobQueue(queue_file, stale_timeout=stale_timeout)
+        try:
+            if in_folder is not None:
+                in_folder = pathlib.Path(in_folder)
+                if out_folder is None:
+                    out_folder = in_folder
+                pathlib.Path(out_folder).mkdir(parents=True, exist_ok=True)
+                if suffix is None:
+                    suffix = ''
+                jobs = [(file.as_posix(),
+                         self._get_output_file(
+                            self._get_out_file(file, out_folder, in_prefix,
+                                               out_prefix, suffix)))
+                        for file in sorted(in_folder.glob('*'))
+                        if file.name.endswith(self.FILE_TYPES)
+                        and file.name.startswith(in_prefix)]
+                n_added = job_queue.add_jobs(jobs)
+                logger.info(f'{n_added} files added to queue {queue_file}.')
+
+            def _process(in_file, out_file):
+                return self.process_file(in_file, out_file,
+                                         chunk_size=chunk_size)
+
+            results = run_worker(job_queue, _process,
+                                 heartbeat_interval=heartbeat_interval)
+            logger.info(f'Queue status: {job_queue.get_status_counts()}.')
+        finally:
+            job_queue.close()
+        return results
+
+    def _process_file_recorded(self, in_file, out_file, run_manifest=None,
+                               config_hash=None, chunk_size=None,
+                               in_labels=None):
+        """Process a single file and record the result in the manifest."""
+        if run_manifest is None:
+            return self.process_file(in_file, out_file,
+                                     chunk_size=chunk_size,
+                                     in_labels=in_labels)
+        run_manifest.mark_started(in_file, config_hash, out_file)
+        try:
+            result = self.process_file(in_file, out_file,
+                                       chunk_size=chunk_size,
+                                       in_labels=in_labels)
+        except Exception:
+            run_manifest.mark_failed(in_file, config_hash, out_file)
+            raise
+        self._record_result(run_manifest, config_hash, in_file, out_file,
+                            result)
+        return result
+
+    def _record_result(self, run_manifest, config_hash, in_file, out_file,
+                       result):
+        """Record the result of processing a file in the manifest."""
+        if result is None:
+            run_manifest.mark_failed(in_file, config_hash, out_file)
+        else:
+            run_manifest.mark_done(in_file, config_hash, out_file,
+                                   n_points=result['n_points'],
+                                   duration=result['duration'])
+
+    def _process_files_parallel(self, jobs, workers, hide_progress=False,
+                                run_manifest=None, config_hashes={},
+                                chunk_size=None, in_labels={}):
+        """
+        Process a list of (in_file, out_file) jobs using a pool of worker
+        processes. Each worker is initialised with a copy of this pipeline.
+        The config_hashes map each in_file to its hash in the manifest.
+        """
+        logger.info(f'Distributing {len(jobs)} files over {workers} workers.')
+        results = []
+        files_tqdm = tqdm(total=len(jobs), unit="file", disable=hide_progress)
+        # Worker processes are spawned rather than forked: forking a process
+        # in which the (multi-threaded) LAZ decompressor was already used can
+        # deadlock the workers.
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=mp.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(self, trace_utils.is_tracing())
+                                 ) as executor:
+            futures = {}
+            for in_file, out_file in jobs:
+                if run_manifest is not None:
+                    run_manifest.mark_started(in_file,
+                                              config_hashes[in_file],
+                                              out_file)
+                future = executor.submit(_process_file_worker, in_file,
+                                         out_file, chunk_size,
+                                         in_labels.get(in_file))
+                futures[future] = (in_file, out_file)
+            for future in as_completed(futures):
+                in_file, out_file = futures[future]
+                try:
+                    result, records, events = future.result()
+                except Exception:
+                    if run_manifest is not None:
+                        run_manifest.mark_failed(in_file,
+                                                 config_hashes[in_file],
+                                                 out_file)
+                    raise
+                _handle_records(records)
+                trace_utils.add_events(events)
+                if run_manifest is not None:
+                    self._record_result(run_manifest, config_hashes[in_file],
+                                        in_file, out_file, result)
+                results.append(result)
+                files_tqdm.set_postfix_str(os.path.basename(in_file))
+                files_tqdm.update(1)
+        files_tqdm.close()
+        return results
+
+    def _process_files_overlapped(self, jobs, hide_progress=False,
+                                  run_manifest=None, config_hashes={},
+                                  in_labels={}):
+        """
+        Process a list of (in_file, out_file) jobs with overlapping I/O. A
+        reader thread and a writer thread are connected to the processing
+        loop by bounded queues. The config_hashes map each in_file to its
+        hash in the manifest.
+        """
+        read_queue = queue.Queue(maxsize=self.IO_QUEUE_SIZE)
+        write_queue = queue.Queue(maxsize=self.IO_QUEUE_SIZE)
+        done_queue = queue.Queue()
+        stop = threading.Event()
+        timings = {stage: {'busy': 0., 'blocked': 0.}
+                   for stage in ('read', 'process', 'write')}
+
+        def _put(q, item, stage):
+            # Put an item on a queue, while keeping track of the time spent
+            # waiting. Gives up when processing was aborted.
+            start = time.time()
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            timings[stage]['blocked'] += time.time() - start
+
+        def _get(q, stage):
+            start = time.time()
+            item = q.get()
+            timings[stage]['blocked'] += time.time() - start
+            return item
+
+        def _reader():
+            for in_file, out_file in jobs:
+                if stop.is_set():
+                    break
+                start = time.time()
+                try:
+                    with trace_utils.span('read'):
+                        data = self._read_file(in_file,
+                                               in_labels.get(in_file))
+                except Exception as e:
+                    data = e
+                duration = time.time() - start
+                timings['read']['busy'] += duration
+                _put(read_queue, (in_file, out_file, data, duration), 'read')
+            _put(read_queue, None, 'read')
+
+        def _writer():
+            while True:
+                item = _get(write_queue, 'write')
+                if item is None:
+                    break
+                if stop.is_set():
+                    continue
+                (in_file, out_file, pointcloud, labels, tilecode,
+                 duration) = item
+                start = time.time()
+                try:
+                    with trace_utils.span('write', n_points=len(labels)):
+                        self._write_output(pointcloud, labels, in_file,
+                                           out_file)
+                except Exception as e:
+                    done_queue.put((in_file, out_file, e))
+                    continue
+                write_duration = time.time() - start
+                timings['write']['busy'] += write_duration
+                duration += write_duration
+                stats = las_utils.get_stats(labels)
+                logger.info('STATISTICS\n' + stats)
+                logger.info(f'File processed in {duration:.2f}s, ' +
+                            f'output written to {out_file}.\n' + '='*20)
+                done_queue.put((in_file, out_file,
+                                {'tilecode': tilecode,
+                                 'in_file': in_file,
+                                 'out_file': out_file,
+                                 'n_points': len(labels),
+                                 'duration': duration,
+                                 'stats': stats}))
+
+        results = []
+        files_tqdm = tqdm(total=len(jobs), unit="file", disable=hide_progress)
+
+        def _collect():
+            # Collect finished files from the writer thread.
+            while True:
+                try:
+                    in_file, out_file, result = done_queue.get(block=False)
+                except queue.Empty:
+                    return
+                if isinstance(result, Exception):
+                    if run_manifest is not None:
+                        run_manifest.mark_failed(in_file,
+                                                 config_hashes[in_file],
+                                                 out_file)
+                    raise result
+                if run_manifest is not None:
+                    self._record_result(run_manifest, config_hashes[in_file],
+                                        in_file, out_file, result)
+                results.append(result)
+                files_tqdm.set_postfix_str(os.path.basename(in_file))
+                files_tqdm.update(1)
+
+        reader = threading.Thread(target=_reader, daemon=True)
+        writer = threading.Thread(target=_writer, daemon=True)
+        reader.start()
+        writer.start()
+        try:
+            while True:
+                item = _get(read_queue, 'process')
+                if item is None:
+                    break
+                in_file, out_file, data, duration = item
+                config_hash = config_hashes.get(in_file)
+                if run_manifest is not None:
+                    run_manifest.mark_started(in_file, config_hash, out_file)
+                if isinstance(data, Exception):
+                    if run_manifest is not None:
+                        run_manifest.mark_failed(in_file, config_hash,
+                                                 out_file)
+                    raise data
+                logger.info(f'Processing file {in_file}.')
+                start = time.time()
+                pointcloud, points, labels = data
+                tilecode = las_utils.get_tilecode_from_filename(in_file)
+                try:
+                    with trace_utils.span('tile', tilecode=tilecode,
+                                          n_points=len(points)):
+                        labels = self.process_cloud(tilecode, points, labels)
+                except Exception:
+                    if run_manifest is not None:
+                        run_manifest.mark_failed(in_file, config_hash,
+                                                 out_file)
+                    raise
+                process_duration = time.time() - start
+                timings['process']['busy'] += process_duration
+                del points
+                _put(write_queue, (in_file, out_file, pointcloud, labels,
+                                   tilecode, duration + process_duration),
+                     'process')
+                _collect()
+            _put(write_queue, None, 'process')
+            writer.join()
+            _collect()
+        finally:
+            stop.set()
+            if writer.is_alive():
+                # Processing failed: the writer skips the files still in its
+                # queue and stops at the sentinel.
+                write_queue.put(None)
+                writer.join()
+            files_tqdm.close()
 
-        for file in files_tqdm:
-            files_tqdm.set_postfix_str(file.name)
-            filename, extension = os.path.splitext(file.name)
-            if in_prefix and out_prefix:
-                filename = filename.replace(in_prefix, out_prefix)
-            elif out_prefix:
-                filename = out_prefix + filename
-            outfile = os.path.join(out_folder, filename + suffix + extension)
-            self.process_file(file.as_posix(), outfile)
-
-        logger.info(f'Pipeline finished, {len(files)} processed.\n' + '='*20)
+        self.stage_timings = timings
+        logger.info('Stage timings: ' + ', '.join(
+                        f"{stage} {t['busy']:.2f}s busy / "
+                        + f"{t['blocked']:.2f}s blocked"
+                        for stage, t in timings.items()))
+        return results
@@ -9,13 +9,21 @@ For an example, see notebooks/1.AHN_preprocessing.ipynb
 
 import numpy as np
 import os
+import logging
+import math
+import multiprocessing as mp
 import pathlib
 import laspy
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
+from ..utils.ahn_utils import save_ahn_tile
 from ..utils.las_utils import get_bbox_from_tile_code
-from ..utils.interpolation import SpatialInterpolator
+from ..utils.interpolation import SpatialInterpolator, GridRasterizer
+
+logger = logging.getLogger(__name__)
 
 # AHN classification codes (see https://www.ahn.nl/4-classificatie)
 # AHN_ARTIFACT is 'Kunstwerk' which includes 'vlonders/steigers, bruggen en ook
@@ -26,6 +34,12 @@ AHN_BUILDING = 6
 AHN_WATER = 9
 AHN_ARTIFACT = 26
 
+# Number of AHN points read at once when streaming an AHN point cloud.
+CHUNK_SIZE = 2**20
+
+# Size (in m) of the CycloMedia tiles.
+TILE_SIZE = 50
+
 
 def clip_ahn_las_tile(ahn_cloud, las_file, out_folder='', buffer=1):
     """
@@ -127,8 +141,195 @@ def clip_ahn_las_folder(ahn_cloud, in_folder, out_folder=None, buffer=1,
                           buffer=buffer)
 
 
+def _get_buffered_tiles(x, y, tile_keys, buffer=1):
+    """
+    Find the (buffered) tiles that contain each point. A point can be part of
+    multiple tiles, since the buffers of neighbouring tiles overlap.
+
+    Parameters
+    ----------
+    x : array of floats
+        X-coordinates of the points.
+
+    y : array of floats
+        Y-coordinates of the points.
+
+    tile_keys : array of ints
+        Sorted keys of the tiles to consider, as x_index * 10000 + y_index.
+
+    buffer : int, optional (default: 1)
+        Buffer around each tile (in m).
+
+    Returns
+    -------
+    Tuple (point_idx, keys) of arrays with for each (point, tile) pair the
+    index of the point and the key of the tile.
+    """
+    point_idx = []
+    keys = []
+    # Tile tx contains x iff tx in [ceil((x-size-b)/size), floor((x+b)/size)].
+    tx_first = np.floor((x - TILE_SIZE - buffer) / TILE_SIZE).astype(int)
+    ty_first = np.floor((y - TILE_SIZE - buffer) / TILE_SIZE).astype(int)
+    n_candidates = math.ceil(2 * buffer / TILE_SIZE) + 2
+    for dx in range(n_candidates):
+        tx = tx_first + dx
+        # Same arithmetic as clip_ahn_las_tile, such that borders match.
+        in_x = ((tx * TILE_SIZE - buffer <= x)
+                & (x <= tx * TILE_SIZE + TILE_SIZE + buffer))
+        for dy in range(n_candidates):
+            ty = ty_first + dy
+            in_y = ((ty * TILE_SIZE - buffer <= y)
+                    & (y <= ty * TILE_SIZE + TILE_SIZE + buffer))
+            # Tile codes have four-digit indices; other tiles are never
+            # requested, and would not have a unique key.
+            in_range = ((tx >= 0) & (tx <= 9999) & (ty >= 0) & (ty <= 9999))
+            idx = np.where(in_x & in_y & in_range)[0]
+            key = tx[idx] * 10000 + ty[idx]
+            wanted = np.isin(key, tile_keys)
+            point_idx.append(idx[wanted])
+            keys.append(key[wanted])
+    return np.concatenate(point_idx), np.concatenate(keys)
+
+
+def _write_clipped_tile(ahn_las_file, part_file, out_file):
+    """
+    Write the raw point records in part_file (see clip_ahn_las_stream) to a
+    LAS file with the header of the AHN point cloud.
+    """
+    with laspy.open(ahn_las_file) as reader:
+        header = reader.header
+    if os.path.isfile(part_file):
+        points = np.fromfile(part_file, dtype=header.point_format.dtype())
+    else:
+        points = np.zeros((0,), dtype=header.point_format.dtype())
+
+    ahn_tile = laspy.LasData(header)
+    ahn_tile.points = laspy.PackedPointRecord(points, header.point_format)
+    ahn_tile.write(out_file)
+    return out_file
+
+
+def clip_ahn_las_stream(ahn_las_file, in_folder, out_folder=None, buffer=1,
+                        resume=False, chunk_size=CHUNK_SIZE, workers=1,
+                        tmp_folder=None, hide_progress=False):
+    """
+    Clip tiles from an AHN point cloud file to match all CycloMedia LAS tiles
+    in a given folder, and save the result using the same naming convention.
+    The result is the same as for clip_ahn_las_folder, but the AHN point cloud
+    is read only once, in chunks, such that memory use is bounded. The points
+    of each chunk are bucketed by tile and appended to a temporary part file
+    per tile, after which the tiles are written in parallel.
+
+    Parameters
+    ----------
+    ahn_las_file : Path or str
+        The AHN point cloud file. This is assumed to include the full area of
+        the given CycloMedia tiles.
+
+    in_folder : Path or str
+        The input folder (containing the point cloud tiles.)
+
+    out_folder : Path or str, optional
+        The output folder. Defaults to the input folder.
+
+    buffer : int, optional (default: 1)
+        Buffer around the CycloMedia tile (in m) to include, used for further
+        processing (e.g. interpolation).
+
+    resume : bool (default: False)
+        Whether to resume, i.e. skip existing files in the output folder. If
+        set to False, existing files will be overwritten.
+
+    chunk_size : int (default: CHUNK_SIZE)
+        Number of points to read at once.
+
+    workers : int (default: 1)
+        Number of processes used to write the tiles.
+
+    tmp_folder : Path or str, optional
+        Folder for the temporary part files, which hold the uncompressed point
+        records. Defaults to the output folder.
+
+    hide_progress : bool (default: False)
+        Hide the progress bar.
+
+    Returns
+    -------
+    List of the files written.
+    """
+    if not os.path.isdir(in_folder):
+        print('The input path specified does not exist')
+        return None
+
+    if isinstance(in_folder, str):
+        in_folder = pathlib.Path(in_folder)
+
+    if out_folder is None:
+        out_folder = in_folder
+
+    pathlib.Path(out_folder).mkdir(parents=True, exist_ok=True)
+
+    file_types = ('.LAS', '.las', '.LAZ', '.laz')
+    tile_codes = set(re.match(r'.*(\d{4}_\d{4}).*', f.name)[1]
+                     for f in in_folder.glob('filtered_*')
+                     if f.name.endswith(file_types))
+
+    if resume:
+        # Find which files have already been processed.
+        done = set(file.name[-13:-4]
+                   for file in pathlib.Path(out_folder).glob('ahn_*.laz'))
+        tile_codes = tile_codes - done
+
+    tile_codes = {int(tc[0:4]) * 10000 + int(tc[5:9]): tc
+                  for tc in tile_codes}
+    tile_keys = np.array(sorted(tile_codes), dtype=int)
+
+    if tmp_folder is None:
+        tmp_folder = out_folder
+
+    with tempfile.TemporaryDirectory(prefix='.ahn_clip_',
+                                     dir=tmp_folder) as part_folder:
+        with laspy.open(ahn_las_file) as reader:
+            n_chunks = math.ceil(reader.header.point_count / chunk_size)
+            for chunk in tqdm(reader.chunk_iterator(chunk_size),
+                              total=n_chunks, unit='chunk',
+                              disable=hide_progress):
+                point_idx, keys = _get_buffered_tiles(
+                                np.asarray(chunk.x), np.asarray(chunk.y),
+                                tile_keys, buffer=buffer)
+                # Group by tile, keeping the original order of the points.
+                order = np.lexsort((point_idx, keys))
+                point_idx = point_idx[order]
+                keys = keys[order]
+                tile_keys_chunk, starts = np.unique(keys, return_index=True)
+                for key, idx in zip(tile_keys_chunk,
+                                    np.split(point_idx, starts[1:])):
+                    part_file = os.path.join(part_folder, f'{key}.part')
+                    with open(part_file, 'ab') as f:
+                        chunk.array[idx].tofile(f)
+
+        jobs = [(ahn_las_file, os.path.join(part_folder, f'{key}.part'),
+                 os.path.join(out_folder, 'ahn_' + tile_codes[key] + '.laz'))
+                for key in tile_keys]
+        if workers > 1 and len(jobs) > 1:
+            # Worker processes are spawned rather than forked, since the LAZ
+            # decompressor was already used in this process.
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=mp.get_context('spawn')
+                                     ) as executor:
+                files = list(tqdm(executor.map(_write_clipped_tile,
+                                               *zip(*jobs)),
+                                  total=len(jobs), unit='file',
+                                  disable=hide_progress))
+        else:
+            files = [_write_clipped_tile(*job)
+                     for job in tqdm(jobs, unit='file',
+                                     disable=hide_progress)]
+    return files
+
+
 def _get_ground_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=1,
-                        power=2., fill_value=np.nan):
+                        power=2., fill_value=np.nan, backend='kdtree'):
     """
     Use inverse distance weighted interpolation (IDW) to generate a ground
     surface (grid) from a given AHN cloud.
@@ -160,6 +361,9 @@ def _get_ground_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=1,
         Fill value to use for 'empty' grid cells for which no interpolation
         could be computed.
 
+    backend : str (default: 'kdtree')
+        Neighbour search backend, either 'kdtree' or 'grid'.
+
     Returns
     -------
     2d array of interpolation values for each <y,x> grid cell.
@@ -167,21 +371,22 @@ def _get_ground_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=1,
     mask = ahn_las.classification == AHN_GROUND
 
     if np.count_nonzero(mask) <= 1:
-        return np.full(grid_x.shape, np.nan, dtype='float16')
+        return np.full(grid_x.shape, np.nan, dtype='float32')
 
     points = np.vstack((ahn_las.x, ahn_las.y, ahn_las.z)).T[mask]
     positions = np.vstack((grid_x.reshape(-1), grid_y.reshape(-1))).T
 
-    idw = SpatialInterpolator(points[:, 0:2], points[:, 2], method='idw')
+    idw = SpatialInterpolator(points[:, 0:2], points[:, 2], method='idw',
+                              backend=backend)
     ahn_gnd_grid = idw(positions, n_neighbors=n_neighbors, max_dist=max_dist,
                        power=power, fill_value=fill_value)
 
     return (np.around(ahn_gnd_grid.reshape(grid_x.shape), decimals=2)
-            .astype('float16'))
+            .astype('float32'))
 
 
 def _get_building_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=0.5,
-                          fill_value=np.nan):
+                          fill_value=np.nan, backend='kdtree'):
     """
     Use maximum-based interpolation to generate a building surface (grid) from
     a given AHN cloud.
@@ -210,6 +415,9 @@ def _get_building_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=0.5,
         Fill value to use for 'empty' grid cells for which no interpolation
         could be computed.
 
+    backend : str (default: 'kdtree')
+        Neighbour search backend, either 'kdtree' or 'grid'.
+
     Returns
     -------
     2d array of interpolation values for each <y,x> grid cell.
@@ -217,20 +425,85 @@ def _get_building_surface(ahn_las, grid_x, grid_y, n_neighbors=8, max_dist=0.5,
     mask = ahn_las.classification == AHN_BUILDING
 
     if np.count_nonzero(mask) <= 1:
-        return np.full(grid_x.shape, np.nan, dtype='float16')
+        return np.full(grid_x.shape, np.nan, dtype='float32')
 
     points = np.vstack((ahn_las.x, ahn_las.y, ahn_las.z)).T[mask]
     positions = np.vstack((grid_x.reshape(-1), grid_y.reshape(-1))).T
 
-    idw = SpatialInterpolator(points[:, 0:2], points[:, 2], method='max')
+    idw = SpatialInterpolator(points[:, 0:2], points[:, 2], method='max',
+                              backend=backend)
     ahn_bd_grid = idw(positions, n_neighbors=n_neighbors, max_dist=max_dist,
                       fill_value=fill_value)
 
     return (np.around(ahn_bd_grid.reshape(grid_x.shape), decimals=2)
-            .astype('float16'))
+            .astype('float32'))
+
+
+def _rasterize_ahn_las(ahn_las_file, grid_x, grid_y, gnd_max_dist=1,
+                       gnd_power=2., bld_max_dist=0.5, fill_value=np.nan,
+                       chunk_size=CHUNK_SIZE):
+    """
+    Generate ground and building surfaces (grids) for a given AHN point cloud
+    file in a single pass over the points, without building a k-d tree. The
+    file is read in chunks, such that memory use is bounded by the size of the
+    grid and the chunk size.
+
+    For more information see: utils.interpolation.GridRasterizer
+
+    Parameters
+    ----------
+    ahn_las_file : Path or str
+        The AHN point cloud file.
+
+    grid_x : list of floats
+        X-values for the interpolation grid.
+
+    grid_y : list of floats
+        Y-values for the interpolation grid.
+
+    gnd_max_dist : float (default: 1.0)
+        Maximum distance of points to consider for IDW of the ground surface.
+
+    gnd_power : float (default: 2.0)
+        Power to use for IDW of the ground surface.
 
+    bld_max_dist : float (default: 0.5)
+        Maximum distance of points to consider for the building surface.
 
-def process_ahn_las_tile(ahn_las_file, out_folder='', resolution=0.1):
+    fill_value : float (default: np.nan)
+        Fill value to use for 'empty' grid cells for which no interpolation
+        could be computed.
+
+    chunk_size : int (default: CHUNK_SIZE)
+        Number of points to read at once.
+
+    Returns
+    -------
+    Tuple (ground_surface, building_surface) of 2d arrays of interpolation
+    values for each <y,x> grid cell.
+    """
+    ground = GridRasterizer(grid_x[0, :], grid_y[:, 0], method='idw',
+                            max_dist=gnd_max_dist, power=gnd_power)
+    building = GridRasterizer(grid_x[0, :], grid_y[:, 0], method='max',
+                              max_dist=bld_max_dist)
+
+    with laspy.open(ahn_las_file) as reader:
+        for chunk in reader.chunk_iterator(chunk_size):
+            points = np.vstack((chunk.x, chunk.y)).T
+            z = np.asarray(chunk.z)
+            classification = np.asarray(chunk.classification)
+            gnd_mask = classification == AHN_GROUND
+            ground.add_points(points[gnd_mask], z[gnd_mask])
+            bld_mask = classification == AHN_BUILDING
+            building.add_points(points[bld_mask], z[bld_mask])
+
+    return tuple(np.around(rasterizer.get_surface(fill_value), decimals=2)
+                 .astype('float32') for rasterizer in (ground, building))
+
+
+def process_ahn_las_tile(ahn_las_file, out_folder='', resolution=0.1,
+                         engine='interpolate', backend='kdtree',
+                         chunk_size=CHUNK_SIZE):
     """
     Generate ground and building surfaces (grids) for a given AHN point cloud.
     The results are saved as .npz using the same filename convention.
@@ -246,6 +519,18 @@ def process_ahn_las_tile(ahn_las_file, out_folder='', resolution=0.1):
     resolution : float (default: 0.1)
         The resolution (in m) for the surface grids.
 
+    engine : str (default: 'interpolate')
+        Either 'interpolate' to interpolate the n nearest AHN points of each
+        grid cell, or 'raster' to scatter all AHN points to the grid cells
+        within range in a single pass over the file (see _rasterize_ahn_las).
+
+    backend : str (default: 'kdtree')
+        Neighbour search backend for the 'interpolate' engine, either
+        'kdtree' or 'grid' (see utils.interpolation.GridNeighbourIndex).
+
+    chunk_size : int (default: CHUNK_SIZE)
+        Number of points to read at once, only used by the 'raster' engine.
+
     Returns
     -------
     Path of the output file.
@@ -256,19 +541,26 @@ def process_ahn_las_tile(ahn_las_file, out_folder='', resolution=0.1):
 
     ((x_min, y_max), (x_max, y_min)) = get_bbox_from_tile_code(tile_code)
 
-    ahn_las = laspy.read(ahn_las_file)
-
     # Create a grid with 0.1m resolution
     grid_y, grid_x = np.mgrid[y_max-resolution/2:y_min:-resolution,
                               x_min+resolution/2:x_max:resolution]
 
-    ground_surface = _get_ground_surface(ahn_las, grid_x, grid_y)
-    building_surface = _get_building_surface(ahn_las, grid_x, grid_y)
+    if engine == 'interpolate':
+        ahn_las = laspy.read(ahn_las_file)
+        ground_surface = _get_ground_surface(ahn_las, grid_x, grid_y,
+                                             backend=backend)
+        building_surface = _get_building_surface(ahn_las, grid_x, grid_y,
+                                                 backend=backend)
+    elif engine == 'raster':
+        ground_surface, building_surface = _rasterize_ahn_las(
+                    ahn_las_file, grid_x, grid_y, chunk_size=chunk_size)
+    else:
+        logger.error(f'Unknown engine: {engine}.')
+        raise ValueError
 
     filename = os.path.join(out_folder, 'ahn_' + tile_code + '.npz')
-    np.savez_compressed(filename,
-                        x=grid_x[0, :],
-                        y=grid_y[:, 0],
-                        ground=ground_surface,
-                        building=building_surface)
+    save_ahn_tile(filename, {'x': grid_x[0, :],
+                             'y': grid_y[:, 0],
+                             'ground_surface': ground_surface,
+                             'building_surface': building_surface})
     return filename
@@ -0,0 +1,314 @@
+"""
+This module provides methods to pre-process raw point cloud deliveries. In
+particular, arbitrary LAS/LAZ files (e.g. multi-gigabyte strips) can be cut
+into tiles that follow the 50m tile code convention of
+utils.las_utils.get_bbox_from_tile_code, such that they can be processed by
+the Pipeline.
+"""
+
+import numpy as np
+import copy
+import logging
+import math
+import multiprocessing as mp
+import os
+import pathlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import laspy
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# Size (in m) of the tiles.
+TILE_SIZE = 50
+
+# Number of points read at once.
+CHUNK_SIZE = 2**20
+
+# Tile indices are encoded as x_index * 2**TILE_KEY_SHIFT + y_index.
+TILE_KEY_SHIFT = 32
+
+# Tile codes consist of two four-digit tile indices, see
+# utils.las_utils.get_tilecode_from_filename.
+MAX_TILE_INDEX = 9999
+
+# Number of points buffered per input file before the buffers are written to
+# the temporary part files.
+MAX_BUFFER_POINTS = 2**23
+
+
+def _get_tile_keys(x, y, buffer=0):
+    """
+    Find the (buffered) tiles that contain each point. Tiles are half-open,
+    i.e. tile (tx, ty) contains the points with tx * TILE_SIZE - buffer <= x <
+    (tx + 1) * TILE_SIZE + buffer, and likewise for y. As a result, each point
+    belongs to exactly one tile if buffer is 0.
+
+    Returns
+    -------
+    Tuple (point_idx, keys) of arrays with for each (point, tile) pair the
+    index of the point and the key of the tile, as int64 x_index *
+    2**TILE_KEY_SHIFT + y_index.
+
+    Raises
+    ------
+    ValueError
+        If a tile index does not fit the four-digit tile code convention.
+    """
+    point_idx = []
+    keys = []
+    tx_first = np.floor((x - TILE_SIZE - buffer) / TILE_SIZE).astype(int)
+    ty_first = np.floor((y - TILE_SIZE - buffer) / TILE_SIZE).astype(int)
+    n_candidates = math.ceil(2 * buffer / TILE_SIZE) + 2
+    for dx in range(n_candidates):
+        tx = tx_first + dx
+        in_x = ((tx * TILE_SIZE - buffer <= x)
+                & (x < tx * TILE_SIZE + TILE_SIZE + buffer))
+        for dy in range(n_candidates):
+            ty = ty_first + dy
+            in_y = ((ty * TILE_SIZE - buffer <= y)
+                    & (y < ty * TILE_SIZE + TILE_SIZE + buffer))
+            idx = np.where(in_x & in_y)[0]
+            outside = ((tx[idx] < 0) | (tx[idx] > MAX_TILE_INDEX)
+                       | (ty[idx] < 0) | (ty[idx] > MAX_TILE_INDEX))
+            if np.any(outside):
+                i = idx[np.argmax(outside)]
+                logger.error(f'Point ({x[i]}, {y[i]}) falls in tile '
+                             + f'({tx[i]}, {ty[i]}), which does not fit the '
+                             + 'four-digit tile code convention.')
+                raise ValueError
+            point_idx.append(idx)
+            keys.append((tx[idx].astype(np.int64) << TILE_KEY_SHIFT)
+                        + ty[idx])
+    return np.concatenate(point_idx), np.concatenate(keys)
+
+
+def _get_tile_code(key):
+    """Tile code of a tile key, e.g. (2386 << 32) + 9702 -> '2386_9702'."""
+    key = int(key)
+    tx = key >> TILE_KEY_SHIFT
+    ty = key & ((1 << TILE_KEY_SHIFT) - 1)
+    return f'{tx:04d}_{ty:04d}'
+
+
+def _convert_points(points, header):
+    """
+    Convert a chunk of points to the point format, scales and offsets of the
+    given header. The dimensions shared by both point formats are copied one
+    by one, such that e.g. bit fields are converted between the layouts of
+    the formats. Coordinates are re-quantized if the scales or offsets
+    differ.
+
+    Parameters
+    ----------
+    points : laspy ScaleAwarePointRecord
+        The chunk of points, e.g. as read by LasReader.chunk_iterator().
+
+    header : laspy LasHeader
+        The header of the output files.
+
+    Returns
+    -------
+    Structured array of point records in the point format of the header.
+
+    Raises
+    ------
+    ValueError
+        If the values of a dimension do not fit the output point format.
+    """
+    same_format = points.array.dtype == header.point_format.dtype()
+    same_scale = (np.array_equal(points.scales, header.scales)
+                  and np.array_equal(points.offsets, header.offsets))
+    if same_format and same_scale:
+        return points.array
+
+    record = laspy.PackedPointRecord(
+                np.zeros(len(points), dtype=header.point_format.dtype()),
+                header.point_format)
+    in_names = set(points.point_format.dimension_names)
+    for name in header.point_format.dimension_names:
+        if name not in in_names:
+            continue
+        if not same_scale and name in ('X', 'Y', 'Z'):
+            continue
+        try:
+            record[name] = points[name]
+        except OverflowError as e:
+            logger.error(f'Dimension {name} does not fit the output point '
+                         + f'format: {e}.')
+            raise ValueError
+    if not same_scale:
+        for i, dim in enumerate(('X', 'Y', 'Z')):
+            values = np.rint((points[dim.lower()] - header.offsets[i])
+                             / header.scales[i])
+            if len(values) and (values.min() < np.iinfo(np.int32).min
+                                or values.max() > np.iinfo(np.int32).max):
+                logger.error(f'{dim} coordinates do not fit the scale and '
+                             + 'offset of the output header.')
+                raise ValueError
+            record[dim] = values
+    return record.array
+
+
+def _bucket_las_file(file_idx, in_file, header, part_folder, buffer=0,
+                     chunk_size=CHUNK_SIZE,
+                     max_buffer_points=MAX_BUFFER_POINTS):
+    """
+    Read a LAS/LAZ file in chunks and append the points of each tile to the
+    part file part_folder/<tile key>_<file_idx>.part. Points are buffered per
+    tile, and the buffers are written once they hold max_buffer_points in
+    total.
+
+    Returns
+    -------
+    Dictionary with the number of points per tile key.
+    """
+    buffers = {}
+    n_buffered = 0
+    counts = {}
+
+    def flush():
+        for key, arrays in buffers.items():
+            part_file = os.path.join(part_folder, f'{key}_{file_idx}.part')
+            with open(part_file, 'ab') as f:
+                for array in arrays:
+                    array.tofile(f)
+        buffers.clear()
+
+    with laspy.open(in_file) as reader:
+        dropped = (set(reader.header.point_format.dimension_names)
+                   - set(header.point_format.dimension_names))
+        if len(dropped) > 0:
+            logger.warning(f'Dimensions {sorted(dropped)} of {in_file} are '
+                           + 'not part of the output point format.')
+        for chunk in reader.chunk_iterator(chunk_size):
+            array = _convert_points(chunk, header)
+            point_idx, keys = _get_tile_keys(np.asarray(chunk.x),
+                                             np.asarray(chunk.y), buffer)
+            # Group by tile, keeping the original order of the points.
+            order = np.lexsort((point_idx, keys))
+            point_idx = point_idx[order]
+            keys = keys[order]
+            tile_keys, starts = np.unique(keys, return_index=True)
+            for key, idx in zip(tile_keys, np.split(point_idx, starts[1:])):
+                buffers.setdefault(key, []).append(array[idx])
+                counts[key] = counts.get(key, 0) + len(idx)
+            n_buffered += len(point_idx)
+            if n_buffered >= max_buffer_points:
+                flush()
+                n_buffered = 0
+    flush()
+    return counts
+
+
+def _write_tile(header, part_files, out_file, chunk_size=CHUNK_SIZE):
+    """Write the point records in the part files to a single LAS file."""
+    header = copy.deepcopy(header)
+    dtype = header.point_format.dtype()
+    with laspy.open(out_file, mode='w', header=header) as writer:
+        for part_file in part_files:
+            n_points = os.path.getsize(part_file) // dtype.itemsize
+            for start in range(0, n_points, chunk_size):
+                array = np.fromfile(part_file, dtype=dtype, count=chunk_size,
+                                    offset=start * dtype.itemsize)
+                writer.write_points(
+                    laspy.PackedPointRecord(array, header.point_format))
+    return out_file
+
+
+def tile_las_files(in_files, out_folder, buffer=0, prefix='filtered_',
+                   chunk_size=CHUNK_SIZE, max_buffer_points=MAX_BUFFER_POINTS,
+                   workers=1, tmp_folder=None, hide_progress=False):
+    """
+    Cut arbitrary LAS/LAZ files into tiles of 50x50m, following the tile code
+    convention of utils.las_utils.get_bbox_from_tile_code, and save each tile
+    as <out_folder>/<prefix><tile_code>.laz.
+
+    The input files are read in chunks by a pool of processes, one file per
+    process. The points of each chunk are buffered per tile and appended to
+    temporary part files, such that memory use is bounded. Finally, the part
+    files of each tile are merged into the output tiles, again in parallel.
+    Points of all input files are converted to the point format, scales and
+    offsets of the first input file.
+
+    Parameters
+    ----------
+    in_files : list of Path or str
+        The input point cloud files.
+
+    out_folder : Path or str
+        The output folder.
+
+    buffer : float (default: 0)
+        Buffer (in m) around each tile to include. Without a buffer each
+        point is written to exactly one tile.
+
+    prefix : str (default: 'filtered_')
+        Prefix of the output files.
+
+    chunk_size : int (default: CHUNK_SIZE)
+        Number of points to read at once.
+
+    max_buffer_points : int (default: MAX_BUFFER_POINTS)
+        Number of points buffered in memory per process.
+
+    workers : int (default: 1)
+        Number of processes.
+
+    tmp_folder : Path or str, optional
+        Folder for the temporary part files, which hold the uncompressed point
+        records. Defaults to the output folder.
+
+    hide_progress : bool (default: False)
+        Hide the progress bar.
+
+    Returns
+    -------
+    List of the files written.
+    """
+    in_files = [str(f) for f in in_files]
+    if len(in_files) == 0:
+        logger.error('No input files given.')
+        raise ValueError
+
+    pathlib.Path(out_folder).mkdir(parents=True, exist_ok=True)
+    if tmp_folder is None:
+        tmp_folder = out_folder
+
+    with laspy.open(in_files[0]) as reader:
+        header = copy.deepcopy(reader.header)
+
+    with tempfile.TemporaryDirectory(prefix='.las_tiler_',
+                                     dir=tmp_folder) as part_folder:
+        bucket_args = [(file_idx, in_file, header, part_folder, buffer,
+                        chunk_size, max_buffer_points)
+                       for file_idx, in_file in enumerate(in_files)]
+        # Worker processes are spawned rather than forked: forking a process
+        # in which the (multi-threaded) LAZ decompressor was already used can
+        # deadlock the workers.
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=mp.get_context('spawn')
+                                 ) as executor:
+            counts = list(tqdm(executor.map(_bucket_las_file,
+                                            *zip(*bucket_args)),
+                               total=len(in_files), unit='file',
+                               disable=hide_progress))
+
+            # Collect the part files of each tile, in order of the input.
+            part_files = {}
+            for file_idx, file_counts in enumerate(counts):
+                for key in file_counts:
+                    part_files.setdefault(key, []).append(
+                        os.path.join(part_folder, f'{key}_{file_idx}.part'))
+            write_args = [(header, part_files[key],
+                           os.path.join(out_folder, prefix
+                                        + _get_tile_code(key) + '.laz'),
+                           chunk_size)
+                          for key in sorted(part_files)]
+            if len(write_args) == 0:
+                return []
+            files = list(tqdm(executor.map(_write_tile, *zip(*write_args)),
+                              total=len(write_args), unit='tile',
+                              disable=hide_progress))
+    return files
@@ -8,6 +8,8 @@ import cccorelib
 
 from ..abstract_processor import AbstractProcessor
 from ..utils.labels import Labels
+from ..utils.manifest_utils import get_simple_attributes
+from ..utils import trace_utils
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +44,10 @@ class LabelConnectedComp(AbstractProcessor):
         self.exclude_labels = exclude_labels
         self.debug = set_debug
 
+    def get_config(self):
+        """Returns a dict describing the configuration of this processor."""
+        return get_simple_attributes(self, exclude=('labels_sf_idx',))
+
     def _set_mask(self):
         """ Configure the points that we want to perform region growing on. """
         for exclude_label in self.exclude_labels:
@@ -71,9 +77,12 @@ class LabelConnectedComp(AbstractProcessor):
 
     def _label_connected_comp(self):
         """ Perform the clustering algorithm: Label Connected Components. """
-        (cccorelib
-         .AutoSegmentationTools
-         .labelConnectedComponents(self.point_cloud, level=self.octree_level))
+        with trace_utils.span('LCC', octree_level=self.octree_level,
+                              n_points=np.count_nonzero(self.mask)):
+            (cccorelib
+             .AutoSegmentationTools
+             .labelConnectedComponents(self.point_cloud,
+                                       level=self.octree_level))
 
         # Get the scalar field with labels and points coords as numpy array
         labels_sf = self.point_cloud.getScalarField(self.labels_sf_idx)
@@ -4,6 +4,7 @@ import logging
 from ..abstract_processor import AbstractProcessor
 from ..region_growing import LabelConnectedComp
 from ..utils.labels import Labels
+from ..utils import trace_utils
 
 logger = logging.getLogger(__name__)
 
@@ -128,7 +129,8 @@ class LayerLCC(AbstractProcessor):
 
         for i, layer in enumerate(self.params):
             logger.debug(f'Layer {i}: {layer}')
-            layer_mask = layer_mask | self._filter_layer(
+            with trace_utils.span('layer', layer=i):
+                layer_mask = layer_mask | self._filter_layer(
                                             points[mask_copy, :], points_z,
                                             labels_copy, layer)
             labels_copy[layer_mask] = self.label
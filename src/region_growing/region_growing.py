@@ -5,6 +5,7 @@ import logging
 
 from ..utils.math_utils import angle_between
 from ..utils.labels import Labels
+from ..utils import trace_utils
 from ..abstract_processor import AbstractProcessor
 
 logger = logging.getLogger(__name__)
@@ -163,6 +164,9 @@ class RegionGrowing(AbstractProcessor):
                     f'(label={self.label}, {Labels.get_str(self.label)}).')
         self._set_mask(labels)
         self._convert_input_cloud(points)
-        label_mask = self._region_growing()
+        with trace_utils.span('region growing',
+                              n_points=len(self.mask_indices),
+                              n_seeds=len(self.list_of_seed_ids)):
+            label_mask = self._region_growing()
 
         return label_mask
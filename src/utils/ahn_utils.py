@@ -4,24 +4,47 @@ import numpy as np
 import pandas as pd
 import zarr
 import copy
-import warnings
+import json
+import math
 import os
 import logging
+import threading
+import zipfile
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from tifffile import TiffFile, imread
 from pathlib import Path
 from scipy import interpolate
-from scipy.ndimage import measurements, generic_filter
+from scipy.ndimage import measurements, find_objects
+try:
+    from scipy.spatial import QhullError
+except ImportError:
+    # Older scipy releases only expose QhullError in scipy.spatial.qhull.
+    from scipy.spatial.qhull import QhullError
 from scipy.ndimage.morphology import binary_dilation
 
+from ..utils.cache_utils import LRUCache
 from ..utils.las_utils import get_bbox_from_tile_code
-from ..utils.interpolation import FastGridInterpolator
+from ..utils.interpolation import FastGridInterpolator, SpatialInterpolator
+from ..utils.manifest_utils import (get_simple_attributes, get_config_hash,
+                                    get_file_signature)
+from ..utils import trace_utils
 
 logger = logging.getLogger(__name__)
 
 
 class AHNReader(ABC):
-    """Abstract class for reading AHN data."""
+    """
+    Abstract class for reading AHN data.
+
+    When caching is enabled, AHN tiles and the grid cell index of the points
+    of a tile (see cache_interpolator) are kept in an LRU cache, keyed by
+    (tilecode, 'ahn_tile') and (tilecode, 'grid_index'). The least recently
+    used entries are evicted when the cache exceeds its memory budget.
+    """
+
+    # Default memory budget of the cache, in bytes.
+    CACHE_BYTES = 2**30
 
     @property
     @classmethod
@@ -29,11 +52,13 @@ class AHNReader(ABC):
     def NAME(cls):
         return NotImplementedError
 
-    def __init__(self, data_folder, caching):
+    def __init__(self, data_folder, caching, cache_bytes=CACHE_BYTES):
         super().__init__()
         self.path = Path(data_folder)
+        # Guards the cache when processors run concurrently.
+        self._lock = threading.RLock()
+        self.cache = LRUCache(cache_bytes)
         self.set_caching(caching)
-        self._clear_cache()
         if not self.path.exists():
             print('Input folder does not exist.')
             raise ValueError
@@ -42,6 +67,16 @@ class AHNReader(ABC):
     def filter_tile(self, tilecode):
         pass
 
+    @abstractmethod
+    def get_tile_sources(self, tilecode):
+        """
+        Returns a list with the signature (see
+        manifest_utils.get_file_signature) of each file from which the AHN
+        data for the given tile-code is read, such that changes to the AHN
+        data can be detected.
+        """
+        pass
+
     def set_caching(self, state):
         self.caching = state
         if not self.caching:
@@ -51,22 +86,59 @@ class AHNReader(ABC):
             logger.debug('Caching enabled.')
 
     def _clear_cache(self):
-        self.cache = {'tilecode': ''}
+        self.cache.clear()
+
+    def evict(self, tilecode=None, surface=None):
+        """
+        Evict entries from the cache: all entries for the given tilecode
+        and / or key ('ahn_tile' for the AHN tile itself, 'grid_index' for
+        the grid cell index), or all entries if neither is given. Returns the
+        number of evicted entries.
+        """
+        return self.cache.evict_where(
+                    lambda key: ((tilecode is None or key[0] == tilecode)
+                                 and (surface is None or key[1] == surface)))
+
+    def get_cache_info(self):
+        """
+        Returns a dict with cache statistics: the number of hits and misses,
+        the number of entries, and the memory used and budget in bytes.
+        """
+        return self.cache.get_info()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def get_config(self):
+        """Returns a dict describing the configuration of this reader."""
+        config = get_simple_attributes(self, exclude=('cache', 'caching'))
+        config['path'] = self.path.as_posix()
+        return config
 
     def cache_interpolator(self, tilecode, points, surface='ground_surface'):
-        logger.info(f'Caching {surface} for tile {tilecode}.')
-        self.set_caching(True)
-        if self.cache['tilecode'] != tilecode:
-            # Clear cache.
-            self._clear_cache()
-        ahn_tile = self.filter_tile(tilecode)
-        if surface not in ahn_tile:
-            logger.error(f'Unknown surface: {surface}.')
-            raise ValueError
-        fast_z = FastGridInterpolator(
-            ahn_tile['x'], ahn_tile['y'], ahn_tile[surface])
-        self.cache['tilecode'] = tilecode
-        self.cache[surface] = fast_z(points)
+        """
+        Compute the grid cell of each point once for the given tile, as flat
+        int32 index. Subsequent calls to interpolate() with a mask for this
+        tile then reduce to a single lookup, for any surface.
+        """
+        logger.info(f'Caching grid index for tile {tilecode}.')
+        with self._lock:
+            self.set_caching(True)
+            ahn_tile = self.filter_tile(tilecode)
+            if surface not in ahn_tile:
+                logger.error(f'Unknown surface: {surface}.')
+                raise ValueError
+            fast_z = FastGridInterpolator(
+                ahn_tile['x'], ahn_tile['y'], ahn_tile[surface])
+            with trace_utils.span('AHN grid index', n_points=len(points)):
+                self.cache.put((tilecode, 'grid_index'),
+                               fast_z.get_indices(points))
 
     def interpolate(self, tilecode, points=None, mask=None,
                     surface='ground_surface'):
@@ -74,18 +146,26 @@ class AHNReader(ABC):
             logger.error('Must provide either points or mask.')
             raise ValueError
         if self.caching and mask is not None:
-            # Try retrieving cache.
-            if self.cache['tilecode'] == tilecode:
-                if surface in self.cache:
-                    return self.cache[surface][mask]
-                else:
-                    logger.debug(
-                        f'Surface {surface} not in cache for tile {tilecode}.')
+            # Try retrieving the cached grid index. It should belong to the
+            # same point cloud as the mask.
+            grid_index = self.cache.get((tilecode, 'grid_index'))
+            if grid_index is not None and len(grid_index) == len(mask):
+                ahn_tile = self.filter_tile(tilecode)
+                if surface not in ahn_tile:
+                    logger.error(f'Unknown surface: {surface}.')
+                    raise ValueError
+                indices = grid_index[mask]
+                values = ahn_tile[surface].ravel()[indices]
+                # Points outside the AHN grid.
+                values[indices < 0] = np.nan
+                return values
+            else:
+                logger.debug(f'Grid index not in cache for tile {tilecode}.')
         elif self.caching:
             logger.debug('Caching enabled but no mask provided.')
 
         # No cache, fall back to FastGridInterpolator.
-        if self.cache['tilecode'] != tilecode and points is None:
+        if points is None:
             logger.error(
                 f'Tile {tilecode} not cached and no points provided.')
             raise ValueError
@@ -96,7 +176,9 @@ class AHNReader(ABC):
             raise ValueError
         fast_z = FastGridInterpolator(
             ahn_tile['x'], ahn_tile['y'], ahn_tile[surface])
-        return fast_z(points)
+        with trace_utils.span('AHN interpolate', surface=surface,
+                              n_points=len(points)):
+            return fast_z(points)
 
 
 class NPZReader(AHNReader):
@@ -109,13 +191,16 @@ class NPZReader(AHNReader):
     data_folder : str or Path
         Folder containing the .npz files.
     caching : bool (default: True)
-        Enable caching of the current ahn tile and interpolation data.
+        Enable caching of ahn tiles and interpolation data.
+    cache_bytes : int (default: 1GiB)
+        Memory budget of the cache, in bytes.
     """
 
     NAME = 'npz'
 
-    def __init__(self, data_folder, caching=True):
-        super().__init__(data_folder, caching)
+    def __init__(self, data_folder, caching=True,
+                 cache_bytes=AHNReader.CACHE_BYTES):
+        super().__init__(data_folder, caching, cache_bytes)
 
     def filter_tile(self, tilecode):
         """
@@ -123,14 +208,25 @@ class NPZReader(AHNReader):
         CycloMedia tile-code. TODO also implement geotiff?
         """
         if self.caching:
-            if self.cache['tilecode'] != tilecode:
-                self._clear_cache()
-                self.cache['tilecode'] = tilecode
-            if 'ahn_tile' not in self.cache:
-                self.cache['ahn_tile'] = load_ahn_tile(
-                        os.path.join(self.path, 'ahn_' + tilecode + '.npz'))
-            return self.cache['ahn_tile']
+            with self._lock:
+                ahn_tile = self.cache.get((tilecode, 'ahn_tile'))
+                if ahn_tile is None:
+                    ahn_tile = self._load_tile(tilecode)
+                    self.cache.put((tilecode, 'ahn_tile'), ahn_tile)
+                return ahn_tile
         else:
+            return self._load_tile(tilecode)
+
+    def get_tile_sources(self, tilecode):
+        """Returns the signature of the .npz file for the given tile-code."""
+        ahn_file = os.path.join(self.path, 'ahn_' + tilecode + '.npz')
+        if not os.path.isfile(ahn_file):
+            return []
+        return [get_file_signature(ahn_file)]
+
+    def _load_tile(self, tilecode):
+        """Load the .npz file for the given tile-code."""
+        with trace_utils.span('AHN load', tilecode=tilecode):
             return load_ahn_tile(
                         os.path.join(self.path, 'ahn_' + tilecode + '.npz'))
 
@@ -145,106 +241,359 @@ class GeoTIFFReader(AHNReader):
     data_folder : str or Path
         Folder containing the GeoTIFF files.
     caching : bool (default: True)
-        Enable caching of the current ahn tile and interpolation data.
+        Enable caching of ahn tiles and interpolation data.
+    cache_bytes : int (default: 1GiB)
+        Memory budget of the cache, in bytes.
     fill_gaps : bool (default: True)
         Whether to fill gaps in the AHN data. Only used when method='geotiff'.
     max_gap_size : int (default: 50)
         Max gap size for gap filling. Only used when method='geotiff'.
+    fill_method : str (default: 'cubic')
+        Interpolation method for gap filling, see fill_gaps().
     smoothen : bool (default: True)
         Whether to smoothen edges in the AHN data. Only used when
         method='geotiff'.
     smooth_thickness : int (default: 1)
         Thickness for edge smoothening. Only used when method='geotiff'.
+    chunk_cache_bytes : int (default: 256MiB)
+        Memory budget, in bytes, of the cache of decoded GeoTIFF strips or
+        tiles. The cache is shared by all tiles read from the same sheet.
+    decode_workers : int (default: None)
+        Number of threads used to decode GeoTIFF strips or tiles. Defaults to
+        the number of CPUs.
+    index_file : str or Path (default: None)
+        File in which the index of GeoTIFF sheets is stored. Defaults to
+        INDEX_FILE in the data folder.
+    cache_dir : str or Path (default: None)
+        Optional folder in which processed tiles (after gap filling and
+        smoothening) are stored, in the .npz format read by NPZReader. Tiles
+        are stored in a subfolder per set of processing parameters, and are
+        re-used by later runs and other processes as long as the GeoTIFF
+        sheet is unchanged.
+
+    NOTE: Only the strips or tiles of a GeoTIFF sheet that intersect the
+    requested area are decoded. Opened sheets are kept open until close() is
+    called.
+
+    NOTE: The bounding boxes of the GeoTIFF sheets are stored in an index
+    file, such that only new or modified sheets have to be opened when the
+    reader is constructed.
     """
 
     RESOLUTION = 0.5
     NAME = 'geotiff'
+    CHUNK_CACHE_BYTES = 2**28
+    INDEX_FILE = 'ahn_geotiff_index.json'
+    INDEX_VERSION = 1
 
     def __init__(self, data_folder, caching=True,
-                 fill_gaps=True, max_gap_size=50,
-                 smoothen=True, smooth_thickness=1):
-        super().__init__(data_folder, caching)
+                 fill_gaps=True, max_gap_size=50, fill_method='cubic',
+                 smoothen=True, smooth_thickness=1,
+                 cache_bytes=AHNReader.CACHE_BYTES,
+                 chunk_cache_bytes=CHUNK_CACHE_BYTES, decode_workers=None,
+                 index_file=None, cache_dir=None):
+        super().__init__(data_folder, caching, cache_bytes)
         self.fill_gaps = fill_gaps
         self.max_gap_size = max_gap_size
+        self.fill_method = fill_method
         self.smoothen = smoothen
         self.smooth_thickness = smooth_thickness
-        self.ahn_df = (pd.DataFrame(columns=['Filename', 'Path',
-                                             'Xmin', 'Ymax', 'Xmax', 'Ymin'])
-                       .set_index('Filename'))
+        self.chunk_cache_bytes = chunk_cache_bytes
+        self.decode_workers = decode_workers
+        if index_file is None:
+            index_file = self.path / self.INDEX_FILE
+        self.index_file = Path(index_file).as_posix()
+        self.cache_dir = (Path(cache_dir).as_posix()
+                          if cache_dir is not None else None)
+        # Open zarr arrays of the GeoTIFF sheets, by path.
+        self._sheets = {}
         self._readfolder()
 
+    def _read_sheet_info(self, file):
+        """
+        Read the bounding box of a GeoTIFF sheet. Returns a dict with the
+        bounding box, or with an 'error' message if the file is not usable.
+        """
+        with TiffFile(file.as_posix()) as tiff:
+            if not tiff.is_geotiff:
+                return {'error': 'is not a GeoTIFF file'}
+            elif ((tiff.geotiff_metadata['ModelPixelScale'][0]
+                   != self.RESOLUTION)
+                  or (tiff.geotiff_metadata['ModelPixelScale'][1]
+                      != self.RESOLUTION)):
+                return {'error': 'has incorrect resolution'}
+            (x, y) = tiff.geotiff_metadata['ModelTiepoint'][3:5]
+            (h, w) = tiff.pages[0].shape
+        x_min = x - self.RESOLUTION / 2
+        y_max = y + self.RESOLUTION / 2
+        x_max = x_min + w * self.RESOLUTION
+        y_min = y_max - h * self.RESOLUTION
+        return {'Xmin': x_min, 'Ymax': y_max, 'Xmax': x_max, 'Ymin': y_min}
+
+    def _load_index(self):
+        """Load the stored sheet index, or return an empty index."""
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if (index.get('version') != self.INDEX_VERSION
+                or index.get('resolution') != self.RESOLUTION):
+            return {}
+        return index['sheets']
+
+    def _save_index(self, sheets):
+        """Save the sheet index, written atomically."""
+        tmp_file = self.index_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': self.INDEX_VERSION,
+                           'resolution': self.RESOLUTION,
+                           'sheets': sheets}, f, indent=1)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            logger.warning(f'Could not save GeoTIFF index: {e}')
+
     def _readfolder(self):
         """
         Read the contents of the folder. Internally, a DataFrame is created
         detailing the bounding boxes of each available file to help with the
-        area extraction.
+        area extraction. Only sheets that are new or modified since the index
+        was stored are opened.
         """
         file_match = "M_*.TIF"
 
+        stored = self._load_index()
+        sheets = {}
+        n_scanned = 0
         for file in self.path.glob(file_match):
-            with TiffFile(file.as_posix()) as tiff:
-                if not tiff.is_geotiff:
-                    print(f'{file.as_posix()} is not a GeoTIFF file.')
-                elif ((tiff.geotiff_metadata['ModelPixelScale'][0]
-                       != self.RESOLUTION)
-                      or (tiff.geotiff_metadata['ModelPixelScale'][1]
-                          != self.RESOLUTION)):
-                    print(f'{file.as_posix()} has incorrect resolution.')
-                else:
-                    (x, y) = tiff.geotiff_metadata['ModelTiepoint'][3:5]
-                    (h, w) = tiff.pages[0].shape
-                    x_min = x - self.RESOLUTION / 2
-                    y_max = y + self.RESOLUTION / 2
-                    x_max = x_min + w * self.RESOLUTION
-                    y_min = y_max - h * self.RESOLUTION
-                    self.ahn_df.loc[file.name] = [file.as_posix(),
-                                                  x_min, y_max, x_max, y_min]
+            stat = file.stat()
+            info = stored.get(file.name)
+            if (info is None or info['mtime'] != stat.st_mtime
+                    or info['size'] != stat.st_size):
+                info = self._read_sheet_info(file)
+                info['mtime'] = stat.st_mtime
+                info['size'] = stat.st_size
+                n_scanned += 1
+            if 'error' in info:
+                print(f"{file.as_posix()} {info['error']}.")
+            sheets[file.name] = info
+        if n_scanned > 0 or sheets.keys() != stored.keys():
+            logger.debug(f'Updating GeoTIFF index ({n_scanned} sheets '
+                         + 'scanned).')
+            self._save_index(sheets)
+
+        rows = [(name, (self.path / name).as_posix(), info['Xmin'],
+                 info['Ymax'], info['Xmax'], info['Ymin'])
+                for name, info in sheets.items() if 'error' not in info]
+        self.ahn_df = (pd.DataFrame(rows, columns=['Filename', 'Path',
+                                                   'Xmin', 'Ymax', 'Xmax',
+                                                   'Ymin'])
+                       .set_index('Filename'))
         if len(self.ahn_df) == 0:
             print(f'No GeoTIFF files found in {self.path.as_posix()}.')
         else:
             self.ahn_df.sort_values(by=['Xmin', 'Ymax'], inplace=True)
+        self._build_grid_hash()
+
+    def _build_grid_hash(self):
+        """
+        Build a grid hash of the sheets for constant-time lookup: each grid
+        cell lists the sheets that intersect it. The cell size is the median
+        sheet size.
+        """
+        self._grid = {}
+        if len(self.ahn_df) == 0:
+            self._cell_size = (1., 1.)
+            return
+        self._cell_size = (
+                float((self.ahn_df['Xmax'] - self.ahn_df['Xmin']).median()),
+                float((self.ahn_df['Ymax'] - self.ahn_df['Ymin']).median()))
+        (cell_w, cell_h) = self._cell_size
+        for i, (x_min, y_max, x_max, y_min) in enumerate(
+                self.ahn_df[['Xmin', 'Ymax', 'Xmax', 'Ymin']].values):
+            for cx in range(math.floor(x_min / cell_w),
+                            math.ceil(x_max / cell_w)):
+                for cy in range(math.floor(y_min / cell_h),
+                                math.ceil(y_max / cell_h)):
+                    self._grid.setdefault((cx, cy), []).append(i)
+
+    def _find_sheet(self, bbox):
+        """
+        Return the first sheet (in DataFrame order) that fully contains the
+        bounding box ((x_min, y_max), (x_max, y_min)), as tuple (path, x_min,
+        y_max), or None if no such sheet exists.
+        """
+        ((bx_min, by_max), (bx_max, by_min)) = bbox
+        (cell_w, cell_h) = self._cell_size
+        # Any sheet containing the bbox intersects the cell of its corner.
+        cell = (math.floor(bx_min / cell_w), math.floor(by_min / cell_h))
+        for i in self._grid.get(cell, []):
+            [path, x_min, y_max, x_max, y_min] = self.ahn_df.iloc[i].values
+            if (x_min <= bx_min and x_max >= bx_max
+                    and y_max >= by_max and y_min <= by_min):
+                return (path, x_min, y_max)
+        return None
 
     def _get_df(self):
         """Return the DataFrame."""
         return self.ahn_df
 
+    def get_tile_sources(self, tilecode):
+        """
+        Returns the signature of the GeoTIFF sheet from which the given
+        tile-code is read.
+        """
+        sheet = self._find_sheet(get_bbox_from_tile_code(tilecode))
+        if sheet is None:
+            return []
+        return [get_file_signature(sheet[0])]
+
+    def __getstate__(self):
+        # Open sheets cannot be pickled, they are re-opened when needed.
+        state = super().__getstate__()
+        state['_sheets'] = {}
+        return state
+
+    # Settings that affect performance but not the results, which are
+    # therefore not part of the configuration.
+    RUNTIME_SETTINGS = ('chunk_cache_bytes', 'decode_workers', 'index_file',
+                        'cache_dir')
+
+    def get_config(self):
+        """Returns a dict describing the configuration of this reader."""
+        config = super().get_config()
+        for key in [key for key in config
+                    if key.startswith('_') or key in self.RUNTIME_SETTINGS]:
+            config.pop(key)
+        return config
+
+    def close(self):
+        """Close all opened GeoTIFF sheets."""
+        with self._lock:
+            for (store, _) in self._sheets.values():
+                store.close()
+            self._sheets = {}
+
+    def _get_sheet(self, path):
+        """
+        Return a zarr array for the GeoTIFF sheet at the given path, backed by
+        a cache of decoded strips or tiles.
+        """
+        if path not in self._sheets:
+            store = imread(path, aszarr=True)
+            chunk_cache = zarr.LRUStoreCache(
+                                store, max_size=self.chunk_cache_bytes)
+            self._sheets[path] = (store, zarr.open(chunk_cache, mode='r'))
+        return self._sheets[path][1]
+
+    def _read_window(self, path, y_start, y_end, x_start, x_end):
+        """
+        Read a window from a GeoTIFF sheet, decoding only the strips or tiles
+        that intersect it.
+        """
+        z_array = self._get_sheet(path)
+        (chunk_h, chunk_w) = z_array.chunks
+        rows = range(y_start // chunk_h, (y_end - 1) // chunk_h + 1)
+        cols = range(x_start // chunk_w, (x_end - 1) // chunk_w + 1)
+        keys = [f'{row}.{col}' for row in rows for col in cols]
+        if len(keys) > 1 and self.decode_workers != 1:
+            # Decode the strips or tiles concurrently (cached ones are not
+            # decoded again). The slice below is then served from the cache.
+            with ThreadPoolExecutor(self.decode_workers) as executor:
+                list(executor.map(lambda key: z_array.store.get(key), keys))
+        return z_array[y_start:y_end, x_start:x_end]
+
+    def _get_cache_file(self, tilecode, fill_value):
+        """
+        Return the file in the cache folder for the processed tile. The
+        subfolder depends on all parameters that affect the processing.
+        """
+        params = {'resolution': self.RESOLUTION,
+                  'fill_value': fill_value,
+                  'fill_gaps': self.fill_gaps,
+                  'max_gap_size': self.max_gap_size,
+                  'fill_method': self.fill_method,
+                  'smoothen': self.smoothen,
+                  'smooth_thickness': self.smooth_thickness}
+        params_hash = get_config_hash(params)[:12]
+        return os.path.join(self.cache_dir, f'geotiff_{params_hash}',
+                            'ahn_' + tilecode + '.npz')
+
+    def _load_cached_tile(self, cache_file, source):
+        """
+        Load a processed tile from the cache folder. Returns None if the tile
+        is not cached, if it was created from a different version of the
+        GeoTIFF sheet, or if the cached file cannot be read.
+        """
+        if not os.path.isfile(cache_file):
+            return None
+        try:
+            with np.load(cache_file) as ahn:
+                cached_source = {key: ahn['source_' + key].item()
+                                 for key in source}
+                if cached_source != source:
+                    logger.debug(f'Cached tile {cache_file} is outdated.')
+                    return None
+                return _read_ahn_tile(ahn)
+        except (OSError, KeyError, ValueError, EOFError,
+                zipfile.BadZipFile) as e:
+            # A corrupt entry is treated as a cache miss, and overwritten.
+            logger.warning(f'Ignoring unreadable cached tile {cache_file}: '
+                           + f'{e}')
+            return None
+
     def _load_tile(self, tilecode, fill_value):
         """Extract one tile from the GeoTIFF data."""
-        ((bx_min, by_max), (bx_max, by_min)) = \
-            get_bbox_from_tile_code(tilecode)
+        bbox = get_bbox_from_tile_code(tilecode)
+        ((bx_min, by_max), (bx_max, by_min)) = bbox
 
         ahn_tile = {}
 
         # We first check if the entire area is within a single TIF tile.
-        query_str = '''(Xmin <= @bx_min) & (Xmax >= @bx_max) \
-                        & (Ymax >= @by_max) & (Ymin <= @by_min)'''
-        target_frame = self.ahn_df.query(query_str)
-        if len(target_frame) == 0:
+        sheet = self._find_sheet(bbox)
+        if sheet is None:
             print(f'No data found for {tilecode}')
             return None
         else:
             # The area is within a single TIF tile, so we can easily return the
             # array.
-            [path, x, y, w, h] = target_frame.iloc[0].values
-            with imread(path, aszarr=True) as store:
-                z_data = np.array(zarr.open(store, mode="r"))
+            (path, x, y) = sheet
+            if self.cache_dir is not None:
+                stat = os.stat(path)
+                source = {'name': os.path.basename(path),
+                          'mtime': stat.st_mtime, 'size': stat.st_size}
+                cache_file = self._get_cache_file(tilecode, fill_value)
+                cached_tile = self._load_cached_tile(cache_file, source)
+                if cached_tile is not None:
+                    return cached_tile
             x_start = int((bx_min - x) / self.RESOLUTION)
             x_end = int((bx_max - x) / self.RESOLUTION)
             y_start = int((y - by_max) / self.RESOLUTION)
             y_end = int((y - by_min) / self.RESOLUTION)
+            with self._lock:
+                z_data = self._read_window(path, y_start, y_end,
+                                           x_start, x_end)
             ahn_tile['x'] = np.arange(bx_min + self.RESOLUTION / 2,
                                       bx_max, self.RESOLUTION)
             ahn_tile['y'] = np.arange(by_max - self.RESOLUTION / 2,
                                       by_min, -self.RESOLUTION)
-            ahn_tile['ground_surface'] = z_data[y_start:y_end, x_start:x_end]
+            ahn_tile['ground_surface'] = z_data
             fill_mask = ahn_tile['ground_surface'] > 1e5
             ahn_tile['ground_surface'][fill_mask] = fill_value
             if self.fill_gaps:
                 fill_gaps(
-                    ahn_tile, max_gap_size=self.max_gap_size, inplace=True)
+                    ahn_tile, max_gap_size=self.max_gap_size,
+                    method=self.fill_method, inplace=True)
             if self.smoothen:
                 smoothen_edges(
                     ahn_tile, thickness=self.smooth_thickness, inplace=True)
+            if self.cache_dir is not None:
+                Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+                # Not quantized, such that cached tiles are identical.
+                save_ahn_tile(cache_file, ahn_tile, quantize=False,
+                              **{'source_' + key: value
+                                 for key, value in source.items()})
             return ahn_tile
 
     def filter_tile(self, tilecode, fill_value=np.nan):
@@ -271,39 +620,313 @@ class GeoTIFFReader(AHNReader):
         and Y coordinate axes.
         """
         if self.caching:
-            if self.cache['tilecode'] != tilecode:
-                self._clear_cache()
-                self.cache['tilecode'] = tilecode
-            if 'ahn_tile' not in self.cache:
-                self.cache['ahn_tile'] = self._load_tile(tilecode, fill_value)
-            return self.cache['ahn_tile']
+            with self._lock:
+                ahn_tile = self.cache.get((tilecode, 'ahn_tile'))
+                if ahn_tile is None:
+                    with trace_utils.span('AHN load', tilecode=tilecode):
+                        ahn_tile = self._load_tile(tilecode, fill_value)
+                    if ahn_tile is not None:
+                        self.cache.put((tilecode, 'ahn_tile'), ahn_tile)
+                return ahn_tile
         else:
-            return self._load_tile(tilecode, fill_value)
+            with trace_utils.span('AHN load', tilecode=tilecode):
+                return self._load_tile(tilecode, fill_value)
+
+
+class MosaicReader(AHNReader):
+    """
+    MosaicReader for AHN data. Instead of one .npz file per tile, the ground
+    and building surfaces of a larger area (e.g. a municipality) are stored in
+    one memory-mapped .npy array per surface, described by a header file
+    mosaic.json. Reading a tile amounts to slicing a window out of these
+    arrays. A mosaic can be created from a folder of .npz files using
+    create_ahn_mosaic().
+
+    Parameters
+    ----------
+    data_folder : str or Path
+        Folder containing the mosaic.
+    caching : bool (default: True)
+        Enable caching of ahn tiles and interpolation data.
+    cache_bytes : int (default: 1GiB)
+        Memory budget of the cache, in bytes.
+    """
+
+    NAME = 'mosaic'
+    HEADER_FILE = 'mosaic.json'
+    VERSION = 1
+    # Size of the CycloMedia tiles, in m.
+    TILE_SIZE = 50
+
+    def __init__(self, data_folder, caching=True,
+                 cache_bytes=AHNReader.CACHE_BYTES):
+        super().__init__(data_folder, caching, cache_bytes)
+        header_file = self.path / self.HEADER_FILE
+        if not header_file.is_file():
+            logger.error(f'No {self.HEADER_FILE} found in {self.path}.')
+            raise ValueError
+        with open(header_file, 'r') as f:
+            header = json.load(f)
+        if header.get('version') != self.VERSION:
+            logger.error(f'Unsupported mosaic version in {header_file}.')
+            raise ValueError
+        self.resolution = header['resolution']
+        self.tile_size = header['tile_size']
+        self.x_min = header['x_min']
+        self.y_max = header['y_max']
+        self.surfaces = header['surfaces']
+        # Memory-mapped arrays, opened when needed.
+        self._arrays = None
+
+    def __getstate__(self):
+        # Memory maps are re-opened when needed.
+        state = super().__getstate__()
+        state['_arrays'] = None
+        return state
+
+    def _get_arrays(self):
+        """Return the memory-mapped coverage and surface arrays."""
+        if self._arrays is None:
+            arrays = {surface: np.load(self.path / file, mmap_mode='r')
+                      for surface, file in self.surfaces.items()}
+            arrays['coverage'] = np.load(self.path / 'coverage.npy')
+            self._arrays = arrays
+        return self._arrays
+
+    def get_tile_sources(self, tilecode):
+        """
+        Returns the signatures of the header and array files of the mosaic.
+        """
+        files = ([self.HEADER_FILE, 'coverage.npy']
+                 + sorted(self.surfaces.values()))
+        return [get_file_signature(self.path / file) for file in files]
+
+    def filter_tile(self, tilecode):
+        """
+        Returns an AHN tile dict for the area represented by the given
+        CycloMedia tile-code.
+        """
+        if self.caching:
+            with self._lock:
+                ahn_tile = self.cache.get((tilecode, 'ahn_tile'))
+                if ahn_tile is None:
+                    ahn_tile = self._load_tile(tilecode)
+                    self.cache.put((tilecode, 'ahn_tile'), ahn_tile)
+                return ahn_tile
+        else:
+            return self._load_tile(tilecode)
+
+    def _load_tile(self, tilecode):
+        """Slice the window for the given tile-code out of the mosaic."""
+        ((bx_min, by_max), _) = get_bbox_from_tile_code(tilecode)
+        col = int(round((bx_min - self.x_min) / self.tile_size))
+        row = int(round((self.y_max - by_max) / self.tile_size))
+        with trace_utils.span('AHN load', tilecode=tilecode):
+            arrays = self._get_arrays()
+            (n_rows, n_cols) = arrays['coverage'].shape
+            if (not (0 <= row < n_rows and 0 <= col < n_cols)
+                    or not arrays['coverage'][row, col]):
+                msg = f'No AHN data in mosaic {self.path} for {tilecode}.'
+                raise AHNFileNotFoundError(msg)
+            n_px = int(round(self.tile_size / self.resolution))
+            window = (slice(row * n_px, (row + 1) * n_px),
+                      slice(col * n_px, (col + 1) * n_px))
+            ahn_tile = {
+                'x': np.arange(n_px) * self.resolution
+                + (bx_min + self.resolution / 2),
+                'y': np.arange(n_px) * -self.resolution
+                + (by_max - self.resolution / 2)}
+            for surface in self.surfaces:
+                ahn_tile[surface] = (arrays[surface][window]
+                                     .astype(np.float32))
+        return ahn_tile
+
+
+def create_ahn_mosaic(npz_folder, out_folder, dtype='float32',
+                      hide_progress=False):
+    """
+    Create an AHN mosaic (see MosaicReader) from a folder of pre-processed
+    ahn_<tilecode>.npz files. The surface arrays are created as sparse files
+    where possible, such that areas without tiles take no disk space.
+
+    Parameters
+    ----------
+    npz_folder : str or Path
+        Folder containing the .npz files.
+    out_folder : str or Path
+        Output folder for the mosaic.
+    dtype : str (default: 'float32')
+        Data type of the surface arrays.
+    hide_progress : bool (default: False)
+        Whether to hide the progress bar.
+
+    Returns
+    -------
+    The number of tiles in the mosaic.
+    """
+    from tqdm import tqdm
+    from ..utils.las_utils import get_tilecode_from_filename
+
+    files = sorted(Path(npz_folder).glob('ahn_*.npz'))
+    if len(files) == 0:
+        logger.error(f'No AHN .npz files found in {npz_folder}.')
+        raise ValueError
+    tilecodes = [get_tilecode_from_filename(file.name) for file in files]
+    tile_x = np.array([int(tilecode.split('_')[0]) for tilecode in tilecodes])
+    tile_y = np.array([int(tilecode.split('_')[1]) for tilecode in tilecodes])
+
+    first_tile = load_ahn_tile(files[0])
+    resolution = float(np.around(first_tile['x'][1] - first_tile['x'][0],
+                                 decimals=6))
+    tile_size = MosaicReader.TILE_SIZE
+    n_px = int(round(tile_size / resolution))
+    surfaces = [surface for surface in ('ground_surface', 'building_surface')
+                if surface in first_tile]
+    n_rows = tile_y.max() - tile_y.min() + 1
+    n_cols = tile_x.max() - tile_x.min() + 1
+
+    out_folder = Path(out_folder)
+    out_folder.mkdir(parents=True, exist_ok=True)
+    arrays = {surface: np.lib.format.open_memmap(
+                        out_folder / f'{surface}.npy', mode='w+', dtype=dtype,
+                        shape=(n_rows * n_px, n_cols * n_px))
+              for surface in surfaces}
+    coverage = np.zeros((n_rows, n_cols), dtype=bool)
+
+    for file, tx, ty in tqdm(zip(files, tile_x, tile_y), total=len(files),
+                             unit='tile', disable=hide_progress):
+        ahn_tile = load_ahn_tile(file)
+        if ahn_tile['ground_surface'].shape != (n_px, n_px):
+            logger.warning(f'Skipping {file.name}, unexpected shape.')
+            continue
+        row = tile_y.max() - ty
+        col = tx - tile_x.min()
+        window = (slice(row * n_px, (row + 1) * n_px),
+                  slice(col * n_px, (col + 1) * n_px))
+        for surface in surfaces:
+            arrays[surface][window] = ahn_tile[surface]
+        coverage[row, col] = True
+
+    for array in arrays.values():
+        array.flush()
+    np.save(out_folder / 'coverage.npy', coverage)
+    header = {'version': MosaicReader.VERSION,
+              'resolution': resolution,
+              'tile_size': tile_size,
+              'x_min': int(tile_x.min()) * tile_size,
+              'y_max': (int(tile_y.max()) + 1) * tile_size,
+              'surfaces': {surface: f'{surface}.npy' for surface in surfaces}}
+    # The header is written last, such that an incomplete mosaic is not used.
+    tmp_file = out_folder / (MosaicReader.HEADER_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(header, f, indent=1)
+    os.replace(tmp_file, out_folder / MosaicReader.HEADER_FILE)
+    return int(coverage.sum())
+
+
+# Quantized storage of AHN surfaces: int16 heights in cm relative to a
+# per-tile offset, with a sentinel value for missing data.
+AHN_SCALE = 0.01
+AHN_NODATA = np.iinfo(np.int16).min
+_SURFACE_KEYS = {'ground_surface': 'ground', 'building_surface': 'building'}
+
+
+def _encode_surface(z_data, scale=AHN_SCALE):
+    """
+    Helper method. Quantize a surface to int16 relative to an offset. Returns
+    a tuple (values, offset), or None if the height range of the surface is
+    too large to be represented.
+    """
+    valid = ~np.isnan(z_data)
+    values = np.full(z_data.shape, AHN_NODATA, dtype=np.int16)
+    if not valid.any():
+        return values, 0.
+    z_min = np.min(z_data[valid])
+    z_max = np.max(z_data[valid])
+    offset = float(np.around((z_min + z_max) / 2, decimals=2))
+    quantized = np.around((z_data[valid] - offset) / scale)
+    if np.abs(quantized).max() > np.iinfo(np.int16).max:
+        return None
+    values[valid] = quantized
+    return values, offset
+
+
+def _decode_surface(values, offset, scale=AHN_SCALE):
+    """Helper method. Decode a quantized surface to float32."""
+    z_data = values * np.float32(scale) + np.float32(offset)
+    z_data[values == AHN_NODATA] = np.nan
+    return z_data
 
 
 def load_ahn_tile(ahn_file):
     """
     Load the ground and building surface grids in a given AHN .npz file and
     return the results as a dict with keys 'x', 'y', 'ground_surface' and
-    'building_surface'.
+    'building_surface'. The building surface is omitted if the file does not
+    contain it. Surfaces are returned as float32, both for quantized files
+    (see save_ahn_tile) and for files with float surfaces.
     """
     if not os.path.isfile(ahn_file):
         msg = f'Tried loading {ahn_file} but file does not exist.'
         raise AHNFileNotFoundError(msg)
 
-    ahn = np.load(ahn_file)
+    with np.load(ahn_file) as ahn:
+        return _read_ahn_tile(ahn)
+
+
+def _read_ahn_tile(ahn):
+    """Read an AHN tile dict from an opened .npz file, see load_ahn_tile."""
     ahn_tile = {'x': ahn['x'],
-                'y': ahn['y'],
-                'ground_surface': ahn['ground'].astype(float),
-                'building_surface': ahn['building'].astype(float)}
+                'y': ahn['y']}
+    for surface, key in _SURFACE_KEYS.items():
+        if key not in ahn:
+            continue
+        # Each access of an .npz key reads the array from the file.
+        values = ahn[key]
+        if values.dtype == np.int16:
+            ahn_tile[surface] = _decode_surface(
+                        values, ahn[key + '_offset'], ahn[key + '_scale'])
+        else:
+            ahn_tile[surface] = values.astype(np.float32)
     return ahn_tile
 
 
-def _get_gap_coordinates(ahn_tile, max_gap_size=50, gap_flag=np.nan):
+def save_ahn_tile(ahn_file, ahn_tile, quantize=True, **kwargs):
     """
-    Helper method. Get the coordinates of gap pixels in the AHN data. The
-    max_gap_size determines the maximum size of gaps (in AHN pixels) that will
-    be considered.
+    Save an AHN tile dict (see load_ahn_tile) to an .npz file. The file is
+    written atomically, such that other processes never read a partial file.
+    Additional arrays can be stored by passing them as keyword arguments.
+
+    By default, surfaces are quantized to int16 heights in cm relative to a
+    per-tile offset, with AHN_NODATA for missing data. Surfaces with a height
+    range that is too large for int16 are stored as float32.
+    """
+    ahn_file = str(ahn_file)
+    arrays = {'x': ahn_tile['x'],
+              'y': ahn_tile['y']}
+    for surface, key in _SURFACE_KEYS.items():
+        if surface not in ahn_tile:
+            continue
+        encoded = _encode_surface(ahn_tile[surface]) if quantize else None
+        if encoded is None:
+            if quantize:
+                logger.warning(f'Height range of {surface} too large, '
+                               + 'stored as float32.')
+            arrays[key] = ahn_tile[surface].astype(np.float32)
+        else:
+            (arrays[key], arrays[key + '_offset']) = encoded
+            arrays[key + '_scale'] = AHN_SCALE
+    tmp_file = f'{ahn_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez_compressed(f, **arrays, **kwargs)
+    os.replace(tmp_file, ahn_file)
+
+
+def _get_gap_ids(ahn_tile, max_gap_size=50, gap_flag=np.nan):
+    """
+    Helper method. Find connected gaps in the AHN data. The max_gap_size
+    determines the maximum size of gaps (in AHN pixels) that will be
+    considered.
 
     Parameters
     ----------
@@ -316,8 +939,10 @@ def _get_gap_coordinates(ahn_tile, max_gap_size=50, gap_flag=np.nan):
 
     Returns
     -------
-    An array of shape (n_pixes, 2) containing the [x, y] coordinates of the gap
-    pixels.
+    A tuple (gap_ids, selected, data_mask): an array with the gap id of each
+    pixel (0 for pixels with data), a boolean array indicating for each gap id
+    whether the gap should be considered, and a boolean mask of the pixels
+    with data.
     """
     # Create a boolean mask for gaps.
     if np.isnan(gap_flag):
@@ -327,26 +952,68 @@ def _get_gap_coordinates(ahn_tile, max_gap_size=50, gap_flag=np.nan):
 
     # Find connected components in the gaps mask and compute their sizes.
     gap_ids, num_gaps = measurements.label(gaps)
-    ids = np.arange(num_gaps + 1)
-    gap_sizes = measurements.sum(gaps, gap_ids, index=ids)
+    gap_sizes = np.bincount(gap_ids.ravel(), minlength=num_gaps + 1)
+    # Label 0 is the 'non-gap' cluster.
+    selected = (gap_sizes <= max_gap_size)
+    selected[0] = False
+    return gap_ids, selected, ~gaps
+
 
-    # Collect all gap coordinates.
-    gap_coords = np.empty(shape=(0, 2), dtype=int)
-    for i in ids:
-        if 0 < gap_sizes[i] <= max_gap_size:
-            # The lower bound 0 is used to ignore the 'non-gap' cluster which
-            # has size 0.
-            gap_coords = np.vstack([gap_coords, np.argwhere(gap_ids == i)])
-    return gap_coords
+def _get_gap_coordinates(ahn_tile, max_gap_size=50, gap_flag=np.nan):
+    """
+    Helper method. Get the coordinates of gap pixels in the AHN data. The
+    max_gap_size determines the maximum size of gaps (in AHN pixels) that will
+    be considered.
 
+    Parameters
+    ----------
+    ahn_tile : dict
+        E.g., output of GeoTIFFReader.filter_tile(.).
+    max_gap_size : int (default: 50)
+        The maximum size (in grid cells) for gaps to be considered.
+    gap_flag : float (default: np.nan)
+        Flag used for missing data.
 
-def fill_gaps(ahn_tile, max_gap_size=50, gap_flag=np.nan, inplace=False):
+    Returns
+    -------
+    An array of shape (n_pixes, 2) containing the [x, y] coordinates of the gap
+    pixels.
+    """
+    gap_ids, selected, _ = _get_gap_ids(ahn_tile, max_gap_size, gap_flag)
+    return np.argwhere(selected[gap_ids])
+
+
+FILL_METHODS = ('cubic', 'linear', 'nearest', 'idw')
+
+
+def _interpolate_window(data_coords, data_values, gap_coords, method):
+    """Helper method. Interpolate the gap pixels in a window."""
+    if method == 'idw':
+        idw = SpatialInterpolator(data_coords, data_values, method='idw')
+        return idw(gap_coords, n_neighbors=min(8, len(data_values)))
+    if method != 'nearest':
+        try:
+            return interpolate.griddata(data_coords, data_values, gap_coords,
+                                        method=method)
+        except QhullError:
+            # Too few or collinear data points for a triangulation.
+            pass
+    return interpolate.griddata(data_coords, data_values, gap_coords,
+                                method='nearest')
+
+
+def fill_gaps(ahn_tile, max_gap_size=50, gap_flag=np.nan, inplace=False,
+              method='cubic', margin=2):
     """
     Fill gaps in the AHN ground surface by interpolation. The max_gap_size
     determines the maximum size of gaps (in AHN pixels) that will be
     considered. A copy of the AHN tile will be returned, unless 'inplace' is
     set to True in which case None will be returned.
 
+    Gaps are interpolated locally: each gap is interpolated using the data in
+    its bounding window plus a margin. The runtime therefore scales with the
+    gap area rather than the tile area.
+
     Parameters
     ----------
     ahn_tile : dict
@@ -357,46 +1024,89 @@ def fill_gaps(ahn_tile, max_gap_size=50, gap_flag=np.nan, inplace=False):
         Flag used for missing data.
     inplace: bool (default: False)
         Whether or not to modify the AHN tile in place.
+    method : str (default: 'cubic')
+        Interpolation method, 'cubic', 'linear' or 'nearest' (see
+        scipy.interpolate.griddata), or 'idw' for inverse distance weighting.
+    margin : int (default: 2)
+        Margin (in AHN pixels) around each gap from which data is used for
+        interpolation.
 
     Returns
     -------
     If inplace=false, a copy of the AHN tile with filled gaps is returned.
     Else, None is returned.
     """
-    # Get the coodinates of gap pizels to consider.
-    gap_coords = _get_gap_coordinates(ahn_tile, max_gap_size=max_gap_size,
-                                      gap_flag=gap_flag)
+    if method not in FILL_METHODS:
+        logger.error(f'Unknown interpolation method: {method}.')
+        raise ValueError
 
-    # Mask the z-data to exclude gaps.
-    if np.isnan(gap_flag):
-        mask = ~np.isnan(ahn_tile['ground_surface'])
-    else:
-        mask = ~(ahn_tile['ground_surface'] == gap_flag)
+    gap_ids, selected, data_mask = _get_gap_ids(
+                    ahn_tile, max_gap_size=max_gap_size, gap_flag=gap_flag)
+    z_data = ahn_tile['ground_surface']
+    filled = z_data if inplace else z_data.copy()
 
-    # Get the interpolation values for the gaps.
-    x = np.arange(0, len(ahn_tile['x']))
-    y = np.arange(0, len(ahn_tile['y']))
-    xx, yy = np.meshgrid(x, y)
-    # TODO: method='cubic' is just a default, we should check what works best
-    # for us.
-    int_values = interpolate.griddata(
-        points=(xx[mask], yy[mask]),
-        values=ahn_tile['ground_surface'][mask].ravel(),
-        xi=(gap_coords[:, 1], gap_coords[:, 0]),
-        method='cubic')
+    (n_rows, n_cols) = z_data.shape
+    gap_slices = find_objects(gap_ids)
+    for i in np.flatnonzero(selected):
+        (rows, cols) = gap_slices[i - 1]
+        window = (slice(max(rows.start - margin, 0),
+                        min(rows.stop + margin, n_rows)),
+                  slice(max(cols.start - margin, 0),
+                        min(cols.stop + margin, n_cols)))
+        offset = np.array([window[0].start, window[1].start])
+        win_gaps = (gap_ids[window] == i)
+        win_data = data_mask[window]
+        if not win_data.any():
+            continue
+        # Coordinates as (row, col), which suffices since the grid is square.
+        gap_coords = np.argwhere(win_gaps)
+        data_coords = np.argwhere(win_data)
+        int_values = _interpolate_window(
+                        data_coords, z_data[window][win_data], gap_coords,
+                        method)
+        gap_coords += offset
+        filled[gap_coords[:, 0], gap_coords[:, 1]] = int_values
 
     # Return the filled AHN tile.
     if not inplace:
-        filled_ahn = copy.deepcopy(ahn_tile)
-        filled_ahn['ground_surface'][gap_coords[:, 0], gap_coords[:, 1]] \
-            = int_values
+        filled_ahn = copy.deepcopy(
+                {key: val for key, val in ahn_tile.items()
+                 if key != 'ground_surface'})
+        filled_ahn['ground_surface'] = filled
         return filled_ahn
     else:
-        ahn_tile['ground_surface'][gap_coords[:, 0], gap_coords[:, 1]] \
-            = int_values
         return None
 
 
+def _nanmean_at(z_data, rows, cols, radius):
+    """
+    Helper method. Compute the mean of the non-NaN values in the square
+    window of the given radius around each of the given pixels, using summed
+    area tables of the values and of the number of valid pixels. Returns NaN
+    for windows without valid pixels.
+    """
+    valid = ~np.isnan(z_data)
+    # Accumulate in float64, also for float32 data.
+    sums = np.pad(np.where(valid, z_data, 0.)
+                  .cumsum(axis=0, dtype=float).cumsum(axis=1),
+                  ((1, 0), (1, 0)))
+    counts = np.pad(valid.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    (n_rows, n_cols) = z_data.shape
+    r_0 = np.clip(rows - radius, 0, n_rows)
+    r_1 = np.clip(rows + radius + 1, 0, n_rows)
+    c_0 = np.clip(cols - radius, 0, n_cols)
+    c_1 = np.clip(cols + radius + 1, 0, n_cols)
+
+    def window_sum(table):
+        return (table[r_1, c_1] - table[r_0, c_1]
+                - table[r_1, c_0] + table[r_0, c_0])
+
+    win_sums = window_sum(sums)
+    win_counts = window_sum(counts)
+    return np.divide(win_sums, win_counts,
+                     out=np.full(len(rows), np.nan), where=win_counts > 0)
+
+
 def smoothen_edges(ahn_tile, thickness=1, gap_flag=np.nan, inplace=False):
     """
     Smoothen the edges of missing AHN ground surface data in the ahn_tile. In
@@ -410,7 +1120,8 @@ def smoothen_edges(ahn_tile, thickness=1, gap_flag=np.nan, inplace=False):
     ahn_tile : dict
         E.g., output of GeoTIFFReader.filter_tile(.).
     thickness : int (default: 1)
-        Thickness of the edge, for now only a value of 1 or 2 makes sense.
+        Thickness of the edge. Edge pixels get the mean of the surrounding
+        (2*thickness+1) x (2*thickness+1) pixels, ignoring NaNs.
     gap_flag : float (default: np.nan)
         Flag used for missing data.
     inplace: bool (default: False)
@@ -432,21 +1143,17 @@ def smoothen_edges(ahn_tile, thickness=1, gap_flag=np.nan, inplace=False):
     # Find the edges of data gaps.
     edges = mask ^ binary_dilation(mask, iterations=thickness)
 
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore", category=RuntimeWarning)
-        # Compute smoothened AHN data by taking the mean of surrounding pixel
-        # values (ignoring NaNs).
-        # TODO: a 'thickness' of more than 2 would require a bigger footprint.
-        smoother = generic_filter(z_data, np.nanmean,
-                                  footprint=np.ones((3, 3), dtype=int),
-                                  mode='constant', cval=np.nan)
+    # Compute smoothened AHN data for the edge pixels by taking the mean of
+    # surrounding pixel values (ignoring NaNs).
+    (rows, cols) = np.nonzero(edges)
+    smoother = _nanmean_at(z_data, rows, cols, radius=thickness)
 
     if inplace:
-        ahn_tile['ground_surface'][edges] = smoother[edges]
+        ahn_tile['ground_surface'][rows, cols] = smoother
         return None
     else:
         smoothened_ahn = copy.deepcopy(ahn_tile)
-        smoothened_ahn['ground_surface'][edges] = smoother[edges]
+        smoothened_ahn['ground_surface'][rows, cols] = smoother
         return smoothened_ahn
 
 
@@ -0,0 +1,124 @@
+"""This module provides a thread-safe LRU cache with a memory budget."""
+
+import numpy as np
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def get_nbytes(value):
+    """
+    Estimate the memory used by a value, counting the data of numpy arrays
+    (also inside dicts, lists and tuples).
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(get_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(get_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with a memory budget. When adding an entry
+    would exceed the budget, the least recently used entries are evicted.
+    Entries larger than the budget are not cached.
+
+    When pickled (e.g. sent to a worker process), the cache is emptied.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The memory budget in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the entry for a key, or default if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        """Add or replace an entry, evicting old entries if needed."""
+        nbytes = get_nbytes(value)
+        with self._lock:
+            self.evict(key)
+            if nbytes > self.max_bytes:
+                logger.debug(f'Entry {key} ({nbytes} bytes) exceeds the '
+                             + 'cache budget, not cached.')
+                return
+            while self.nbytes + nbytes > self.max_bytes:
+                old_key, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+                logger.debug(f'Evicted {old_key} from cache.')
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+    def evict(self, key):
+        """Remove an entry. Returns True if the key was cached."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            _, nbytes = self._entries.pop(key)
+            self.nbytes -= nbytes
+            return True
+
+    def evict_where(self, condition):
+        """
+        Remove all entries for which condition(key) is True. Returns the
+        number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if condition(key)]
+            for key in keys:
+                self.evict(key)
+            return len(keys)
+
+    def keys(self):
+        """Return the cached keys, from least to most recently used."""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get_info(self):
+        """Return a dict with the cache statistics."""
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'nbytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
@@ -37,6 +37,15 @@ This module provides tools for interpolating data.
 """
 
 import numpy as np
+import logging
+import threading
+from numba import njit, prange
+
+logger = logging.getLogger(__name__)
+
+# The default numba threading layer (workqueue) does not allow parallel
+# kernels to be launched concurrently from multiple threads.
+_KERNEL_LOCK = threading.Lock()
 
 
 class SpatialInterpolator:
@@ -96,6 +105,13 @@ class SpatialInterpolator:
         over to brute-force. ``leafsize`` must be positive.  See
         `scipy.spatial.cKDTree` for further information.
 
+    backend : str, optional (ADDED PARAMETER)
+        Which neighbour search to use. Options are 'kdtree' for
+        `scipy.spatial.cKDTree` (default), or 'grid' for a
+        `GridNeighbourIndex`, which is faster for 2D coordinates of near
+        uniform density. The ``leafsize`` and ``eps`` parameters only
+        apply to the 'kdtree' backend.
+
     Notes
     -----
     The IDW interpolator uses a slightly modified version of `Shepard's
@@ -115,7 +131,7 @@ class SpatialInterpolator:
     """
 
     def __init__(self, coordinates, values,
-                 weights=None, leafsize=10, method='idw'):
+                 weights=None, leafsize=10, method='idw', backend='kdtree'):
         from scipy.spatial import cKDTree
 
         coordinates = np.atleast_2d(coordinates)
@@ -149,7 +165,50 @@ class SpatialInterpolator:
         self.values = values
         self.weights = weights
         self.method = method
-        self.kdtree = cKDTree(coordinates, leafsize=leafsize)
+        self.backend = backend
+        if backend == 'kdtree':
+            self.index = cKDTree(coordinates, leafsize=leafsize)
+        elif backend == 'grid':
+            self.index = GridNeighbourIndex(coordinates)
+        else:
+            raise ValueError(f'Unknown backend: {backend}.')
+
+    # Number of positions processed at once.
+    CHUNK_SIZE = 2**18
+
+    def _interpolate_neighbors(self, distances, idx, power, reg, conf_dist,
+                               fill_value):
+        """
+        Compute the interpolated values from the (n_positions, n_neighbors)
+        arrays of neighbour distances and indices returned by the index.
+        Missing neighbours have an infinite distance.
+        """
+        valid = np.isfinite(distances)
+        # Missing neighbours have index ncoords, replace by a valid index.
+        safe_idx = np.where(valid, idx, 0)
+        values = self.values[safe_idx]
+        result = np.full(len(distances), fill_value, dtype=float)
+
+        if self.method == 'idw':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                w = 1.0 / ((distances ** power) + reg)
+                w[~valid] = 0.
+                if self.weights is not None:
+                    w *= self.weights[safe_idx]
+                wtot = np.sum(w, axis=1)
+                interp = np.sum(w * values, axis=1) / wtot
+            has_weight = wtot > 0.0
+            result[has_weight] = interp[has_weight]
+            if conf_dist is not None:
+                # Use the value of a known data point if we are close to it.
+                # Neighbours are sorted by distance, so this is the first.
+                confused = valid[:, 0] & (distances[:, 0] <= conf_dist)
+                result[confused] = values[confused, 0]
+        elif self.method == 'max':
+            has_valid = valid[:, 0]
+            result[has_valid] = np.max(
+                        np.where(valid, values, -np.inf), axis=1)[has_valid]
+        return result
 
     def __call__(self, positions, n_neighbors=8, max_dist=np.inf, eps=0.0,
                  power=1.0, reg=0.0, conf_dist=1e-12, fill_value=np.nan,
@@ -255,9 +314,9 @@ class SpatialInterpolator:
         positions = np.reshape(positions, (-1, self.coords_ndim))
         npositions = positions.shape[0]
 
-        distances, idx = self.kdtree.query(positions, k=n_neighbors,
-                                           distance_upper_bound=max_dist, p=2,
-                                           eps=eps, workers=workers)
+        distances, idx = self.index.query(positions, k=n_neighbors,
+                                          distance_upper_bound=max_dist, p=2,
+                                          eps=eps, workers=workers)
 
         if dtype is None:
             dtype = self.values.dtype
@@ -267,38 +326,15 @@ class SpatialInterpolator:
 
         if n_neighbors == 1:
             valid_idx = np.isfinite(distances)
-            interp_values[valid_idx] = self.values[valid_idx]
+            interp_values[valid_idx] = self.values[idx[valid_idx]]
         else:
-            # TODO: can this loop be optimised / parallelised (should be
-            # possible, computations are independent.)
-            for k in range(npositions):
-                valid_idx = np.isfinite(distances[k])
-                idk = idx[k][valid_idx]
-                dk = distances[k][valid_idx]
-
-                if dk.shape[0] == 0:
-                    interp_values[k] = fill_value
-                    continue
-
-                if self.method == 'idw':
-                    if conf_dist is not None:
-                        # check if we are close to a known data point
-                        confused = (dk <= conf_dist)
-                        if np.any(confused):
-                            interp_values[k] = self.values[idk[confused][0]]
-                            continue
-
-                    w = 1.0 / ((dk ** power) + reg)
-                    if self.weights is not None:
-                        w *= self.weights[idk]
-
-                    wtot = np.sum(w)
-                    if wtot > 0.0:
-                        interp_values[k] = np.dot(w, self.values[idk]) / wtot
-                    else:
-                        interp_values[k] = fill_value
-                elif self.method == 'max':
-                    interp_values[k] = np.max(self.values[idk])
+            # Process the positions in chunks to limit memory use of the
+            # (chunk_size, n_neighbors) arrays.
+            for start in range(0, npositions, self.CHUNK_SIZE):
+                chunk = slice(start, start + self.CHUNK_SIZE)
+                interp_values[chunk] = self._interpolate_neighbors(
+                            distances[chunk], idx[chunk], power, reg,
+                            conf_dist, fill_value)
 
         if len(interp_values) == 1:
             return interp_values[0]
@@ -306,11 +342,85 @@ class SpatialInterpolator:
             return interp_values
 
 
+@njit(cache=True)
+def _grid_cell(pos, bins):
+    """
+    Index of the grid cell containing pos, or -1 if pos is outside the grid.
+    The bin edges are ascending and cell i contains bins[i] <= pos <
+    bins[i+1], as in np.digitize. The far edge of the grid is inclusive.
+    """
+    n = len(bins) - 1
+    if not (pos >= bins[0] and pos <= bins[n]):  # Also catches NaN.
+        return -1
+    # Estimate the cell arithmetically, and correct it against the bin edges
+    # for points on (or within rounding of) a cell boundary.
+    cell = int((pos - bins[0]) / (bins[n] - bins[0]) * n)
+    cell = min(max(cell, 0), n - 1)
+    while cell > 0 and pos < bins[cell]:
+        cell -= 1
+    while cell < n - 1 and pos >= bins[cell + 1]:
+        cell += 1
+    return cell
+
+
+@njit(parallel=True, cache=True)
+def _grid_indices(x, y, bins_x, bins_y):
+    n_x = len(bins_x) - 1
+    indices = np.empty((len(x),), dtype=np.int32)
+    for i in prange(len(x)):
+        col = _grid_cell(x[i], bins_x)
+        row = _grid_cell(y[i], bins_y)
+        if col < 0 or row < 0:
+            indices[i] = -1
+        else:
+            indices[i] = row * n_x + col
+    return indices
+
+
+@njit(parallel=True, cache=True)
+def _grid_bilinear(x, y, bins_x, bins_y, values, fill_value):
+    n_y, n_x = values.shape
+    step_x = (bins_x[n_x] - bins_x[0]) / n_x
+    step_y = (bins_y[n_y] - bins_y[0]) / n_y
+    out = np.empty((len(x),), dtype=np.float64)
+    for i in prange(len(x)):
+        if _grid_cell(x[i], bins_x) < 0 or _grid_cell(y[i], bins_y) < 0:
+            out[i] = fill_value
+            continue
+        # Continuous position relative to the cell centres, clamped such
+        # that points in the outer half cells use the border values.
+        fx = min(max((x[i] - bins_x[0]) / step_x - 0.5, 0.), n_x - 1.)
+        fy = min(max((y[i] - bins_y[0]) / step_y - 0.5, 0.), n_y - 1.)
+        col = min(int(fx), max(n_x - 2, 0))
+        row = min(int(fy), max(n_y - 2, 0))
+        wx = fx - col
+        wy = fy - row
+        # Weighted mean of the (non-NaN) surrounding cell values.
+        total = 0.
+        weight = 0.
+        for d_row in range(min(2, n_y - row)):
+            w_row = wy if d_row == 1 else 1. - wy
+            for d_col in range(min(2, n_x - col)):
+                w = w_row * (wx if d_col == 1 else 1. - wx)
+                value = values[row + d_row, col + d_col]
+                if w > 0. and not np.isnan(value):
+                    total += w * value
+                    weight += w
+        out[i] = total / weight if weight > 0. else fill_value
+    return out
+
+
 class FastGridInterpolator:
     """
-    Class to perform fast interpolation using gridded data. The interpolator
-    simply returns the values of the grid cells in which the queried points
-    fall. Grid coordinates are assumed to be the centroids of each grid cell.
+    Class to perform fast interpolation using gridded data. By default, the
+    interpolator simply returns the values of the grid cells in which the
+    queried points fall. Grid coordinates are assumed to be the centroids of
+    each grid cell, and the grid is assumed to be regular.
+
+    Grid cells are found arithmetically from the grid origin and step size,
+    in a parallel numba kernel, and checked against the bin edges such that
+    they match np.digitize. Points outside the grid get the fill_value;
+    points exactly on the outer edge of the grid are considered inside.
 
     Parameters
     ----------
@@ -322,14 +432,36 @@ class FastGridInterpolator:
 
     values : array of shape (Ny, Nx)
         The values of the gridded data.
+
+    method : str (default: 'nearest')
+        Either 'nearest' to return the value of the grid cell, or 'bilinear'
+        to interpolate bilinearly between the four surrounding grid cells.
+        NaN cells are ignored in bilinear interpolation.
+
+    fill_value : float (default: np.nan)
+        The value returned for points outside the grid.
     """
 
-    def __init__(self, grid_x, grid_y, values):
+    METHODS = ('nearest', 'bilinear')
+
+    def __init__(self, grid_x, grid_y, values, method='nearest',
+                 fill_value=np.nan):
+        if method not in self.METHODS:
+            logger.error(f'Unknown interpolation method: {method}.')
+            raise ValueError
         step_x = grid_x[1] - grid_x[0]
         step_y = grid_y[0] - grid_y[1]
-        self.bin_x = grid_x - (step_x/2)
-        self.bin_y = grid_y + (step_y/2)
+        grid_x = np.asarray(grid_x, dtype=float)
+        grid_y = np.asarray(grid_y, dtype=float)
+        # Bin edges of the grid cells, as used by np.digitize. Along the
+        # y-axis the grid descends; the kernels take the negated (ascending)
+        # edges and coordinates.
+        self.bin_x = np.append(grid_x - step_x/2, grid_x[-1] + step_x/2)
+        self.bin_y = np.append(grid_y + step_y/2, grid_y[-1] - step_y/2)
+        self.shape = (len(grid_y), len(grid_x))
         self.values = values
+        self.method = method
+        self.fill_value = fill_value
 
     def __call__(self, positions):
         """
@@ -341,6 +473,355 @@ class FastGridInterpolator:
             Array of points to query. The first column contains the x-values,
             the second column contains the y-values.
         """
-        x_idx = np.digitize(positions[:, 0], self.bin_x) - 1
-        y_idx = np.digitize(positions[:, 1], self.bin_y, right=True) - 1
-        return self.values[y_idx, x_idx]
+        if self.method == 'bilinear':
+            with _KERNEL_LOCK:
+                return _grid_bilinear(
+                        np.ascontiguousarray(positions[:, 0], dtype=float),
+                        -np.ascontiguousarray(positions[:, 1], dtype=float),
+                        self.bin_x, -self.bin_y,
+                        np.asarray(self.values, dtype=float),
+                        self.fill_value)
+        indices = self.get_indices(positions)
+        values = np.asarray(self.values).ravel()[indices]
+        outside = indices < 0
+        if outside.any():
+            values = values.astype(np.result_type(values, self.fill_value))
+            values[outside] = self.fill_value
+        return values
+
+    def get_indices(self, positions):
+        """
+        Returns the flat index of the grid cell of each position, such that
+        the result of the interpolator equals values.ravel()[indices]. This
+        allows multiple surfaces on the same grid to be queried using a single
+        index lookup. Points outside the grid get index -1.
+
+        Parameters
+        ----------
+        positions : array of shape (Np, 2)
+            Array of points to query. The first column contains the x-values,
+            the second column contains the y-values.
+
+        Returns
+        -------
+        An array of shape (Np,) with dtype=int32.
+        """
+        with _KERNEL_LOCK:
+            return _grid_indices(
+                        np.ascontiguousarray(positions[:, 0], dtype=float),
+                        -np.ascontiguousarray(positions[:, 1], dtype=float),
+                        self.bin_x, -self.bin_y)
+
+
+@njit(cache=True)
+def _splat_range(pos, max_dist, centre, step, n):
+    """Range [start, stop) of grid cells with a centre within max_dist."""
+    start = max(int(np.ceil((pos - max_dist - centre) / step)), 0)
+    stop = min(int(np.floor((pos + max_dist - centre) / step)) + 1, n)
+    return start, stop
+
+
+@njit(cache=True)
+def _splat_idw(x, y, z, x_centre, y_centre, step_x, step_y, max_dist, power,
+               conf_dist, numerator, denominator, confused):
+    n_y, n_x = numerator.shape
+    max_dist_sq = max_dist * max_dist
+    conf_dist_sq = conf_dist * conf_dist
+    for i in range(len(x)):
+        col_start, col_stop = _splat_range(x[i], max_dist, x_centre, step_x,
+                                           n_x)
+        # The grid descends along the y-axis, so rows are found from -y.
+        row_start, row_stop = _splat_range(-y[i], max_dist, -y_centre, step_y,
+                                           n_y)
+        for row in range(row_start, row_stop):
+            d_y = y_centre - row * step_y - y[i]
+            for col in range(col_start, col_stop):
+                d_x = x_centre + col * step_x - x[i]
+                d_sq = d_x * d_x + d_y * d_y
+                if d_sq > max_dist_sq:
+                    continue
+                if d_sq <= conf_dist_sq:
+                    if np.isnan(confused[row, col]):
+                        confused[row, col] = z[i]
+                    continue
+                w = 1. / d_sq ** (power / 2)
+                numerator[row, col] += w * z[i]
+                denominator[row, col] += w
+
+
+@njit(cache=True)
+def _splat_max(x, y, z, x_centre, y_centre, step_x, step_y, max_dist,
+               maximum):
+    n_y, n_x = maximum.shape
+    max_dist_sq = max_dist * max_dist
+    for i in range(len(x)):
+        col_start, col_stop = _splat_range(x[i], max_dist, x_centre, step_x,
+                                           n_x)
+        row_start, row_stop = _splat_range(-y[i], max_dist, -y_centre, step_y,
+                                           n_y)
+        for row in range(row_start, row_stop):
+            d_y = y_centre - row * step_y - y[i]
+            for col in range(col_start, col_stop):
+                d_x = x_centre + col * step_x - x[i]
+                if (d_x * d_x + d_y * d_y <= max_dist_sq
+                        and z[i] > maximum[row, col]):
+                    maximum[row, col] = z[i]
+
+
+class GridRasterizer:
+    """
+    Class to rasterize a point cloud onto a regular grid without a k-d tree.
+    Each point is scattered to all grid cells whose centre lies within
+    max_dist, where it contributes to the IDW numerator and denominator, or to
+    the running maximum, of that cell. Points can be added in chunks, such that
+    point clouds of any size can be rasterized with bounded memory.
+
+    In contrast to the SpatialInterpolator, all points within max_dist are
+    used, rather than the n nearest neighbours.
+
+    Parameters
+    ----------
+    grid_x : list or array-like
+        The x-coordinates of the grid cell centres (ascending).
+
+    grid_y : list or array-like
+        The y-coordinates of the grid cell centres (descending).
+
+    method : str (default: 'idw')
+        Either 'idw' for Inverse Distance Weighting, or 'max' for
+        Maximum-based interpolation.
+
+    max_dist : float (default: 1.0)
+        The maximum radius within which points contribute to a grid cell.
+
+    power : float (default: 2.0)
+        The power of the inverse distance used for the IDW weights.
+
+    conf_dist : float (default: 1e-12)
+        The confusion distance below which a grid cell takes the value of the
+        (first added) point instead of the interpolated value.
+    """
+
+    METHODS = ('idw', 'max')
+
+    def __init__(self, grid_x, grid_y, method='idw', max_dist=1., power=2.,
+                 conf_dist=1e-12):
+        if method not in self.METHODS:
+            logger.error(f'Unknown interpolation method: {method}.')
+            raise ValueError
+        self.step_x = float(grid_x[1] - grid_x[0])
+        self.step_y = float(grid_y[0] - grid_y[1])
+        self.x_centre = float(grid_x[0])
+        self.y_centre = float(grid_y[0])
+        self.shape = (len(grid_y), len(grid_x))
+        self.method = method
+        self.max_dist = float(max_dist)
+        self.power = float(power)
+        self.conf_dist = float(conf_dist)
+        if method == 'idw':
+            self.numerator = np.zeros(self.shape, dtype=float)
+            self.denominator = np.zeros(self.shape, dtype=float)
+            self.confused = np.full(self.shape, np.nan, dtype=float)
+        else:
+            self.maximum = np.full(self.shape, -np.inf, dtype=float)
+
+    def add_points(self, points, values):
+        """
+        Add a chunk of points to the grid.
+
+        Parameters
+        ----------
+        points : array of shape (Np, 2)
+            The x and y-coordinates of the points.
+
+        values : array of shape (Np,)
+            The values of the points.
+        """
+        x = np.ascontiguousarray(points[:, 0], dtype=float)
+        y = np.ascontiguousarray(points[:, 1], dtype=float)
+        z = np.ascontiguousarray(values, dtype=float)
+        if self.method == 'idw':
+            _splat_idw(x, y, z, self.x_centre, self.y_centre, self.step_x,
+                       self.step_y, self.max_dist, self.power, self.conf_dist,
+                       self.numerator, self.denominator, self.confused)
+        else:
+            _splat_max(x, y, z, self.x_centre, self.y_centre, self.step_x,
+                       self.step_y, self.max_dist, self.maximum)
+
+    def get_surface(self, fill_value=np.nan):
+        """
+        Return the rasterized surface as array of shape (Ny, Nx). Grid cells
+        without points within max_dist get the fill_value.
+        """
+        surface = np.full(self.shape, fill_value, dtype=float)
+        if self.method == 'idw':
+            has_weight = self.denominator > 0.
+            surface[has_weight] = (self.numerator[has_weight]
+                                   / self.denominator[has_weight])
+            confused = ~np.isnan(self.confused)
+            surface[confused] = self.confused[confused]
+        else:
+            has_value = np.isfinite(self.maximum)
+            surface[has_value] = self.maximum[has_value]
+        return surface
+
+
+@njit(cache=True)
+def _counting_sort(cells, n_cells):
+    """
+    Sort the point indices by grid cell. Returns the sorted indices and the
+    offsets, such that cell c holds order[offsets[c]:offsets[c+1]].
+    """
+    offsets = np.zeros(n_cells + 1, dtype=np.int64)
+    for i in range(len(cells)):
+        offsets[cells[i] + 1] += 1
+    for c in range(n_cells):
+        offsets[c + 1] += offsets[c]
+    fill = offsets[:-1].copy()
+    order = np.empty(len(cells), dtype=np.int64)
+    for i in range(len(cells)):
+        order[fill[cells[i]]] = i
+        fill[cells[i]] += 1
+    return order, offsets
+
+
+@njit(cache=True)
+def _visit_cell(qx, qy, cell, x, y, order, offsets, max_dist, d_row, i_row):
+    """Insert the points in a grid cell into the sorted k nearest."""
+    k = len(d_row)
+    for j in range(offsets[cell], offsets[cell + 1]):
+        d = np.sqrt((x[j] - qx)**2 + (y[j] - qy)**2)
+        if d >= max_dist or d >= d_row[k - 1]:
+            continue
+        m = k - 1
+        while m > 0 and d_row[m - 1] > d:
+            d_row[m] = d_row[m - 1]
+            i_row[m] = i_row[m - 1]
+            m -= 1
+        d_row[m] = d
+        i_row[m] = order[j]
+
+
+@njit(parallel=True, cache=True)
+def _grid_knn(qx, qy, x, y, order, offsets, x_min, y_min, cell_size, n_x,
+              n_y, k, max_dist):
+    distances = np.full((len(qx), k), np.inf)
+    idx = np.full((len(qx), k), len(x), dtype=np.int64)
+    for i in prange(len(qx)):
+        d_row = distances[i]
+        i_row = idx[i]
+        if not (np.isfinite(qx[i]) and np.isfinite(qy[i])):
+            continue
+        cx = int(np.floor((qx[i] - x_min) / cell_size))
+        cy = int(np.floor((qy[i] - y_min) / cell_size))
+        # Rings closer than this lie entirely outside the grid.
+        r = max(0, -cx, cx - n_x + 1, -cy, cy - n_y + 1)
+        while True:
+            # Visit the cells at Chebyshev distance r from the query cell.
+            for gy in range(max(cy - r, 0), min(cy + r, n_y - 1) + 1):
+                if abs(gy - cy) == r:
+                    for gx in range(max(cx - r, 0), min(cx + r, n_x - 1) + 1):
+                        _visit_cell(qx[i], qy[i], gy * n_x + gx, x, y, order,
+                                    offsets, max_dist, d_row, i_row)
+                else:
+                    if cx - r >= 0 and cx - r < n_x:
+                        _visit_cell(qx[i], qy[i], gy * n_x + cx - r, x, y,
+                                    order, offsets, max_dist, d_row, i_row)
+                    if cx + r >= 0 and cx + r < n_x:
+                        _visit_cell(qx[i], qy[i], gy * n_x + cx + r, x, y,
+                                    order, offsets, max_dist, d_row, i_row)
+            # Points in the next ring are at least r * cell_size away.
+            bound = r * cell_size
+            if bound >= max_dist or d_row[k - 1] <= bound:
+                break
+            if (cx - r <= 0 and cy - r <= 0
+                    and cx + r >= n_x - 1 and cy + r >= n_y - 1):
+                break
+            r += 1
+    return distances, idx
+
+
+class GridNeighbourIndex:
+    """
+    Nearest neighbour search on a uniform grid (cell list) of 2D points, as
+    an alternative to scipy's cKDTree for points of near uniform density such
+    as AHN point clouds. The points are bucketed with a counting sort, and
+    queries visit the grid cells in rings around the query point in a
+    parallel numba kernel.
+
+    Parameters
+    ----------
+    coordinates : array of shape (Np, 2)
+        Coordinates of the points.
+
+    cell_size : float, optional
+        Size of the grid cells. By default, the cell size is chosen such that
+        a cell holds POINTS_PER_CELL points on average.
+    """
+
+    POINTS_PER_CELL = 2
+
+    def __init__(self, coordinates, cell_size=None):
+        coordinates = np.asarray(coordinates, dtype=float)
+        if coordinates.ndim != 2 or coordinates.shape[1] != 2:
+            logger.error('The grid index only supports 2D coordinates.')
+            raise ValueError
+        self.n = len(coordinates)
+        self.x_min, self.y_min = coordinates.min(axis=0)
+        x_range, y_range = coordinates.max(axis=0) - (self.x_min, self.y_min)
+        if cell_size is None:
+            # Area per cell, with a lower bound for (nearly) collinear points.
+            area = max(x_range * y_range,
+                       max(x_range, y_range)**2 / self.n)
+            cell_size = np.sqrt(area * self.POINTS_PER_CELL / self.n)
+            if cell_size <= 0.:
+                cell_size = 1.
+        self.cell_size = float(cell_size)
+        self.n_x = int(x_range // self.cell_size) + 1
+        self.n_y = int(y_range // self.cell_size) + 1
+
+        cols = np.minimum((coordinates[:, 0] - self.x_min) // self.cell_size,
+                          self.n_x - 1).astype(np.int64)
+        rows = np.minimum((coordinates[:, 1] - self.y_min) // self.cell_size,
+                          self.n_y - 1).astype(np.int64)
+        self.order, self.offsets = _counting_sort(rows * self.n_x + cols,
+                                                  self.n_x * self.n_y)
+        # Keep the points sorted by cell for memory locality.
+        self.x = np.ascontiguousarray(coordinates[self.order, 0])
+        self.y = np.ascontiguousarray(coordinates[self.order, 1])
+
+    def query(self, positions, k=1, distance_upper_bound=np.inf, **kwargs):
+        """
+        Query the k nearest neighbours of the given positions, within
+        distance_upper_bound. The output follows scipy's cKDTree.query with
+        k given as int: missing neighbours have an infinite distance and
+        index Np. Other keyword arguments of cKDTree.query (such as eps, p,
+        and workers) are accepted for compatibility, but ignored.
+
+        Parameters
+        ----------
+        positions : array of shape (Nq, 2)
+            The query positions.
+
+        k : int (default: 1)
+            The number of nearest neighbours.
+
+        distance_upper_bound : float (default: np.inf)
+            Only return neighbours strictly within this distance.
+
+        Returns
+        -------
+        Tuple (distances, indices), arrays of shape (Nq, k), or (Nq,) if k is
+        1, sorted by distance.
+        """
+        positions = np.reshape(positions, (-1, 2))
+        with _KERNEL_LOCK:
+            distances, idx = _grid_knn(
+                        np.ascontiguousarray(positions[:, 0], dtype=float),
+                        np.ascontiguousarray(positions[:, 1], dtype=float),
+                        self.x, self.y, self.order, self.offsets,
+                        self.x_min, self.y_min, self.cell_size, self.n_x,
+                        self.n_y, int(k), float(distance_upper_bound))
+        if k == 1:
+            return distances[:, 0], idx[:, 0]
+        return distances, idx
@@ -1,11 +1,19 @@
 import numpy as np
+import copy
 import glob
+import logging
 import pathlib
 import re
 import os
 import laspy
 
 from ..utils.labels import Labels
+from ..utils.manifest_utils import get_file_checksum
+
+logger = logging.getLogger(__name__)
+
+# Extension of label sidecar files, see save_label_sidecar.
+LABEL_SIDECAR_EXT = '.labels.npz'
 
 
 def get_tilecode_from_filename(filename):
@@ -102,10 +110,18 @@ def get_bbox_from_las_folder(folder_path, padding=0):
 
 def get_stats(labels):
     """Returns a string describing statistics based on labels."""
-    N = len(labels)
     labels, counts = np.unique(labels, return_counts=True)
+    return get_stats_from_counts(dict(zip(labels, counts)))
+
+
+def get_stats_from_counts(label_counts):
+    """
+    Returns a string describing statistics based on a dict with the number of
+    points for each label.
+    """
+    N = sum(label_counts.values())
     stats = f'Total: {N:25} points\n'
-    for label, cnt in zip(labels, counts):
+    for label, cnt in sorted(label_counts.items()):
         name = Labels.get_str(label)
         perc = (float(cnt) / N) * 100
         stats += f'Class {label:2}, {name:14} ' +\
@@ -126,3 +142,153 @@ def label_and_save_las(las, labels, outfile):
                           description="Labels"))
     las.label = labels
     las.write(outfile)
+
+
+def get_label_header(header):
+    """
+    Return a copy of a las header that includes the extra dimension used to
+    store labels.
+    """
+    header = copy.deepcopy(header)
+    if 'label' not in header.point_format.extra_dimension_names:
+        header.add_extra_dim(laspy.ExtraBytesParams(name="label",
+                                                    type="uint16",
+                                                    description="Labels"))
+    return header
+
+
+def label_points(points, labels, header):
+    """
+    Label a chunk of las points using the provided class labels. The points
+    are converted to the point format of the given header (see
+    get_label_header) if needed.
+
+    Parameters
+    ----------
+    points : laspy ScaleAwarePointRecord
+        The chunk of points, e.g. as read by LasReader.chunk_iterator().
+    labels : array of shape (n_points,)
+        The labels for each point.
+    header : laspy LasHeader
+        The header of the output file.
+
+    Returns
+    -------
+    A laspy ScaleAwarePointRecord with the labels added.
+    """
+    assert len(labels) == len(points)
+    if 'label' not in points.point_format.extra_dimension_names:
+        array = np.zeros(len(points), dtype=header.point_format.dtype())
+        for name in points.array.dtype.names:
+            array[name] = points.array[name]
+        points = laspy.ScaleAwarePointRecord(array, header.point_format,
+                                             header.scales, header.offsets)
+    points.label = labels
+    return points
+
+
+def get_label_sidecar_file(las_file):
+    """
+    Return the name of the label sidecar file for a given LAS file, e.g.
+    processed_2386_9702.laz -> processed_2386_9702.labels.npz.
+    """
+    las_file = str(las_file)
+    if las_file.endswith(LABEL_SIDECAR_EXT):
+        return las_file
+    return os.path.splitext(las_file)[0] + LABEL_SIDECAR_EXT
+
+
+def save_label_sidecar(sidecar_file, labels, source_file):
+    """
+    Save labels as a compact sidecar file instead of rewriting the full point
+    cloud. The labels are stored in point order as a compressed uint16 array,
+    together with the number of points and the checksum of the source file
+    they belong to. The file is written atomically.
+
+    Parameters
+    ----------
+    sidecar_file : str or Path
+        The output file, should end with LABEL_SIDECAR_EXT.
+    labels : array of shape (n_points,)
+        The label for each point.
+    source_file : str or Path
+        The LAS file the labels belong to.
+    """
+    sidecar_file = str(sidecar_file)
+    tmp_file = sidecar_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez_compressed(f, labels=np.asarray(labels, dtype='uint16'),
+                            point_count=len(labels),
+                            checksum=get_file_checksum(source_file))
+    os.replace(tmp_file, sidecar_file)
+
+
+def load_label_sidecar(sidecar_file, source_file=None):
+    """
+    Load labels from a sidecar file (see save_label_sidecar). If a source file
+    is given, it is verified that the labels belong to that file.
+
+    Parameters
+    ----------
+    sidecar_file : str or Path
+        The sidecar file.
+    source_file : str or Path (default: None)
+        Optional, the LAS file the labels should belong to.
+
+    Returns
+    -------
+    An array of shape (n_points,) with dtype=uint16.
+    """
+    with np.load(sidecar_file) as data:
+        labels = data['labels']
+        point_count = int(data['point_count'])
+        checksum = str(data['checksum'])
+    if len(labels) != point_count:
+        logger.error(f'Sidecar {sidecar_file} is corrupt.')
+        raise ValueError
+    if source_file is not None:
+        if get_file_checksum(source_file) != checksum:
+            logger.error(f'Sidecar {sidecar_file} does not belong to '
+                         + f'{source_file}: checksums do not match.')
+            raise ValueError
+        with laspy.open(source_file) as reader:
+            if reader.header.point_count != point_count:
+                logger.error(f'Sidecar {sidecar_file} has {point_count} '
+                             + f'labels, but {source_file} has '
+                             + f'{reader.header.point_count} points.')
+                raise ValueError
+    return labels
+
+
+def merge_label_sidecar(las_file, sidecar_file, out_file,
+                        chunk_size=10000000):
+    """
+    Produce a labelled LAS file from a point cloud and its label sidecar
+    file. The point cloud is streamed in chunks, so memory use is bounded.
+
+    Parameters
+    ----------
+    las_file : str or Path
+        The (unlabelled) source point cloud.
+    sidecar_file : str or Path
+        The label sidecar file belonging to las_file.
+    out_file : str or Path
+        The output file. Should differ from las_file.
+    chunk_size : int (default: 10000000)
+        The number of points per chunk.
+    """
+    if os.path.abspath(las_file) == os.path.abspath(out_file):
+        logger.error('The output file should differ from the input file.')
+        raise ValueError
+    labels = load_label_sidecar(sidecar_file, las_file)
+    do_compress = str(out_file).lower().endswith('.laz')
+    offset = 0
+    with laspy.open(las_file) as reader:
+        header = get_label_header(reader.header)
+        with laspy.open(out_file, mode='w', header=header,
+                        do_compress=do_compress) as writer:
+            for chunk in reader.chunk_iterator(chunk_size):
+                writer.write_points(
+                    label_points(chunk, labels[offset:offset + len(chunk)],
+                                 header))
+                offset += len(chunk)
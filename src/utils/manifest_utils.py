@@ -0,0 +1,183 @@
+"""
+This module provides a run manifest to keep track of processed tiles, such
+that interrupted runs can be resumed without re-processing tiles that are
+already up to date.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+_SIMPLE_TYPES = (type(None), bool, int, float, str)
+
+
+def _is_simple(value):
+    """Check whether a value can be used in a configuration description."""
+    if isinstance(value, _SIMPLE_TYPES):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_simple(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_simple(v)
+                   for k, v in value.items())
+    return False
+
+
+def get_simple_attributes(obj, exclude=()):
+    """
+    Return a dict with all attributes of the given object that have simple
+    values (None, bool, int, float, str, or lists / dicts thereof). Objects
+    such as arrays, DataFrames, and readers are ignored.
+    """
+    config = {'class': type(obj).__name__}
+    for key, value in vars(obj).items():
+        if key not in exclude and _is_simple(value):
+            config[key] = value
+    return config
+
+
+def get_config_hash(config):
+    """Return a hash of a configuration dict."""
+    config_str = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(config_str.encode('utf-8')).hexdigest()
+
+
+def get_file_signature(file):
+    """
+    Return a dict with the path, size and modification time of a file, such
+    that input data files can be included in a configuration description.
+    """
+    stat = os.stat(file)
+    return {'file': os.path.abspath(file), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def get_file_checksum(file, block_size=2**20):
+    """Return the sha1 checksum of a file."""
+    sha1 = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class RunManifest:
+    """
+    SQLite-backed manifest of processed tiles. Each input file is recorded
+    together with its size and modification time (and optionally a checksum),
+    a hash of the processing configuration, and the processing status. A tile
+    is up to date if it was processed successfully with the same
+    configuration, the input has not changed, and the output still exists.
+
+    Parameters
+    ----------
+    db_file : str or Path
+        The SQLite database file. Will be created if it does not exist.
+    use_checksum : bool (default: False)
+        Whether to compare input files by content (sha1 checksum) in addition
+        to size and modification time.
+    """
+
+    STATUS_STARTED = 'started'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, db_file, use_checksum=False):
+        self.db_file = str(db_file)
+        self.use_checksum = use_checksum
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS tiles (
+                                in_file TEXT PRIMARY KEY,
+                                size INTEGER,
+                                mtime_ns INTEGER,
+                                checksum TEXT,
+                                config_hash TEXT,
+                                out_file TEXT,
+                                status TEXT,
+                                n_points INTEGER,
+                                duration REAL,
+                                updated REAL)''')
+        self.conn.commit()
+
+    def _get_signature(self, file):
+        """Return (size, mtime_ns, checksum) for a file."""
+        stat = os.stat(file)
+        checksum = get_file_checksum(file) if self.use_checksum else None
+        return stat.st_size, stat.st_mtime_ns, checksum
+
+    def is_done(self, in_file, config_hash, out_file):
+        """
+        Check whether the given input file has already been processed with
+        the same configuration, and the output is still available.
+        """
+        row = self.conn.execute(
+                    '''SELECT size, mtime_ns, checksum, config_hash, out_file,
+                              status
+                       FROM tiles WHERE in_file = ?''',
+                    (os.path.abspath(in_file),)).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns, checksum, row_hash, row_out, status = row
+        if (status != self.STATUS_DONE or row_hash != config_hash
+                or row_out != os.path.abspath(out_file)
+                or not os.path.isfile(out_file)):
+            return False
+        stat = os.stat(in_file)
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return False
+        if self.use_checksum and get_file_checksum(in_file) != checksum:
+            return False
+        return True
+
+    def _update(self, in_file, config_hash, out_file, status, signature,
+                n_points=None, duration=None):
+        self.conn.execute(
+                    '''INSERT OR REPLACE INTO tiles VALUES
+                       (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (os.path.abspath(in_file), *signature, config_hash,
+                     os.path.abspath(out_file), status, n_points, duration,
+                     time.time()))
+        self.conn.commit()
+
+    def mark_started(self, in_file, config_hash, out_file):
+        """Record that processing of the given file has started."""
+        self._update(in_file, config_hash, out_file, self.STATUS_STARTED,
+                     self._get_signature(in_file))
+
+    def mark_done(self, in_file, config_hash, out_file, n_points=None,
+                  duration=None):
+        """Record that the given file was processed successfully."""
+        row = self.conn.execute(
+                    'SELECT size, mtime_ns, checksum FROM tiles '
+                    + 'WHERE in_file = ? AND status = ?',
+                    (os.path.abspath(in_file), self.STATUS_STARTED)
+                    ).fetchone()
+        if row is None or os.path.abspath(in_file) == os.path.abspath(
+                                                                out_file):
+            # When the input is overwritten by the output, the signature of
+            # the processed file is stored so that it is recognised as up to
+            # date in the next run.
+            signature = self._get_signature(in_file)
+        else:
+            # Use the signature of the input as it was when processing
+            # started, so that changes made in the meantime are detected.
+            signature = row
+        self._update(in_file, config_hash, out_file, self.STATUS_DONE,
+                     signature, n_points, duration)
+
+    def mark_failed(self, in_file, config_hash, out_file):
+        """Record that processing of the given file has failed."""
+        self._update(in_file, config_hash, out_file, self.STATUS_FAILED,
+                     self._get_signature(in_file))
+
+    def get_status_counts(self):
+        """Return a dict with the number of tiles for each status."""
+        rows = self.conn.execute(
+                    'SELECT status, COUNT(*) FROM tiles GROUP BY status')
+        return dict(rows.fetchall())
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
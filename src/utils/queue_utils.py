@@ -0,0 +1,295 @@
+"""
+This module provides a SQLite-backed job queue to distribute the processing
+of tiles over any number of worker processes, possibly on multiple hosts that
+share a file system. No external broker is needed.
+
+Workers claim jobs atomically, send heartbeats while processing, and record
+the timing of each tile. Jobs of workers that stopped sending heartbeats are
+reclaimed by other workers.
+
+Example
+-------
+job_queue = TileJobQueue('/mnt/shared/jobs.sqlite')
+job_queue.add_jobs([(in_file, out_file), ...])
+run_worker(job_queue, process_fn)
+print(job_queue.get_stats())
+
+NOTE: SQLite relies on file locking. Most NFS setups support this, but make
+sure locking is enabled on the shared mount (e.g. no 'nolock' option).
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id():
+    """Return an identifier for this worker process: <hostname>:<pid>."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class TileJobQueue:
+    """
+    SQLite-backed queue of (in_file, out_file) jobs.
+
+    Parameters
+    ----------
+    db_file : str or Path
+        The SQLite database file, e.g. on a shared mount. Will be created if
+        it does not exist.
+    stale_timeout : float (default: 600)
+        Time (in s) without heartbeat after which a running job is considered
+        abandoned and is reclaimed.
+    max_attempts : int (default: 3)
+        Maximum number of times a job is claimed. Abandoned jobs that reached
+        this number are marked as failed.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, db_file, stale_timeout=600, max_attempts=3):
+        self.db_file = str(db_file)
+        self.stale_timeout = stale_timeout
+        self.max_attempts = max_attempts
+        # Transactions are managed explicitly, see claim().
+        self.conn = sqlite3.connect(self.db_file, timeout=60,
+                                    isolation_level=None)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                in_file TEXT PRIMARY KEY,
+                                out_file TEXT,
+                                status TEXT,
+                                worker TEXT,
+                                attempts INTEGER DEFAULT 0,
+                                heartbeat REAL,
+                                started REAL,
+                                finished REAL,
+                                duration REAL,
+                                n_points INTEGER,
+                                error TEXT)''')
+
+    def add_jobs(self, jobs):
+        """
+        Add (in_file, out_file) jobs to the queue. Jobs that are already in
+        the queue (with any status) are ignored, so multiple workers can add
+        the same jobs. Returns the number of jobs added.
+        """
+        before = self.conn.total_changes
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany(
+                    'INSERT OR IGNORE INTO jobs (in_file, out_file, status) '
+                    + 'VALUES (?, ?, ?)',
+                    [(in_file, out_file, self.STATUS_PENDING)
+                     for (in_file, out_file) in jobs])
+        self.conn.execute('COMMIT')
+        return self.conn.total_changes - before
+
+    def _reclaim_stale(self, now):
+        """Return abandoned jobs to the queue, or fail them."""
+        stale = now - self.stale_timeout
+        self.conn.execute(
+                    'UPDATE jobs SET status = ?, worker = NULL, error = ? '
+                    + 'WHERE status = ? AND heartbeat < ? AND attempts >= ?',
+                    (self.STATUS_FAILED, 'abandoned', self.STATUS_RUNNING,
+                     stale, self.max_attempts))
+        cursor = self.conn.execute(
+                    'UPDATE jobs SET status = ?, worker = NULL '
+                    + 'WHERE status = ? AND heartbeat < ?',
+                    (self.STATUS_PENDING, self.STATUS_RUNNING, stale))
+        if cursor.rowcount > 0:
+            logger.warning(f'Reclaimed {cursor.rowcount} stale jobs.')
+
+    def claim(self, worker_id):
+        """
+        Atomically claim the next pending job. Returns a tuple (in_file,
+        out_file), or None if no jobs are left.
+        """
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock, so that no two workers can
+        # claim the same job.
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._reclaim_stale(now)
+            row = self.conn.execute(
+                        'SELECT in_file, out_file FROM jobs WHERE status = ? '
+                        + 'ORDER BY rowid LIMIT 1',
+                        (self.STATUS_PENDING,)).fetchone()
+            if row is not None:
+                self.conn.execute(
+                        'UPDATE jobs SET status = ?, worker = ?, '
+                        + 'attempts = attempts + 1, heartbeat = ?, '
+                        + 'started = ?, error = NULL WHERE in_file = ?',
+                        (self.STATUS_RUNNING, worker_id, now, now, row[0]))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def heartbeat(self, worker_id):
+        """Update the heartbeat of all running jobs of a worker."""
+        self.conn.execute('UPDATE jobs SET heartbeat = ? '
+                          + 'WHERE status = ? AND worker = ?',
+                          (time.time(), self.STATUS_RUNNING, worker_id))
+
+    def mark_done(self, in_file, worker_id, n_points=None):
+        """Record that a job was processed successfully."""
+        now = time.time()
+        self.conn.execute(
+                    'UPDATE jobs SET status = ?, finished = ?, '
+                    + 'duration = ? - started, n_points = ? '
+                    + 'WHERE in_file = ? AND worker = ?',
+                    (self.STATUS_DONE, now, now, n_points, in_file,
+                     worker_id))
+
+    def mark_failed(self, in_file, worker_id, error=None):
+        """Record that processing of a job has failed."""
+        self.conn.execute(
+                    'UPDATE jobs SET status = ?, finished = ?, error = ? '
+                    + 'WHERE in_file = ? AND worker = ?',
+                    (self.STATUS_FAILED, time.time(), error, in_file,
+                     worker_id))
+
+    def reset_failed(self):
+        """Return all failed jobs to the queue. Returns the number of jobs."""
+        cursor = self.conn.execute(
+                    'UPDATE jobs SET status = ?, worker = NULL, attempts = 0 '
+                    + 'WHERE status = ?',
+                    (self.STATUS_PENDING, self.STATUS_FAILED))
+        return cursor.rowcount
+
+    def get_status_counts(self):
+        """Return a dict with the number of jobs for each status."""
+        rows = self.conn.execute(
+                    'SELECT status, COUNT(*) FROM jobs GROUP BY status')
+        return dict(rows.fetchall())
+
+    def get_stats(self):
+        """
+        Return a dict with statistics of the queue: the number of jobs per
+        status, and the aggregate throughput and per-worker statistics of the
+        finished jobs.
+        """
+        stats = {'status': self.get_status_counts()}
+        (n_done, n_points, total_duration, first_start,
+         last_finish) = self.conn.execute(
+                    'SELECT COUNT(*), SUM(n_points), SUM(duration), '
+                    + 'MIN(started), MAX(finished) FROM jobs WHERE status = ?',
+                    (self.STATUS_DONE,)).fetchone()
+        wall_time = ((last_finish - first_start) if n_done > 0 else 0.)
+        stats['n_done'] = n_done
+        stats['n_points'] = n_points or 0
+        stats['wall_time'] = wall_time
+        stats['mean_duration'] = (total_duration / n_done
+                                  if n_done > 0 else None)
+        stats['tiles_per_hour'] = (n_done / wall_time * 3600
+                                   if wall_time > 0 else None)
+        stats['points_per_second'] = (stats['n_points'] / wall_time
+                                      if wall_time > 0 else None)
+        rows = self.conn.execute(
+                    'SELECT worker, COUNT(*), SUM(duration), SUM(n_points) '
+                    + 'FROM jobs WHERE status = ? GROUP BY worker',
+                    (self.STATUS_DONE,)).fetchall()
+        stats['workers'] = {worker: {'n_done': cnt, 'duration': dur,
+                                     'n_points': pts or 0}
+                            for (worker, cnt, dur, pts) in rows}
+        return stats
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+
+def run_worker(job_queue, process_fn, worker_id=None, heartbeat_interval=30,
+               max_jobs=None, poll_interval=None):
+    """
+    Claim and process jobs from a TileJobQueue until no jobs are pending or
+    running. A background thread sends heartbeats while jobs are being
+    processed. Failed jobs are recorded in the queue and do not stop the
+    worker. When no jobs are pending but other workers are still running
+    jobs, the worker polls the queue, such that the jobs of workers that
+    stopped sending heartbeats are reclaimed and processed.
+
+    Parameters
+    ----------
+    job_queue : TileJobQueue
+        The queue.
+    process_fn : function
+        Function called as process_fn(in_file, out_file) for each job. May
+        return a dict with the number of points as 'n_points'.
+    worker_id : str (default: None)
+        Identifier of this worker, defaults to <hostname>:<pid>.
+    heartbeat_interval : float (default: 30)
+        Time (in s) between heartbeats, should be well below the
+        stale_timeout of the queue.
+    max_jobs : int (default: None)
+        Optional, the maximum number of jobs to process.
+    poll_interval : float (default: None)
+        Time (in s) between claims while the remaining jobs are running on
+        other workers. Defaults to the heartbeat_interval.
+
+    Returns
+    -------
+    A list with the return value of process_fn for each successful job.
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    if poll_interval is None:
+        poll_interval = heartbeat_interval
+    stop = threading.Event()
+
+    def _heartbeat():
+        # SQLite connections cannot be shared between threads.
+        beat_queue = TileJobQueue(job_queue.db_file)
+        try:
+            while not stop.wait(heartbeat_interval):
+                beat_queue.heartbeat(worker_id)
+        finally:
+            beat_queue.close()
+
+    heartbeat = threading.Thread(target=_heartbeat, daemon=True)
+    heartbeat.start()
+    results = []
+    n_jobs = 0
+    try:
+        while max_jobs is None or n_jobs < max_jobs:
+            job = job_queue.claim(worker_id)
+            if job is None:
+                n_running = job_queue.get_status_counts().get(
+                                        TileJobQueue.STATUS_RUNNING, 0)
+                if n_running == 0:
+                    break
+                # Jobs of other workers may still be reclaimed if these
+                # workers stop sending heartbeats.
+                logger.debug(f'Worker {worker_id} waiting for {n_running} '
+                             + 'running jobs.')
+                time.sleep(poll_interval)
+                continue
+            in_file, out_file = job
+            n_jobs += 1
+            logger.info(f'Worker {worker_id} claimed {in_file}.')
+            try:
+                result = process_fn(in_file, out_file)
+            except Exception as e:
+                logger.error(f'Processing {in_file} failed: {e}')
+                job_queue.mark_failed(in_file, worker_id, repr(e))
+                continue
+            if result is None:
+                job_queue.mark_failed(in_file, worker_id)
+                continue
+            n_points = (result.get('n_points')
+                        if isinstance(result, dict) else None)
+            job_queue.mark_done(in_file, worker_id, n_points)
+            results.append(result)
+    finally:
+        stop.set()
+        heartbeat.join()
+    logger.info(f'Worker {worker_id} finished, {len(results)} jobs done.')
+    return results
@@ -0,0 +1,118 @@
+"""
+This module provides a shared-memory container for point cloud tiles, such
+that multiple processes can work on the same tile without copying or
+pickling the point arrays.
+
+Example
+-------
+with SharedTile.from_arrays(points, labels) as tile:
+    # The tile can be passed to other processes, which attach to the same
+    # shared memory block.
+    pool.submit(worker_fn, tile)
+    labels = pipeline.process_cloud(tilecode, tile)
+"""
+
+import numpy as np
+import logging
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+logger = logging.getLogger(__name__)
+
+
+def _attach(name, n_points):
+    """Attach to an existing SharedTile, used when unpickling."""
+    return SharedTile(n_points, name=name)
+
+
+class SharedTile:
+    """
+    Container for the points, labels and mask of a point cloud tile, backed
+    by a single `multiprocessing.shared_memory` block. When a SharedTile is
+    pickled (e.g. passed to a worker process) only the name of the block is
+    sent; the receiving process attaches to the same memory, so changes to
+    labels and mask are visible to all processes.
+
+    The process that creates the tile owns the shared memory, and should call
+    unlink() (or use the tile as context manager) when it is no longer
+    needed. The points, labels and mask arrays are views on the shared
+    memory, and should not be used after the tile is closed.
+
+    Parameters
+    ----------
+    n_points : int
+        The number of points.
+    name : str (default: None)
+        Name of an existing block to attach to. If None, a new block is
+        created.
+    """
+
+    def __init__(self, n_points, name=None):
+        self.n_points = n_points
+        # Layout: points (float64, n x 3), labels (uint16), mask (bool).
+        size = max(27 * n_points, 1)
+        if name is None:
+            self.shm = SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = SharedMemory(name=name)
+            self.owner = False
+            # Only the owner should unlink the block, so the attaching
+            # process should not track it (otherwise the block is removed
+            # when this process exits).
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        buf = self.shm.buf
+        self.points = np.ndarray((n_points, 3), dtype='float64', buffer=buf)
+        self.labels = np.ndarray((n_points,), dtype='uint16', buffer=buf,
+                                 offset=24 * n_points)
+        self.mask = np.ndarray((n_points,), dtype=bool, buffer=buf,
+                               offset=26 * n_points)
+
+    @classmethod
+    def from_arrays(cls, points, labels=None, mask=None):
+        """
+        Create a SharedTile and copy the given arrays into it. By default,
+        labels are zero and the mask is True for all points.
+        """
+        tile = cls(len(points))
+        tile.points[:] = points
+        tile.labels[:] = 0 if labels is None else labels
+        tile.mask[:] = True if mask is None else mask
+        return tile
+
+    @property
+    def name(self):
+        """The name of the shared memory block."""
+        return self.shm.name
+
+    def __len__(self):
+        return self.n_points
+
+    def __reduce__(self):
+        return (_attach, (self.name, self.n_points))
+
+    def close(self):
+        """Detach from the shared memory block."""
+        # Views on the buffer must be released before it can be closed.
+        self.points = self.labels = self.mask = None
+        self.shm.close()
+
+    def unlink(self):
+        """Close and free the shared memory block (owner only)."""
+        self.close()
+        if self.owner:
+            # Processes that share the resource tracker of the owner may have
+            # unregistered the block when attaching, see __init__.
+            resource_tracker.register(self.shm._name, 'shared_memory')
+            self.shm.unlink()
+        else:
+            logger.warning('Only the owner of a SharedTile can unlink it.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
@@ -0,0 +1,224 @@
+"""
+This module provides in-process tracing of (nested) spans, e.g. tile ->
+processor -> internal phase. The recorded spans can be exported as a Chrome
+trace (which can be opened in chrome://tracing or https://ui.perfetto.dev) and
+summarised per span name in a CSV file.
+
+Tracing is disabled by default, in which case spans have negligible overhead.
+
+Example
+-------
+trace_utils.start_tracing()
+pipeline.process_folder(...)
+trace_utils.export_chrome_trace('trace.json')
+trace_utils.export_summary_csv('trace_summary.csv')
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from ..utils.csv_utils import write_csv
+
+
+class Tracer:
+    """
+    Records spans in memory. Each span has a name, a start time, a duration,
+    and optional arguments such as point counts. Spans are nested per thread.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Context manager that records a span. The yielded dict contains the
+        span arguments and can be used to add arguments (e.g. the number of
+        labelled points) while the span is open.
+        """
+        if not self.enabled:
+            yield args
+            return
+        stack = self._get_stack()
+        parent = '/'.join(stack)
+        stack.append(name)
+        ts = time.time()
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            event = {'name': name,
+                     'cat': parent,
+                     'ph': 'X',
+                     'ts': ts * 1e6,
+                     'dur': duration * 1e6,
+                     'pid': os.getpid(),
+                     'tid': threading.get_ident(),
+                     'args': args}
+            with self._lock:
+                self.events.append(event)
+
+    def get_stack(self):
+        """Return the names of the spans that are open in this thread."""
+        return list(self._get_stack())
+
+    @contextmanager
+    def nested_in(self, stack):
+        """
+        Context manager that nests spans recorded in this thread under the
+        given span stack, e.g. of the thread that submitted the work.
+        """
+        local_stack = self._get_stack()
+        saved = list(local_stack)
+        local_stack[:] = stack
+        try:
+            yield
+        finally:
+            local_stack[:] = saved
+
+    def add_events(self, events):
+        """Add events recorded elsewhere, e.g. in a worker process."""
+        with self._lock:
+            self.events.extend(events)
+
+    def pop_events(self):
+        """Return all recorded events and clear the buffer."""
+        with self._lock:
+            events = self.events
+            self.events = []
+        return events
+
+
+_tracer = Tracer()
+
+
+def _to_json(value):
+    """Convert (numpy) values that are not JSON serialisable."""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def get_tracer():
+    """Return the global Tracer."""
+    return _tracer
+
+
+def start_tracing(clear=True):
+    """Enable tracing, optionally clearing previously recorded spans."""
+    if clear:
+        _tracer.pop_events()
+    _tracer.enabled = True
+
+
+def stop_tracing():
+    """Disable tracing. Recorded spans are kept."""
+    _tracer.enabled = False
+
+
+def is_tracing():
+    """Returns whether tracing is enabled."""
+    return _tracer.enabled
+
+
+def span(name, **args):
+    """Record a span using the global Tracer, see Tracer.span."""
+    return _tracer.span(name, **args)
+
+
+def get_stack():
+    """Return the names of the spans that are open in this thread."""
+    return _tracer.get_stack()
+
+
+def nested_in(stack):
+    """Nest spans in this thread under a span stack, see Tracer.nested_in."""
+    return _tracer.nested_in(stack)
+
+
+def get_events():
+    """Return a copy of the events recorded by the global Tracer."""
+    with _tracer._lock:
+        return list(_tracer.events)
+
+
+def add_events(events):
+    """Add events to the global Tracer, e.g. from a worker process."""
+    _tracer.add_events(events)
+
+
+def pop_events():
+    """Return and clear the events recorded by the global Tracer."""
+    return _tracer.pop_events()
+
+
+def export_chrome_trace(trace_file, events=None):
+    """
+    Export spans in the Chrome trace event format, which can be loaded in
+    chrome://tracing or https://ui.perfetto.dev.
+
+    Parameters
+    ----------
+    trace_file : str or Path
+        The output (.json) file.
+    events : list (default: None)
+        The events to export. Defaults to all events of the global Tracer.
+    """
+    if events is None:
+        events = get_events()
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                  default=_to_json)
+
+
+def get_summary(events=None):
+    """
+    Summarise spans per (parent, name). Returns a list of rows [parent, name,
+    count, total_s, mean_s, max_s, n_points], sorted by total duration.
+    """
+    if events is None:
+        events = get_events()
+    summary = {}
+    for event in events:
+        key = (event['cat'], event['name'])
+        if key not in summary:
+            summary[key] = [0, 0., 0., 0]
+        row = summary[key]
+        dur = event['dur'] / 1e6
+        row[0] += 1
+        row[1] += dur
+        row[2] = max(row[2], dur)
+        row[3] += int(event['args'].get('n_points', 0))
+    rows = [[parent, name, cnt, total, total / cnt, max_dur, n_points]
+            for (parent, name), (cnt, total, max_dur, n_points)
+            in summary.items()]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def export_summary_csv(csv_file, events=None):
+    """
+    Export a per-run summary of spans (see get_summary) to a CSV file.
+
+    Parameters
+    ----------
+    csv_file : str or Path
+        The output (.csv) file.
+    events : list (default: None)
+        The events to summarise. Defaults to all events of the global Tracer.
+    """
+    write_csv(csv_file, get_summary(events),
+              ['parent', 'name', 'count', 'total_s', 'mean_s', 'max_s',
+               'n_points'])
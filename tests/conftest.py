@@ -0,0 +1,7 @@
+# Allow importing from the repository root.
+import os
+import sys
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if module_path not in sys.path:
+    sys.path.insert(0, module_path)
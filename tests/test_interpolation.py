@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.utils.interpolation import FastGridInterpolator
+
+
+def _digitize_indices(grid_x, grid_y, positions):
+    """The cell lookup of the previous (np.digitize) FastGridInterpolator."""
+    bin_x = grid_x - (grid_x[1] - grid_x[0]) / 2
+    bin_y = grid_y + (grid_y[0] - grid_y[1]) / 2
+    x_idx = np.digitize(positions[:, 0], bin_x) - 1
+    y_idx = np.digitize(positions[:, 1], bin_y, right=True) - 1
+    return y_idx * len(grid_x) + x_idx
+
+
+def _ahn_grid(x_min=120000, y_max=487550, size=50, resolution=0.1):
+    """Cell centres of an AHN tile, as in process_ahn_las_tile."""
+    grid_y, grid_x = np.mgrid[y_max-resolution/2:y_max-size:-resolution,
+                              x_min+resolution/2:x_min+size:resolution]
+    return grid_x[0, :], grid_y[:, 0]
+
+
+def test_grid_indices_match_digitize_on_bin_edges():
+    grid_x, grid_y = _ahn_grid()
+    values = np.arange(len(grid_y) * len(grid_x)).reshape(len(grid_y), -1)
+    interpolator = FastGridInterpolator(grid_x, grid_y, values)
+
+    # Points exactly on the inner bin edges, and the neighbouring floats.
+    edge_x = (grid_x - (grid_x[1] - grid_x[0]) / 2)[1:]
+    edge_y = (grid_y + (grid_y[0] - grid_y[1]) / 2)[1:]
+    n = min(len(edge_x), len(edge_y))
+    for dx in (-np.inf, 0, np.inf):
+        x = np.nextafter(edge_x[:n], dx) if dx else edge_x[:n]
+        for dy in (-np.inf, 0, np.inf):
+            y = np.nextafter(edge_y[:n], dy) if dy else edge_y[:n]
+            positions = np.column_stack((x, y))
+            np.testing.assert_array_equal(
+                interpolator.get_indices(positions),
+                _digitize_indices(grid_x, grid_y, positions))
+
+
+def test_grid_indices_match_digitize_on_rounded_points():
+    grid_x, grid_y = _ahn_grid()
+    values = np.zeros((len(grid_y), len(grid_x)))
+    interpolator = FastGridInterpolator(grid_x, grid_y, values)
+
+    rng = np.random.default_rng(0)
+    positions = np.round(np.column_stack(
+                    (rng.uniform(grid_x[0], grid_x[-1], 1000000),
+                     rng.uniform(grid_y[-1], grid_y[0], 1000000))), 3)
+    np.testing.assert_array_equal(
+        interpolator.get_indices(positions),
+        _digitize_indices(grid_x, grid_y, positions))
+
+    # A boundary case on which the arithmetic lookup used to differ.
+    position = np.array([[120041.2, 487525.]])
+    assert (interpolator.get_indices(position)
+            == _digitize_indices(grid_x, grid_y, position))
+
+
+def test_grid_indices_outside():
+    grid_x, grid_y = _ahn_grid()
+    values = np.zeros((len(grid_y), len(grid_x)))
+    interpolator = FastGridInterpolator(grid_x, grid_y, values)
+    positions = np.array([[119999.9, 487525.], [120050.1, 487525.],
+                          [120025., 487550.1], [120025., 487499.9],
+                          [np.nan, 487525.]])
+    assert np.all(interpolator.get_indices(positions) == -1)
+    assert np.all(np.isnan(interpolator(positions)))
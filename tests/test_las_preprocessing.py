@@ -0,0 +1,71 @@
+import numpy as np
+import laspy
+import pytest
+
+from src.preprocessing import las_preprocessing
+from src.preprocessing.las_preprocessing import tile_las_files
+
+X0, Y0 = 119300, 485100
+
+
+def _write_las(file, point_format, x, y, classification, number_of_returns):
+    header = laspy.LasHeader(point_format=point_format, version='1.4')
+    header.scales = np.array([0.01, 0.01, 0.01])
+    header.offsets = np.array([X0, Y0, 0])
+    las = laspy.LasData(header)
+    las.x = x
+    las.y = y
+    las.z = np.zeros(len(x))
+    las.classification = classification
+    las.number_of_returns = number_of_returns
+    las.return_number = np.ones(len(x), dtype=int)
+    las.write(file)
+
+
+def _read_tiles(files):
+    points = []
+    for file in files:
+        las = laspy.read(file)
+        points.append(np.column_stack((las.x, las.y, las.classification,
+                                       las.number_of_returns)))
+    return np.concatenate(points)
+
+
+def _sorted_rows(array):
+    return array[np.lexsort(array.T[::-1])]
+
+
+def test_tile_mixed_point_formats(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 2000
+    x_a = np.round(rng.uniform(X0, X0 + 99.99, n), 2)
+    y_a = np.round(rng.uniform(Y0, Y0 + 99.99, n), 2)
+    x_b = np.round(rng.uniform(X0, X0 + 99.99, n), 2)
+    y_b = np.round(rng.uniform(Y0, Y0 + 99.99, n), 2)
+    _write_las(tmp_path / 'a.laz', 6, x_a, y_a,
+               np.full(n, 2), np.full(n, 1))
+    _write_las(tmp_path / 'b.laz', 1, x_b, y_b,
+               np.full(n, 6), np.full(n, 3))
+
+    files = tile_las_files([tmp_path / 'a.laz', tmp_path / 'b.laz'],
+                           tmp_path / 'out', hide_progress=True)
+    assert len(files) == 4
+    for file in files:
+        assert laspy.read(file).header.point_format.id == 6
+
+    expected = np.vstack((
+        np.column_stack((x_a, y_a, np.full(n, 2), np.full(n, 1))),
+        np.column_stack((x_b, y_b, np.full(n, 6), np.full(n, 3)))))
+    np.testing.assert_allclose(_sorted_rows(_read_tiles(files)),
+                               _sorted_rows(expected))
+
+
+def test_convert_points_overflow(tmp_path):
+    # The number of returns of format 6 does not fit the 3 bits of format 1.
+    _write_las(tmp_path / 'a.laz', 6, np.array([X0 + 1.]),
+               np.array([Y0 + 1.]), np.array([2]), np.array([9]))
+    with laspy.open(tmp_path / 'a.laz') as reader:
+        points = reader.read_points(1)
+    header = laspy.LasHeader(point_format=1, version='1.2')
+    with pytest.raises(ValueError):
+        las_preprocessing._convert_points(points, header)
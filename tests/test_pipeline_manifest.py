@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+from src.pipeline import Pipeline
+from src.utils.ahn_utils import NPZReader, MosaicReader, save_ahn_tile
+from src.utils.ahn_utils import create_ahn_mosaic
+
+TILECODE = '2386_9702'
+
+
+def _save_tile(ahn_folder, height):
+    grid_x = np.arange(119300.05, 119350, 0.1)
+    grid_y = np.arange(485149.95, 485100, -0.1)
+    surface = np.full((len(grid_y), len(grid_x)), height, dtype='float32')
+    save_ahn_tile(os.path.join(ahn_folder, f'ahn_{TILECODE}.npz'),
+                  {'x': grid_x, 'y': grid_y, 'ground_surface': surface,
+                   'building_surface': surface})
+
+
+def test_config_hash_includes_npz_tile(tmp_path):
+    _save_tile(tmp_path, 1.)
+    pipeline = Pipeline(ahn_reader=NPZReader(tmp_path), caching=False)
+    config_hash = pipeline.get_config_hash(TILECODE)
+    assert pipeline.get_config_hash(TILECODE) == config_hash
+    # Other tiles are not affected by the .npz file.
+    other_hash = pipeline.get_config_hash('2387_9702')
+
+    _save_tile(tmp_path, 2.)
+    # The regenerated file has the same size; make sure the modification
+    # time differs on file systems with a coarse timestamp resolution.
+    os.utime(tmp_path / f'ahn_{TILECODE}.npz', ns=(0, 0))
+    assert pipeline.get_config_hash(TILECODE) != config_hash
+    assert pipeline.get_config_hash('2387_9702') == other_hash
+
+
+def test_config_hash_includes_mosaic(tmp_path):
+    _save_tile(tmp_path, 1.)
+    create_ahn_mosaic(tmp_path, tmp_path / 'mosaic', hide_progress=True)
+    pipeline = Pipeline(ahn_reader=MosaicReader(tmp_path / 'mosaic'),
+                        caching=False)
+    config_hash = pipeline.get_config_hash(TILECODE)
+
+    _save_tile(tmp_path, 2.)
+    create_ahn_mosaic(tmp_path, tmp_path / 'mosaic', hide_progress=True)
+    os.utime(tmp_path / 'mosaic' / 'ground_surface.npy', ns=(0, 0))
+    assert pipeline.get_config_hash(TILECODE) != config_hash
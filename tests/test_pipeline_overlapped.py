@@ -0,0 +1,41 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.pipeline import Pipeline
+
+
+def test_overlapped_error_stops_threads(tmp_path):
+    pipeline = Pipeline(caching=False)
+    pipeline.IO_QUEUE_SIZE = 1
+    written = []
+
+    def _read_file(in_file, in_labels=None):
+        return None, np.zeros((1, 3)), np.zeros((1,), dtype=int)
+
+    def _process_cloud(tilecode, points, labels):
+        if tilecode == '0003_0000':
+            raise RuntimeError('processing failed')
+        return labels
+
+    def _write_output(pointcloud, labels, in_file, out_file):
+        time.sleep(0.05)
+        written.append(in_file)
+
+    pipeline._read_file = _read_file
+    pipeline.process_cloud = _process_cloud
+    pipeline._write_output = _write_output
+    jobs = [(f'filtered_{i:04d}_0000.laz', f'out_{i:04d}_0000.laz')
+            for i in range(6)]
+
+    threads = set(threading.enumerate())
+    with pytest.raises(RuntimeError):
+        pipeline._process_files_overlapped(jobs, hide_progress=True)
+    # The reader thread stops at its next (timed) put.
+    deadline = time.time() + 5
+    while set(threading.enumerate()) != threads and time.time() < deadline:
+        time.sleep(0.05)
+    assert set(threading.enumerate()) == threads
+    assert all(in_file < 'filtered_0003' for in_file in written)
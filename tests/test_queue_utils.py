@@ -0,0 +1,36 @@
+from src.utils.queue_utils import TileJobQueue, run_worker
+
+
+def test_run_worker_reclaims_job_of_dead_worker(tmp_path):
+    job_queue = TileJobQueue(tmp_path / 'jobs.sqlite', stale_timeout=0.5)
+    job_queue.add_jobs([('a.laz', 'a_out.laz'), ('b.laz', 'b_out.laz')])
+    # A worker that claims a job and dies without sending heartbeats.
+    assert job_queue.claim('dead:1') == ('a.laz', 'a_out.laz')
+
+    processed = []
+
+    def _process(in_file, out_file):
+        processed.append(in_file)
+        return {'n_points': 1}
+
+    results = run_worker(job_queue, _process, worker_id='live:2',
+                         heartbeat_interval=0.1)
+    assert len(results) == 2
+    assert sorted(processed) == ['a.laz', 'b.laz']
+    assert job_queue.get_status_counts() == {TileJobQueue.STATUS_DONE: 2}
+    worker, attempts = job_queue.conn.execute(
+                'SELECT worker, attempts FROM jobs WHERE in_file = ?',
+                ('a.laz',)).fetchone()
+    assert worker == 'live:2'
+    assert attempts == 2
+    job_queue.close()
+
+
+def test_run_worker_stops_when_queue_is_empty(tmp_path):
+    job_queue = TileJobQueue(tmp_path / 'jobs.sqlite')
+    job_queue.add_jobs([('a.laz', 'a_out.laz')])
+    results = run_worker(job_queue, lambda in_file, out_file: {},
+                         heartbeat_interval=0.1)
+    assert results == [{}]
+    assert job_queue.get_status_counts() == {TileJobQueue.STATUS_DONE: 1}
+    job_queue.close()